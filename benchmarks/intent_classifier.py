@@ -0,0 +1,62 @@
+"""
+Benchmark: utterances per second through the intent classifier
+Compares the precompiled single-pass regex with the original sequential
+`any(keyword in text ...)` scans over the same keyword lists.
+
+Usage: python benchmarks/intent_classifier.py [--rounds 20000]
+"""
+import argparse
+import os
+import sys
+import time
+
+# Add parent directory to path for standalone script execution
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from medmitra.intents import INTENT_KEYWORDS, Intent, classify_intent
+
+UTTERANCES = [
+    "Haan, le li",
+    "Nahi, abhi nahi",
+    "Yeh dawa kisliye hai?",
+    "Mujhe tez dard ho raha hai",
+    "Main pareshan hoon",
+    "I don't know which one",
+    "Namaste MedMitra, aaj mausam kaisa hai?",
+    "Okay done, I took the evening tablet with water",
+]
+
+
+def classify_substring(text: str) -> Intent:
+    """The original classifier: one substring scan per intent, in priority order"""
+    text = text.lower().strip()
+    for intent, keywords in INTENT_KEYWORDS.items():
+        if any(keyword in text for keyword in keywords):
+            return intent
+    return Intent.UNKNOWN
+
+
+def utterances_per_second(classify, rounds: int) -> float:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for utterance in UTTERANCES:
+            classify(utterance)
+    return rounds * len(UTTERANCES) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rounds', type=int, default=20000, help='passes over the sample utterances')
+    args = parser.parse_args()
+    
+    print(f"{'utterance':<50} {'substring':>10} {'regex':>10}")
+    for utterance in UTTERANCES:
+        print(f"{utterance:<50} {classify_substring(utterance).value:>10} "
+              f"{classify_intent(utterance).value:>10}")
+    print()
+    for name, classify in (('substring scans', classify_substring), ('precompiled regex', classify_intent)):
+        print(f"{name:<20} {utterances_per_second(classify, args.rounds):>12,.0f} utterances/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,207 @@
+"""
+Benchmark: end-to-end load on the web app and reminder path, in one process
+Loads N patients (two medications each) and connects one patient device per patient
+plus M caregiver dashboards through the Socket.IO test client. It then fires a
+synthetic reminder to every patient through `on_reminder_due` and drives
+/api/user/response at a fixed request rate. Reports p50/p99 latency, events per
+second and memory per patient.
+
+Usage: python benchmarks/load_test.py [--patients 1000] [--dashboards 100] [--rate 200]
+       python benchmarks/load_test.py --ci [--json results.json]
+With --ci the run is small and exits with status 1 when a latency or memory budget is exceeded.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+# Add parent directory to path for standalone script execution
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Keep the run in memory and quiet: no database file, no printed caregiver alerts
+os.environ['MEDMITRA_DB'] = ''
+os.environ.setdefault('MEDMITRA_NOTIFY_TRANSPORT', 'stub')
+
+from medmitra import app as web
+from medmitra.medication import Medication, TimeSlot
+
+UTTERANCES = [
+    "Haan, le li",
+    "Nahi, abhi nahi",
+    "Yeh dawa kisliye hai?",
+    "Main pareshan hoon",
+    "Namaste MedMitra",
+]
+
+# Budgets checked by --ci; generous enough for shared CI machines
+CI_SIZES = {'patients': 200, 'dashboards': 20, 'requests': 400, 'rate': 200.0, 'threads': 4}
+CI_BUDGETS = {'reminder_p99_ms': 25.0, 'response_p99_ms': 50.0, 'bytes_per_patient': 64 * 1024}
+
+
+def percentile(samples: list[float], fraction: float) -> float:
+    """Nearest-rank percentile of unsorted samples"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def load_patients(count: int) -> tuple[list[str], float]:
+    """Create patients with two medications each; returns their IDs and bytes allocated per patient"""
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    patient_ids = []
+    for index in range(count):
+        patient_id = f"load-{index}"
+        manager = web.tenants.get(patient_id).medication_manager
+        manager.user_name = f"Patient {index}"
+        manager.add_medication(Medication("Metformin", "500 mg", TimeSlot.MORNING,
+                                          "Khane ke saath lein", patient_id=patient_id))
+        manager.add_medication(Medication("Amlodipine", "5 mg", TimeSlot.NIGHT,
+                                          "", patient_id=patient_id))
+        patient_ids.append(patient_id)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    allocated = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+    return patient_ids, allocated / max(count, 1)
+
+
+def connect_clients(patient_ids: list[str], dashboards: int) -> list:
+    """One patient device per patient, plus dashboards spread over the first patients"""
+    # Silence the per-connection log lines
+    with contextlib.redirect_stdout(io.StringIO()):
+        return _connect_clients(patient_ids, dashboards)
+
+
+def _connect_clients(patient_ids: list[str], dashboards: int) -> list:
+    clients = [web.socketio.test_client(web.app, query_string=f"patient_id={patient_id}")
+               for patient_id in patient_ids]
+    for index in range(dashboards):
+        patient_id = patient_ids[index % len(patient_ids)]
+        clients.append(web.socketio.test_client(
+            web.app, query_string=f"patient_id={patient_id}&role=caregiver"
+                                  f"&token={web.caregiver_access.token_for(patient_id)}"))
+    for client in clients:
+        client.get_received()
+    return clients
+
+
+def fire_reminders(patient_ids: list[str], clients: list) -> dict:
+    """Deliver one reminder per patient through on_reminder_due"""
+    latencies = []
+    start = time.perf_counter()
+    for patient_id in patient_ids:
+        medication = web.tenants.get(patient_id).medication_manager.medications[0]
+        began = time.perf_counter()
+        web.on_reminder_due(medication)
+        latencies.append(time.perf_counter() - began)
+    elapsed = time.perf_counter() - start
+    delivered = sum(len(client.get_received()) for client in clients)
+    return {
+        'reminders': len(patient_ids),
+        'reminder_p50_ms': percentile(latencies, 0.50) * 1000,
+        'reminder_p99_ms': percentile(latencies, 0.99) * 1000,
+        'reminders_per_s': len(patient_ids) / elapsed,
+        'reminder_events': delivered,
+        'events_per_s': delivered / elapsed,
+    }
+
+
+def drive_responses(patient_ids: list[str], clients: list, requests: int, rate: float,
+                    threads: int) -> dict:
+    """POST /api/user/response at a fixed overall rate from several client threads"""
+    latencies: list[float] = []
+    errors = [0]
+    lock = threading.Lock()
+    start = time.perf_counter() + 0.05
+    
+    def worker(offset: int):
+        client = web.app.test_client()
+        own = []
+        failed = 0
+        for index in range(offset, requests, threads):
+            # Open-loop pacing: request i is due at start + i / rate whatever happened before
+            delay = start + index / rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            patient_id = patient_ids[index % len(patient_ids)]
+            began = time.perf_counter()
+            response = client.post(f"/api/user/response?patient_id={patient_id}",
+                                   json={'text': UTTERANCES[index % len(UTTERANCES)]})
+            own.append(time.perf_counter() - began)
+            failed += response.status_code != 200
+        with lock:
+            latencies.extend(own)
+            errors[0] += failed
+    
+    workers = [threading.Thread(target=worker, args=(offset,)) for offset in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    # Replies go back over HTTP; dashboards get the resulting deltas and alerts
+    delivered = sum(len(client.get_received()) for client in clients)
+    return {
+        'responses': requests,
+        'response_errors': errors[0],
+        'response_p50_ms': percentile(latencies, 0.50) * 1000,
+        'response_p99_ms': percentile(latencies, 0.99) * 1000,
+        'responses_per_s': requests / elapsed,
+        'dashboard_events': delivered,
+    }
+
+
+def check_budgets(results: dict) -> list[str]:
+    """Budget violations for --ci"""
+    failures = [f"{key} = {results[key]:.1f} exceeds {budget}"
+                for key, budget in CI_BUDGETS.items() if results[key] > budget]
+    if results['response_errors']:
+        failures.append(f"{results['response_errors']} responses failed")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--patients', type=int, default=1000, help='patients to load')
+    parser.add_argument('--dashboards', type=int, default=100, help='caregiver dashboards to connect')
+    parser.add_argument('--requests', type=int, default=2000, help='/api/user/response calls to make')
+    parser.add_argument('--rate', type=float, default=200.0, help='target requests per second')
+    parser.add_argument('--threads', type=int, default=8, help='client threads sending requests')
+    parser.add_argument('--ci', action='store_true', help='small run; exit 1 if a budget is exceeded')
+    parser.add_argument('--json', metavar='PATH', help='also write the results as JSON')
+    args = parser.parse_args()
+    if args.ci:
+        for key, value in CI_SIZES.items():
+            setattr(args, key, value)
+    
+    patient_ids, bytes_per_patient = load_patients(args.patients)
+    clients = connect_clients(patient_ids, args.dashboards)
+    results = {'patients': args.patients, 'dashboards': args.dashboards,
+               'bytes_per_patient': bytes_per_patient}
+    results.update(fire_reminders(patient_ids, clients))
+    results.update(drive_responses(patient_ids, clients, args.requests, args.rate, args.threads))
+    with contextlib.redirect_stdout(io.StringIO()):
+        for client in clients:
+            client.disconnect()
+    
+    for key, value in results.items():
+        print(f"{key:<20} {value:>14,.2f}" if isinstance(value, float) else f"{key:<20} {value:>14,}")
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, indent=2)
+    
+    if args.ci:
+        failures = check_budgets(results)
+        for failure in failures:
+            print(f"BUDGET EXCEEDED: {failure}")
+        sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+Benchmark: Socket.IO emit latency with per-patient rooms vs. broadcasting
+Registers N fake connections (one patient device and one caregiver dashboard per
+patient) and times emitting one reminder. Packets are counted, not sent, so the
+numbers isolate MedMitra's fan-out cost from network I/O.
+
+Usage: python benchmarks/socket_rooms.py [--emits 200]
+"""
+import argparse
+import os
+import sys
+import time
+
+# Add parent directory to path for standalone script execution
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import socketio
+
+from medmitra.app import patient_room, caregiver_room
+
+CONNECTION_COUNTS = [100, 1000, 10000]
+PAYLOAD = {
+    'patient_id': 'patient-0',
+    'medication': {'name': 'Metformin', 'dosage': '500 mg', 'time_slot': 'Evening'},
+    'message': 'Namaste. Ab shaam ki dava ka waqt ho gaya hai.'
+}
+
+
+def build_server(connections: int) -> tuple[socketio.Server, list[int]]:
+    """Create a Socket.IO server with fake connections joined to patient/caregiver rooms"""
+    server = socketio.Server()
+    sent = [0]
+    
+    def count_packet(eio_sid, pkt):
+        sent[0] += 1
+    
+    server._send_eio_packet = count_packet
+    for index in range(connections):
+        patient_id = f"patient-{index // 2}"
+        eio_sid = f"eio-{index}"
+        sid = server.manager.connect(eio_sid, '/')
+        room = patient_room(patient_id) if index % 2 == 0 else caregiver_room(patient_id)
+        server.manager.enter_room(sid, '/', room, eio_sid=eio_sid)
+    return server, sent
+
+
+def time_emits(server: socketio.Server, emits: int, room=None) -> float:
+    """Average seconds per emit"""
+    start = time.perf_counter()
+    for _ in range(emits):
+        server.emit('medication_reminder', PAYLOAD, to=room)
+    return (time.perf_counter() - start) / emits
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--emits', type=int, default=200, help='emits to time per configuration')
+    args = parser.parse_args()
+    
+    print(f"{'sockets':>8} {'room emit (us)':>15} {'broadcast (us)':>15} {'packets/room emit':>18}")
+    for connections in CONNECTION_COUNTS:
+        server, sent = build_server(connections)
+        room_latency = time_emits(server, args.emits, room=patient_room('patient-0'))
+        room_packets = sent[0] / args.emits
+        broadcast_latency = time_emits(server, max(args.emits // 10, 1))
+        print(f"{connections:>8} {room_latency * 1e6:>15.1f} {broadcast_latency * 1e6:>15.1f} "
+              f"{room_packets:>18.0f}")
+
+
+if __name__ == '__main__':
+    main()
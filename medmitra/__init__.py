@@ -7,8 +7,10 @@ __author__ = "MedMitra Team"
 
 from .medication import Medication, MedicationManager, TimeSlot
 from .voice_handler import VoiceHandler
+from .intents import Intent, classify_intent
 from .reminder_scheduler import ReminderScheduler
 from .caregiver_notifier import CaregiverNotifier
+from .tenants import TenantRegistry
 from .main import MedMitra
 
 __all__ = [
@@ -16,8 +18,11 @@ __all__ = [
     "MedicationManager",
     "TimeSlot",
     "VoiceHandler",
+    "Intent",
+    "classify_intent",
     "ReminderScheduler",
     "CaregiverNotifier",
+    "TenantRegistry",
     "MedMitra"
 ]
 
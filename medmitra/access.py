@@ -0,0 +1,55 @@
+"""
+Caregiver access for MedMitra
+Dashboards prove which patient they may watch with a token derived from a server secret,
+so knowing a patient ID alone doesn't let a client join that patient's caregiver room
+"""
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+from typing import Optional
+from urllib.parse import urlencode
+
+
+class CaregiverAccess:
+    """
+    Issues and checks per-patient caregiver tokens (an HMAC of the patient ID), and
+    the operator token that guards requests spanning every patient on a worker
+    """
+    
+    def __init__(self, secret: bytes, operator_token: Optional[str] = None):
+        self.secret = secret
+        self.operator_token = operator_token
+    
+    @classmethod
+    def from_environment(cls) -> "CaregiverAccess":
+        """
+        Access keyed by MEDMITRA_CAREGIVER_SECRET
+        Without it, a random secret is used, so tokens only last until the process restarts.
+        MEDMITRA_OPERATOR_TOKEN enables the all-patient endpoints; without it they are refused.
+        """
+        secret = os.environ.get("MEDMITRA_CAREGIVER_SECRET")
+        return cls(secret.encode("utf-8") if secret else secrets.token_bytes(32),
+                   os.environ.get("MEDMITRA_OPERATOR_TOKEN") or None)
+    
+    def token_for(self, patient_id: str) -> str:
+        """Get the token that lets a dashboard watch a patient"""
+        digest = hmac.new(self.secret, patient_id.encode("utf-8"), hashlib.sha256).digest()
+        return base64.urlsafe_b64encode(digest[:24]).decode("ascii")
+    
+    def verify(self, patient_id: str, token: Optional[str]) -> bool:
+        """Check a dashboard's token for a patient"""
+        if not isinstance(token, str) or not token:
+            return False
+        return hmac.compare_digest(self.token_for(patient_id).encode("ascii"), token.encode("utf-8"))
+    
+    def dashboard_path(self, patient_id: str) -> str:
+        """Dashboard URL path (with its token) to hand to a patient's caregiver"""
+        return "/dashboard?" + urlencode({"patient_id": patient_id, "token": self.token_for(patient_id)})
+    
+    def verify_operator(self, token: Optional[str]) -> bool:
+        """Check an operator token (always fails when no operator token is configured)"""
+        if not self.operator_token or not isinstance(token, str) or not token:
+            return False
+        return hmac.compare_digest(self.operator_token.encode("utf-8"), token.encode("utf-8"))
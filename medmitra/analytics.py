@@ -0,0 +1,226 @@
+"""
+Adherence analytics for MedMitra
+Keeps each patient's dose records in NumPy columns and computes adherence rollups
+(per medication, time slot and week), lateness and streaks with vectorized operations
+"""
+import threading
+from datetime import date, timedelta
+from typing import TYPE_CHECKING, Optional
+from .medication import TimeSlot
+
+try:
+    import numpy as np
+except ImportError:  # Analytics are optional; /api/adherence reports them unavailable
+    np = None
+
+if TYPE_CHECKING:
+    from .medication import MedicationManager, MedicationRecord
+
+ANALYTICS_AVAILABLE = np is not None
+
+# Dose status codes stored in the status column
+PENDING, TAKEN, MISSED = 0, 1, 2
+
+EPOCH = date(1970, 1, 1)
+_SLOTS = list(TimeSlot)
+_INITIAL_CAPACITY = 64
+
+
+class AdherenceAnalytics:
+    """
+    Columnar copy of one patient's dose records with cached rollups
+    Records are upserted as they change (observe), so columns stay current without
+    rescanning; rollups are recomputed only when something changed since the last read.
+    Like the record store, the columns only cover the retention window (see compact).
+    """
+    
+    def __init__(self, manager: "MedicationManager"):
+        if np is None:
+            raise RuntimeError("numpy is not installed")
+        self.manager = manager
+        self._lock = threading.Lock()
+        self._names: list[str] = []
+        self._name_index: dict[str, int] = {}
+        # (medication name, scheduled time) -> row
+        self._rows: dict[tuple, int] = {}
+        self._size = 0
+        self._medication = np.zeros(_INITIAL_CAPACITY, dtype=np.int32)
+        self._slot = np.zeros(_INITIAL_CAPACITY, dtype=np.int8)
+        self._day = np.zeros(_INITIAL_CAPACITY, dtype=np.int32)
+        self._status = np.zeros(_INITIAL_CAPACITY, dtype=np.int8)
+        # Minutes between scheduled and taken time (NaN unless taken)
+        self._late = np.full(_INITIAL_CAPACITY, np.nan, dtype=np.float32)
+        self._seeded = False
+        self._cached: Optional[dict] = None
+    
+    def observe(self, record: "MedicationRecord"):
+        """Add a dose record, or update its row after it was taken or missed"""
+        with self._lock:
+            self._upsert(record)
+            self._cached = None
+    
+    def rollup(self) -> dict:
+        """Get the patient's adherence aggregates (cached until a record changes)"""
+        with self._lock:
+            if not self._seeded:
+                # Records restored from storage never went through observe()
+                for record in self.manager.records:
+                    self._upsert(record)
+                self._seeded = True
+            if self._cached is None:
+                self._cached = self._compute()
+            return self._cached
+    
+    def compact(self, before: date) -> int:
+        """
+        Drop the rows of doses scheduled before `before` (records compacted out of memory)
+        Returns the number of rows dropped
+        """
+        with self._lock:
+            size = self._size
+            keep = self._day[:size] >= (before - EPOCH).days
+            kept = int(keep.sum())
+            if kept == size:
+                return 0
+            new_rows = np.cumsum(keep) - 1
+            self._rows = {key: int(new_rows[row]) for key, row in self._rows.items() if keep[row]}
+            self._reallocate(max(_INITIAL_CAPACITY, kept), np.flatnonzero(keep))
+            self._size = kept
+            self._cached = None
+            return size - kept
+    
+    def _upsert(self, record: "MedicationRecord"):
+        name = record.medication.name
+        key = (name, record.scheduled_time)
+        row = self._rows.get(key)
+        if row is None:
+            if self._size == len(self._status):
+                self._grow()
+            row = self._rows[key] = self._size
+            self._size += 1
+            if name not in self._name_index:
+                self._name_index[name] = len(self._names)
+                self._names.append(name)
+            self._medication[row] = self._name_index[name]
+            self._slot[row] = _SLOTS.index(record.medication.time_slot)
+            self._day[row] = (record.scheduled_time.date() - EPOCH).days
+        
+        if record.taken:
+            self._status[row] = TAKEN
+            late = (record.taken_time - record.scheduled_time).total_seconds() / 60 if record.taken_time else 0.0
+            self._late[row] = max(late, 0.0)
+        else:
+            self._status[row] = MISSED if record.missed else PENDING
+            self._late[row] = np.nan
+    
+    def _grow(self):
+        self._reallocate(len(self._status) * 2, slice(None))
+    
+    def _reallocate(self, capacity: int, rows):
+        """Move the selected rows to the front of fresh columns of the given capacity"""
+        for column in ("_medication", "_slot", "_day", "_status", "_late"):
+            old = getattr(self, column)[rows]
+            new = np.full(capacity, np.nan, dtype=old.dtype) if column == "_late" else np.zeros(capacity, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, column, new)
+    
+    def _compute(self) -> dict:
+        size = self._size
+        medication = self._medication[:size]
+        slot = self._slot[:size]
+        day = self._day[:size]
+        status = self._status[:size]
+        late = self._late[:size]
+        taken = status == TAKEN
+        missed = status == MISSED
+        
+        medications = _grouped(medication, taken, missed, len(self._names))
+        mean, median, p90 = _lateness(medication[taken], late[taken], len(self._names))
+        for index, entry in enumerate(medications):
+            entry["medication"] = self._names[index]
+            entry["late_minutes"] = {"mean": mean[index], "median": median[index], "p90": p90[index]}
+        
+        time_slots = _grouped(slot.astype(np.int32), taken, missed, len(_SLOTS))
+        for index, entry in enumerate(time_slots):
+            entry["time_slot"] = _SLOTS[index].value
+        
+        # Weeks start on Monday; 1970-01-01 was a Thursday
+        week_start = day - (day + 3) % 7
+        weeks_present, week_index = np.unique(week_start, return_inverse=True)
+        weeks = _grouped(week_index.astype(np.int32), taken, missed, len(weeks_present))
+        for start, entry in zip(weeks_present.tolist(), weeks):
+            entry["week_start"] = (EPOCH + timedelta(days=start)).isoformat()
+        
+        overall = _counts(int(size), int(taken.sum()), int(missed.sum()))
+        return {
+            "overall": overall,
+            "medications": [entry for entry in medications if entry["scheduled"]],
+            "time_slots": [entry for entry in time_slots if entry["scheduled"]],
+            "weeks": weeks,
+            "streaks": _streaks(day, taken, missed),
+        }
+
+
+def _counts(scheduled: int, taken: int, missed: int) -> dict:
+    """Counts plus adherence: taken doses as a share of those taken or missed"""
+    finished = taken + missed
+    return {
+        "scheduled": scheduled,
+        "taken": taken,
+        "missed": missed,
+        "pending": scheduled - finished,
+        "adherence": round(100.0 * taken / finished, 1) if finished else None,
+    }
+
+
+def _grouped(groups: "np.ndarray", taken: "np.ndarray", missed: "np.ndarray", count: int) -> list[dict]:
+    """Per-group counts and adherence, one bincount per column"""
+    scheduled = np.bincount(groups, minlength=count)
+    taken_counts = np.bincount(groups, weights=taken, minlength=count).astype(np.int64)
+    missed_counts = np.bincount(groups, weights=missed, minlength=count).astype(np.int64)
+    return [_counts(int(s), int(t), int(m))
+            for s, t, m in zip(scheduled.tolist(), taken_counts.tolist(), missed_counts.tolist())]
+
+
+def _lateness(groups: "np.ndarray", late: "np.ndarray", count: int) -> tuple[list, list, list]:
+    """Mean, median and 90th percentile minutes late per group (None for groups with no taken doses)"""
+    counts = np.bincount(groups, minlength=count)
+    totals = np.bincount(groups, weights=late, minlength=count)
+    # Sort by group, then lateness; each group is then a contiguous sorted run
+    order = np.lexsort((late, groups))
+    ordered = late[order]
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    
+    def percentile(fraction: float) -> list:
+        index = starts + np.minimum(counts - 1, (fraction * counts).astype(np.int64))
+        values = ordered[np.clip(index, 0, max(len(ordered) - 1, 0))] if len(ordered) else np.zeros(count)
+        return [round(float(value), 1) if n else None for value, n in zip(values, counts)]
+    
+    mean = [round(float(total / n), 1) if n else None for total, n in zip(totals, counts)]
+    return mean, percentile(0.5), percentile(0.9)
+
+
+def _streaks(day: "np.ndarray", taken: "np.ndarray", missed: "np.ndarray") -> dict:
+    """
+    Runs of consecutive dose days on which every finished dose was taken
+    Days without scheduled doses don't break a streak; days with only pending doses are skipped.
+    """
+    finished = taken | missed
+    if not finished.any():
+        return {"current": 0, "longest": 0}
+    days, index = np.unique(day[finished], return_inverse=True)
+    perfect = np.bincount(index, weights=missed[finished]) == 0
+    edges = np.diff(np.concatenate(([0], perfect.astype(np.int8), [0])))
+    lengths = np.flatnonzero(edges == -1) - np.flatnonzero(edges == 1)
+    return {
+        "current": int(lengths[-1]) if perfect[-1] else 0,
+        "longest": int(lengths.max()) if len(lengths) else 0,
+    }
+
+
+def compare_patients(rollups: dict[str, dict]) -> list[dict]:
+    """Overall adherence per patient, lowest first (who needs a call most)"""
+    rows = [dict(rollup["overall"], patient_id=patient_id,
+                 current_streak=rollup["streaks"]["current"])
+            for patient_id, rollup in rollups.items()]
+    return sorted(rows, key=lambda row: (row["adherence"] is None, row["adherence"] or 0.0))
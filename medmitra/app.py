@@ -2,42 +2,229 @@
 MedMitra Web Application - Flask-based voice assistant
 Provides REST API and WebSocket support for voice interactions
 """
-from flask import Flask, render_template, jsonify, request
+from flask import (Flask, Response, abort, g, redirect, render_template, jsonify, request, send_file,
+                   stream_with_context)
 from flask_cors import CORS
-from flask_socketio import SocketIO, emit
-from datetime import datetime
+from flask_socketio import SocketIO, emit, join_room, leave_room, rooms
+from datetime import datetime, timedelta
+import atexit
+from collections import deque
+from contextlib import nullcontext
 import json
 import os
+import time as time_module
+from typing import Optional
+from urllib.parse import urlsplit
 
-from .medication import Medication, MedicationManager, TimeSlot
-from .voice_handler import VoiceHandler
+from .medication import Medication, TimeSlot, DEFAULT_PATIENT_ID
+from .recurrence import Recurrence, merge_occurrences
 from .reminder_scheduler import ReminderScheduler
-from .caregiver_notifier import CaregiverNotifier
+from .intents import Intent
+from .tenants import Tenant, TenantRegistry, WrongShardError
+from .sessions import ConversationSession, SessionStore
+from .access import CaregiverAccess
+from .storage import SQLiteStore
+from .message_queue import LocalQueueManager
+from .dispatch import NotificationDispatcher
+from .push import PushDispatcher, PushSubscription
+from .tts import TTSService
+from .voice_handler import RESPONSES
+from .metrics import REGISTRY
+from .timezones import to_local
+from .analytics import ANALYTICS_AVAILABLE, compare_patients
+from . import bulk
 
 app = Flask(__name__, 
             template_folder='../templates',
             static_folder='../static')
 CORS(app)
-socketio = SocketIO(app, cors_allowed_origins="*")
+
+
+def socketio_options() -> dict:
+    """
+    Socket.IO server options from the environment (set by run_web.py)
+    MEDMITRA_ASYNC_MODE: eventlet/gevent for the production server, or threading
+        (run_web.py --async-mode threading); unset lets Flask-SocketIO pick
+    MEDMITRA_MESSAGE_QUEUE: local://host:port, redis://... or amqp://... for multi-worker emits
+    """
+    options = {}
+    if os.environ.get('MEDMITRA_ASYNC_MODE'):
+        options['async_mode'] = os.environ['MEDMITRA_ASYNC_MODE']
+    queue_url = os.environ.get('MEDMITRA_MESSAGE_QUEUE')
+    if queue_url and queue_url.startswith('local://'):
+        options['client_manager'] = LocalQueueManager(queue_url)
+    elif queue_url:
+        options['message_queue'] = queue_url
+    return options
+
+
+REQUEST_SECONDS = REGISTRY.histogram("medmitra_http_request_seconds",
+                                     "Flask request latency by route", ("method", "route", "status"))
+EMIT_SECONDS = REGISTRY.histogram("medmitra_socketio_emit_seconds",
+                                  "Time to emit a Socket.IO event to its room", ("event",))
+
+
+class InstrumentedSocketIO(SocketIO):
+    """SocketIO whose server-side emits are timed per event"""
+    
+    def emit(self, event, *args, **kwargs):
+        """Emit as usual, recording how long the fan-out took"""
+        start = time_module.perf_counter()
+        try:
+            return super().emit(event, *args, **kwargs)
+        finally:
+            EMIT_SECONDS.labels(event).observe(time_module.perf_counter() - start)
+
+
+socketio = InstrumentedSocketIO(app, cors_allowed_origins="*", **socketio_options())
+
+
+def on_tenant_created(tenant: Tenant):
+    """Wire up storage and reminders for a patient the first time this worker sees them"""
+    tenant.medication_manager.storage = storage
+    tenant.push_subscriptions.storage = storage
+    tenant.caregiver_notifier.dispatcher = dispatcher
+    tenant.medication_manager.on_change = (
+        lambda kind, item: record_change(tenant, kind, item))
+    if scheduler:
+        scheduler.attach_manager(tenant.medication_manager)
+
 
 # Global instances
-medication_manager = MedicationManager()
-voice_handler = VoiceHandler(medication_manager)
-caregiver_notifier = CaregiverNotifier(medication_manager)
+tenants = TenantRegistry.from_environment(on_create=on_tenant_created)
 scheduler = None
-current_medication = None
+push = None
+storage = None
+dispatcher = NotificationDispatcher.from_environment()
+tts = TTSService.from_environment()
+restored_from_storage = False
+socket_patients: dict[str, str] = {}
+sessions = SessionStore.from_environment()
+caregiver_access = CaregiverAccess.from_environment()
+
+
+REGISTRY.gauge("medmitra_socketio_connected_clients", "Socket.IO clients connected to this worker",
+               callback=lambda: len(socket_patients))
+REGISTRY.gauge("medmitra_conversation_sessions", "Open dialog sessions (sockets and REST clients)",
+               callback=lambda: len(sessions))
+REGISTRY.gauge("medmitra_patients", "Patients loaded on this worker", callback=lambda: len(tenants))
+REGISTRY.gauge("medmitra_records_in_memory", "Detailed dose records held in memory",
+               callback=lambda: sum(len(tenant.medication_manager.records) for tenant in tenants))
+REGISTRY.gauge("medmitra_record_summaries_in_memory", "Compacted daily summaries held in memory",
+               callback=lambda: sum(len(tenant.medication_manager.records.summaries) for tenant in tenants))
+REGISTRY.gauge("medmitra_notification_queue_depth", "Caregiver alerts waiting to be delivered",
+               callback=lambda: dispatcher.pending())
+REGISTRY.gauge("medmitra_push_queue_depth", "Web Push messages waiting to be sent",
+               callback=lambda: push.pending() if push else 0)
+REGISTRY.gauge("medmitra_reminders_armed", "Medications with an upcoming reminder armed",
+               callback=lambda: scheduler.armed_count() if scheduler else 0)
+
+
+@app.before_request
+def start_request_timer():
+    """Note when the request started, for the latency histogram"""
+    g.request_started = time_module.perf_counter()
+
+
+@app.after_request
+def record_request_latency(response):
+    """Record the request's latency under its route pattern (not the raw path)"""
+    started = g.pop('request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        REQUEST_SECONDS.labels(request.method, route, str(response.status_code)).observe(
+            time_module.perf_counter() - started)
+    return response
+
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus scrape endpoint for this worker"""
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+
+def patient_room(patient_id: str) -> str:
+    """Socket.IO room joined by a patient's own devices"""
+    return f"patient:{patient_id}"
+
+
+def caregiver_room(patient_id: str) -> str:
+    """Socket.IO room joined by dashboards watching a patient"""
+    return f"caregiver:{patient_id}"
+
+
+def current_tenant() -> Tenant:
+    """Get the tenant for the patient a REST request is about"""
+    body = request.get_json(silent=True) if request.is_json else None
+    patient_id = (request.args.get('patient_id')
+                  or request.headers.get('X-Patient-ID')
+                  or (body or {}).get('patient_id')
+                  or DEFAULT_PATIENT_ID)
+    return tenants.get(patient_id)
+
+
+def socket_tenant() -> Tenant:
+    """Get the tenant for the patient bound to the current Socket.IO connection"""
+    return tenants.get(socket_patients.get(request.sid, DEFAULT_PATIENT_ID))
+
+
+def current_session(tenant: Tenant) -> ConversationSession:
+    """
+    Get the dialog session of a REST client
+    Clients name their session with an X-Session-ID header or session_id parameter;
+    those that don't share one session per patient.
+    """
+    session_id = request.headers.get('X-Session-ID') or request.args.get('session_id')
+    key = f"rest:{session_id}" if session_id else SessionStore.patient_key(tenant.patient_id)
+    return sessions.get(key, tenant.patient_id)
+
+
+def socket_session(tenant: Tenant) -> ConversationSession:
+    """Get the dialog session of the current Socket.IO connection"""
+    return sessions.get(request.sid, tenant.patient_id)
+
+
+def operator_request() -> bool:
+    """Check the X-Operator-Token header that requests spanning every patient must carry"""
+    return caregiver_access.verify_operator(request.headers.get('X-Operator-Token'))
+
+
+def worker_url(shard: int) -> Optional[str]:
+    """Base URL of the worker serving a shard, on the host the client reached us by"""
+    return tenants.shard_url(shard, urlsplit(request.host_url).hostname or 'localhost')
+
+
+def redirect_to_owner():
+    """Redirect a page load for a patient this worker doesn't serve to the worker that does"""
+    patient_id = request.args.get('patient_id') or DEFAULT_PATIENT_ID
+    if tenants.owns(patient_id):
+        return None
+    url = worker_url(tenants.shard_of(patient_id))
+    return redirect(url + request.full_path, code=307) if url else None
+
+
+@app.errorhandler(WrongShardError)
+def handle_wrong_shard(error):
+    """Tell the caller which worker shard owns the patient, and where to retry"""
+    return jsonify({
+        'success': False,
+        'error': str(error),
+        'patient_id': error.patient_id,
+        'shard': error.shard,
+        'worker_url': worker_url(error.shard)
+    }), 421
 
 
 @app.route('/')
 def index():
     """Serve the main application page (Patient App)"""
-    return render_template('index.html')
+    return redirect_to_owner() or render_template('index.html')
 
 
 @app.route('/dashboard')
 def dashboard():
     """Serve the caregiver dashboard"""
-    return render_template('dashboard.html')
+    return redirect_to_owner() or render_template('dashboard.html')
 
 
 @app.route('/static/sw.js')
@@ -46,24 +233,52 @@ def service_worker():
     return app.send_static_file('sw.js'), 200, {'Content-Type': 'application/javascript'}
 
 
+def audio_url(text: str):
+    """URL of pre-rendered audio for text, or None (client falls back to browser speech)"""
+    if tts is None:
+        return None
+    audio_id = tts.lookup(text)
+    return f"/api/tts/{audio_id}" if audio_id else None
+
+
+def prerender_audio(tenant: Tenant):
+    """Render a patient's reminders and medication explanations to audio ahead of their slots"""
+    if tts is None:
+        return
+    voice_handler = tenant.voice_handler
+    tts.prerender(text for medication in tenant.medication_manager.medications
+                  for text in (voice_handler.generate_reminder(medication),
+                               voice_handler.handle_medication_question(medication)))
+
+
+@app.route('/api/tts/<audio_id>')
+def get_tts_audio(audio_id):
+    """Serve cached reminder audio (supports Range requests and ETag revalidation)"""
+    path = tts.cache.path(audio_id) if tts else None
+    if path is None:
+        abort(404)
+    # Content-addressed, so the file behind a URL never changes
+    return send_file(path, mimetype=tts.engine.mimetype, conditional=True,
+                     etag=audio_id.split('.')[0], max_age=365 * 24 * 3600)
+
+
 @app.route('/api/medications', methods=['GET'])
 def get_medications():
     """Get list of all medications"""
-    medications = []
-    for med in medication_manager.medications:
-        medications.append({
-            'name': med.name,
-            'dosage': med.dosage,
-            'time_slot': med.time_slot.value,
-            'doctor_instructions': med.doctor_instructions,
-            'user_name': med.user_name
-        })
-    return jsonify({'medications': medications})
+    tenant = current_tenant()
+    seq = tenant.changes.seq
+    medications = [serialize_medication(med) for med in tenant.medication_manager.medications]
+    return jsonify({'medications': medications, 'seq': seq})
 
 
 @app.route('/api/medications', methods=['POST'])
 def add_medication():
-    """Add a new medication"""
+    """
+    Add a new medication
+    An optional 'recurrence' rule (e.g. "FREQ=HOURLY;INTERVAL=8") replaces the fixed
+    time slot schedule; the slot then defaults to the one the first dose falls in.
+    """
+    tenant = current_tenant()
     data = request.json
     try:
         time_slot_map = {
@@ -72,49 +287,136 @@ def add_medication():
             'Evening': TimeSlot.EVENING,
             'Night': TimeSlot.NIGHT
         }
+        recurrence = Recurrence.parse(data['recurrence']) if data.get('recurrence') else None
+        if 'time_slot' in data or recurrence is None:
+            time_slot = time_slot_map.get(data['time_slot'], TimeSlot.MORNING)
+        else:
+            time_slot = TimeSlot.for_time(recurrence.first_time())
         
         medication = Medication(
             name=data['name'],
             dosage=data['dosage'],
-            time_slot=time_slot_map.get(data['time_slot'], TimeSlot.MORNING),
+            time_slot=time_slot,
             doctor_instructions=data.get('doctor_instructions', ''),
-            user_name=data.get('user_name', 'User')
+            user_name=data.get('user_name', 'User'),
+            patient_id=tenant.patient_id,
+            recurrence=recurrence
         )
         
-        medication_manager.add_medication(medication)
+        tenant.medication_manager.add_medication(medication)
+        if scheduler:
+            scheduler.schedule_medication(medication, tenant.medication_manager)
+        prerender_audio(tenant)
         
-        # Notify connected clients
+        # Notify the patient's caregivers
         socketio.emit('medication_added', {
+            'patient_id': tenant.patient_id,
             'medication': {
                 'name': medication.name,
                 'dosage': medication.dosage,
-                'time_slot': medication.time_slot.value
+                'time_slot': medication.time_slot.value,
+                'recurrence': str(medication.recurrence) if medication.recurrence else None
             }
-        })
+        }, to=caregiver_room(tenant.patient_id))
         
         return jsonify({'success': True, 'message': 'Medication added successfully'})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 400
 
 
+@app.route('/api/medications/import', methods=['POST'])
+def import_medications():
+    """
+    Bulk-add medications from an NDJSON or CSV upload (streamed, not buffered)
+    Rows may carry a patient_id; otherwise they go to the request's patient. The import is
+    all-or-nothing: any invalid row rejects it, and a valid one is saved in one transaction.
+    """
+    try:
+        default_patient_id = (request.args.get('patient_id')
+                              or request.headers.get('X-Patient-ID')
+                              or DEFAULT_PATIENT_ID)
+        fmt = bulk.format_for(request.content_type, request.args.get('format'))
+        
+        def check_patient(patient_id: str):
+            if not tenants.owns(patient_id):
+                return f"patient {patient_id} is served by another worker"
+            return None
+        
+        medications, errors = bulk.validate_rows(
+            bulk.read_rows(request.stream, fmt), default_patient_id, check_patient)
+        if errors:
+            return jsonify({'success': False, 'error': 'Invalid rows; nothing was imported',
+                            'errors': errors}), 400
+        
+        # Later rows for the same patient and name replace earlier ones
+        by_patient: dict[str, dict[str, Medication]] = {}
+        for medication in medications:
+            by_patient.setdefault(medication.patient_id, {})[medication.name] = medication
+        
+        with storage.transaction() if storage else nullcontext():
+            for patient_id, by_name in by_patient.items():
+                tenant = tenants.get(patient_id)
+                patient_medications = list(by_name.values())
+                replaced = tenant.medication_manager.add_medications(patient_medications)
+                if scheduler:
+                    for medication in replaced:
+                        scheduler.unschedule_medication(medication)
+                    for medication in patient_medications:
+                        scheduler.schedule_medication(medication, tenant.medication_manager)
+                
+                prerender_audio(tenant)
+                
+                # One coalesced notification per patient instead of one per medication
+                socketio.emit('medications_imported', {
+                    'patient_id': patient_id,
+                    'count': len(patient_medications)
+                }, to=caregiver_room(patient_id))
+        
+        return jsonify({'success': True,
+                        'imported': sum(len(by_name) for by_name in by_patient.values()),
+                        'patients': len(by_patient)})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+
+@app.route('/api/medications/export', methods=['GET'])
+def export_medications():
+    """
+    Stream the patient's medications as NDJSON or CSV
+    With ?scope=all every patient's are exported; that needs the operator token.
+    """
+    try:
+        fmt = bulk.format_for(None, request.args.get('format', 'ndjson'))
+        if request.args.get('scope') == 'all':
+            if not operator_request():
+                return jsonify({'success': False, 'error': 'Operator token required'}), 403
+            selected = [tenant.medication_manager for tenant in tenants]
+        else:
+            selected = [current_tenant().medication_manager]
+        medications = (med for manager in selected for med in manager.medications)
+        return Response(stream_with_context(bulk.export_rows(medications, fmt)),
+                        mimetype=bulk.FORMATS[fmt],
+                        headers={'Content-Disposition': f'attachment; filename=medications.{fmt}'})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+
 @app.route('/api/medications/<medication_name>', methods=['DELETE'])
 def delete_medication(medication_name):
     """Delete a medication"""
+    tenant = current_tenant()
     try:
-        # Find and remove medication
-        medication_to_remove = None
-        for med in medication_manager.medications:
-            if med.name == medication_name:
-                medication_to_remove = med
-                break
+        medication_to_remove = tenant.medication_manager.remove_medication(medication_name)
         
         if medication_to_remove:
-            medication_manager.medications.remove(medication_to_remove)
+            if scheduler:
+                scheduler.unschedule_medication(medication_to_remove)
             
-            # Notify connected clients
+            # Notify the patient's caregivers
             socketio.emit('medication_deleted', {
+                'patient_id': tenant.patient_id,
                 'medication_name': medication_name
-            })
+            }, to=caregiver_room(tenant.patient_id))
             
             return jsonify({'success': True, 'message': 'Medication deleted successfully'})
         else:
@@ -123,88 +425,336 @@ def delete_medication(medication_name):
         return jsonify({'success': False, 'error': str(e)}), 400
 
 
+SCHEDULE_DEFAULT_HOURS = 24
+SCHEDULE_MAX_HOURS = 24 * 31
+
+
+@app.route('/api/schedule', methods=['GET'])
+def get_schedule():
+    """
+    Get the patient's upcoming doses in time order, in the patient's local time
+    Query parameters:
+        start: ISO datetime to start from (default now in the patient's timezone); a time
+            with an offset is converted to the patient's local time
+        hours: Length of the window (default 24, max 744)
+    """
+    tenant = current_tenant()
+    try:
+        if 'start' in request.args:
+            start = datetime.fromisoformat(request.args['start'])
+            if start.tzinfo:
+                start = to_local(start, tenant.medication_manager.timezone)
+        else:
+            start = tenant.medication_manager.now()
+        hours = min(int(request.args.get('hours', SCHEDULE_DEFAULT_HOURS)), SCHEDULE_MAX_HOURS)
+        schedules = [(med.schedule, med) for med in tenant.medication_manager.medications]
+        doses = [{
+            'dose_id': f"{medication.name}@{occurrence.isoformat()}",
+            'medication_name': medication.name,
+            'dosage': medication.dosage_on(occurrence.date()),
+            'time_slot': medication.time_slot.value,
+            'doctor_instructions': medication.doctor_instructions,
+            'scheduled_time': occurrence.isoformat()
+        } for occurrence, medication in merge_occurrences(schedules, start, start + timedelta(hours=hours))]
+        return jsonify({'doses': doses})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+
+@app.route('/api/adherence', methods=['GET'])
+def get_adherence():
+    """
+    Get adherence rollups: per medication, time slot and week, lateness and streaks
+    Query parameters:
+        scope: 'patient' (default) for the current patient, 'all' to compare every patient on this worker
+            (needs the operator token)
+    """
+    if not ANALYTICS_AVAILABLE:
+        return jsonify({'success': False, 'error': 'Adherence analytics need numpy installed'}), 501
+    try:
+        if request.args.get('scope', 'patient') == 'all':
+            if not operator_request():
+                return jsonify({'success': False, 'error': 'Operator token required'}), 403
+            rollups = {tenant.patient_id: tenant.analytics.rollup() for tenant in tenants}
+            return jsonify({'patients': compare_patients(rollups)})
+        tenant = current_tenant()
+        return jsonify(dict(tenant.analytics.rollup(), patient_id=tenant.patient_id))
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 500
+
+
+def encode_cursor(key) -> str:
+    """Encode a record position as an opaque history cursor"""
+    scheduled_time, sequence = key
+    return f"{scheduled_time.isoformat()}~{sequence}"
+
+
+def decode_cursor(cursor: str):
+    """Decode a history cursor back into a record position"""
+    scheduled_time, sequence = cursor.rsplit('~', 1)
+    return datetime.fromisoformat(scheduled_time), int(sequence)
+
+
+def parse_history_bound(value: str, end: bool = False) -> datetime:
+    """Parse a date (whole day) or ISO datetime used to filter history"""
+    if len(value) == 10:
+        day_start = datetime.fromisoformat(value)
+        return day_start + timedelta(days=1) if end else day_start
+    return datetime.fromisoformat(value)
+
+
+def serialize_medication(medication) -> dict:
+    """Convert a Medication to its JSON form"""
+    return {
+        'name': medication.name,
+        'dosage': medication.dosage,
+        'time_slot': medication.time_slot.value,
+        'doctor_instructions': medication.doctor_instructions,
+        'user_name': medication.user_name,
+        'recurrence': str(medication.recurrence) if medication.recurrence else None
+    }
+
+
+def serialize_record(record) -> dict:
+    """Convert a MedicationRecord to its JSON form"""
+    return {
+        'dose_id': f"{record.medication.name}@{record.scheduled_time.isoformat()}",
+        'medication_name': record.medication.name,
+        'dosage': record.medication.dosage_on(record.scheduled_time.date()),
+        'scheduled_time': record.scheduled_time.isoformat(),
+        'taken': record.taken,
+        'taken_time': record.taken_time.isoformat() if record.taken_time else None,
+        'missed': record.missed,
+        'reminder_count': record.reminder_count
+    }
+
+
 @app.route('/api/history', methods=['GET'])
 def get_history():
-    """Get medication history"""
+    """
+    Get medication history, newest first, one page at a time
+    Query parameters:
+        limit: Page size (default 50, max 500)
+        cursor: next_cursor from the previous page
+        medication: Only this medication
+        start / end: Date (YYYY-MM-DD, inclusive) or ISO datetime bounds on scheduled time
+        status: taken, missed or pending
+    """
+    tenant = current_tenant()
     try:
-        history = []
-        for record in medication_manager.records:
-            history.append({
-                'medication_name': record.medication.name,
-                'dosage': record.medication.dosage,
-                'scheduled_time': record.scheduled_time.isoformat(),
-                'taken': record.taken,
-                'taken_time': record.taken_time.isoformat() if record.taken_time else None,
-                'missed': record.missed,
-                'reminder_count': record.reminder_count
-            })
+        seq = tenant.changes.seq
+        args = request.args
+        limit = min(max(int(args.get('limit', HISTORY_PAGE_SIZE)), 1), HISTORY_MAX_PAGE_SIZE)
+        status = args.get('status') or None
+        if status not in (None, 'taken', 'missed', 'pending'):
+            raise ValueError(f"Unknown status: {status}")
         
-        # Sort by scheduled time, most recent first
-        history.sort(key=lambda x: x['scheduled_time'], reverse=True)
+        records, next_key = tenant.medication_manager.records.page(
+            limit,
+            before=decode_cursor(args['cursor']) if args.get('cursor') else None,
+            medication_name=args.get('medication') or None,
+            start=parse_history_bound(args['start']) if args.get('start') else None,
+            end=parse_history_bound(args['end'], end=True) if args.get('end') else None,
+            status=status
+        )
         
-        return jsonify({'history': history})
+        return jsonify({
+            'history': [serialize_record(record) for record in records],
+            'next_cursor': encode_cursor(next_key) if next_key else None,
+            'seq': seq
+        })
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 400
 
 
+def confirm_medication_taken(tenant: Tenant, medication: Medication):
+    """Finish a confirmed dose: update the scheduler and tell the caregiver dashboard"""
+    if scheduler:
+        scheduler.mark_medication_taken(medication)
+    sessions.resolve(tenant.patient_id, medication)
+    socketio.emit('medication_taken', {
+        'patient_id': tenant.patient_id,
+        'medication': {
+            'name': medication.name,
+            'dosage': medication.dosage
+        },
+        'timestamp': datetime.now().isoformat()
+    }, to=caregiver_room(tenant.patient_id))
+
+
 @app.route('/api/user/response', methods=['POST'])
 def handle_user_response():
     """Handle user voice/text response"""
-    global current_medication
-    
+    tenant = current_tenant()
     data = request.json
     user_input = data.get('text', '').strip()
     
     if not user_input:
         return jsonify({'error': 'No input provided'}), 400
+    session = current_session(tenant)
     
     # Process user input
-    response, medication = voice_handler.process_user_input(user_input, current_medication)
+    response, medication, intent = tenant.voice_handler.process_user_input(user_input, session.medication)
     
-    if medication and medication != current_medication:
-        current_medication = medication
+    if medication and medication != session.medication:
+        session.medication = medication
     
-    # Mark as taken if confirmed
-    medication_taken = False
-    if medication:
-        user_input_lower = user_input.lower()
-        # Check for yes responses
-        yes_keywords = ["haan", "yes", "hmm", "le li", "le liya", "ho gaya", "done", "ok"]
-        if any(keyword in user_input_lower for keyword in yes_keywords) or "note kar deta hoon" in response.lower():
-            if scheduler:
-                scheduler.mark_medication_taken(medication)
-            medication_manager.mark_taken(medication, datetime.now())
-            current_medication = None
-            medication_taken = True
-            
-            # Notify caregiver dashboard
-            socketio.emit('medication_taken', {
-                'medication': {
-                    'name': medication.name,
-                    'dosage': medication.dosage
-                },
-                'timestamp': datetime.now().isoformat()
-            })
+    # A confirmed dose was already marked taken by the voice handler
+    medication_taken = bool(medication) and intent is Intent.YES
+    if medication_taken:
+        confirm_medication_taken(tenant, medication)
+    elif medication and intent is Intent.NO:
+        session.snooze(medication)
+        if scheduler:
+            scheduler.snooze(medication)
     
     # Check for caregiver notifications
     caregiver_alert = None
     if medication:
-        caregiver_alert = caregiver_notifier.check_and_notify(medication)
+        caregiver_alert = tenant.caregiver_notifier.check_and_notify(medication)
     
     return jsonify({
         'response': response,
+        'audio_url': audio_url(response),
         'caregiver_alert': caregiver_alert,
         'medication_taken': medication_taken
     })
 
 
+DOSE_ACK_MAX_BATCH = 500
+
+
+@app.route('/api/doses/ack', methods=['POST'])
+def acknowledge_doses():
+    """
+    Apply a batch of "taken" confirmations queued by an offline client
+    Body: {"acks": [{"dose_id": "<medication>@<scheduled ISO time>", "taken_time": "<ISO time>"}]}
+    Acks are idempotent: replaying one reports it as a duplicate. Each gets its own result,
+    so one bad ack doesn't fail the batch; doses off the schedule or not yet due are rejected.
+    """
+    tenant = current_tenant()
+    manager = tenant.medication_manager
+    acks = (request.get_json(silent=True) or {}).get('acks')
+    if not isinstance(acks, list):
+        return jsonify({'success': False, 'error': 'No acks provided'}), 400
+    if len(acks) > DOSE_ACK_MAX_BATCH:
+        return jsonify({'success': False, 'error': f'At most {DOSE_ACK_MAX_BATCH} acks per request'}), 400
+    
+    results = []
+    for ack in acks:
+        dose_id = ack.get('dose_id') if isinstance(ack, dict) else None
+        try:
+            if not isinstance(dose_id, str) or '@' not in dose_id:
+                raise ValueError('Invalid dose_id')
+            name, scheduled = dose_id.rsplit('@', 1)
+            scheduled_time = datetime.fromisoformat(scheduled)
+            if scheduled_time.tzinfo:
+                scheduled_time = to_local(scheduled_time, manager.timezone)
+            taken_time = datetime.fromisoformat(ack['taken_time']) if ack.get('taken_time') else manager.now()
+            if taken_time.tzinfo:
+                taken_time = to_local(taken_time, manager.timezone)
+            medication = next((med for med in manager.medications if med.name == name), None)
+            if medication is None:
+                raise ValueError(f"Unknown medication '{name}'")
+            # Only doses the schedule actually produced, and only once they are due
+            if medication.next_occurrence(scheduled_time - timedelta(microseconds=1)) != scheduled_time:
+                raise ValueError(f"'{name}' is not scheduled at {scheduled_time.isoformat()}")
+            if scheduled_time > manager.now():
+                raise ValueError(f"Dose at {scheduled_time.isoformat()} is not due yet")
+            
+            if scheduler:
+                changed = scheduler.acknowledge_dose(medication, scheduled_time, taken_time)
+            else:
+                record = manager.find_record(name, scheduled_time) or manager.create_record(medication, scheduled_time)
+                changed = manager.mark_record_taken(record, taken_time)
+            if changed:
+                sessions.resolve(tenant.patient_id, medication)
+                socketio.emit('medication_taken', {
+                    'patient_id': tenant.patient_id,
+                    'medication': {
+                        'name': medication.name,
+                        'dosage': medication.dosage
+                    },
+                    'timestamp': taken_time.isoformat()
+                }, to=caregiver_room(tenant.patient_id))
+            results.append({'dose_id': dose_id, 'status': 'taken' if changed else 'duplicate'})
+        except Exception as e:
+            results.append({'dose_id': dose_id, 'status': 'rejected', 'error': str(e)})
+    
+    return jsonify({'success': True, 'results': results})
+
+
+@app.route('/api/push/key', methods=['GET'])
+def get_push_key():
+    """Get the VAPID public key browsers subscribe with"""
+    if not (push and push.enabled):
+        return jsonify({'success': False, 'error': 'Web Push is not configured'}), 501
+    return jsonify({'public_key': push.signer.public_key})
+
+
+@app.route('/api/push/subscribe', methods=['POST'])
+def subscribe_push():
+    """Register a device's push subscription (the browser's PushSubscription.toJSON())"""
+    tenant = current_tenant()
+    if not (push and push.enabled):
+        return jsonify({'success': False, 'error': 'Web Push is not configured'}), 501
+    try:
+        # Plain http endpoints only make sense for the local push stub below
+        subscription = PushSubscription.from_json(request.get_json(silent=True) or {},
+                                                  allow_http=bool(os.environ.get('MEDMITRA_PUSH_STUB')))
+        tenant.push_subscriptions.add(subscription)
+        return jsonify({'success': True})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+
+@app.route('/api/push/unsubscribe', methods=['POST'])
+def unsubscribe_push():
+    """Remove a device's push subscription"""
+    tenant = current_tenant()
+    endpoint = (request.get_json(silent=True) or {}).get('endpoint')
+    if not endpoint:
+        return jsonify({'success': False, 'error': 'No endpoint provided'}), 400
+    return jsonify({'success': tenant.push_subscriptions.remove(endpoint)})
+
+
+# Stand-in push service for local testing (MEDMITRA_PUSH_STUB=1): subscribe a device with
+# an endpoint of http://<server>/api/push/stub/<channel> and read back what was sent
+push_stub_inbox: deque = deque(maxlen=100)
+
+
+@app.route('/api/push/stub/<channel>', methods=['GET', 'POST'])
+def push_stub(channel):
+    """Accept push messages like a push service would, or list the ones received"""
+    if not os.environ.get('MEDMITRA_PUSH_STUB'):
+        abort(404)
+    if request.method == 'POST':
+        push_stub_inbox.append({
+            'channel': channel,
+            'received_at': datetime.now().isoformat(),
+            'authorization': request.headers.get('Authorization', ''),
+            'content_encoding': request.headers.get('Content-Encoding'),
+            'ttl': request.headers.get('TTL'),
+            'size': len(request.get_data())
+        })
+        return '', 201
+    return jsonify({'messages': [message for message in push_stub_inbox if message['channel'] == channel]})
+
+
 @app.route('/api/reminder/current', methods=['GET'])
 def get_current_reminder():
     """Get current active reminder if any"""
-    global current_medication
+    tenant = current_tenant()
+    session = current_session(tenant)
+    current_medication = session.medication
+    snoozed = [med.name for med in session.snoozed]
     
     if current_medication:
-        reminder_text = voice_handler.generate_reminder(current_medication)
+        reminder_text = tenant.voice_handler.generate_reminder(current_medication)
         return jsonify({
             'has_reminder': True,
             'medication': {
@@ -212,30 +762,82 @@ def get_current_reminder():
                 'dosage': current_medication.dosage,
                 'time_slot': current_medication.time_slot.value
             },
-            'reminder_text': reminder_text
+            'reminder_text': reminder_text,
+            'audio_url': audio_url(reminder_text),
+            'snoozed': snoozed
         })
     
-    return jsonify({'has_reminder': False})
+    return jsonify({'has_reminder': False, 'snoozed': snoozed})
 
 
 @app.route('/api/setup', methods=['POST'])
 def setup_user():
-    """Setup user information and caregiver contact"""
-    data = request.json
-    medication_manager.user_name = data.get('user_name', 'User')
-    medication_manager.set_caregiver_contact(data.get('caregiver_contact', ''))
+    """
+    Setup user information, caregiver contact and timezone (IANA name, e.g. Asia/Kolkata)
+    Only the fields present in the body are changed.
+    """
+    tenant = current_tenant()
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'success': False, 'error': 'No setup data provided'}), 400
+    if data.get('timezone'):
+        try:
+            tenant.medication_manager.set_timezone(data['timezone'])
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        # Deadlines are kept in UTC, so re-arm every reminder for the new offset
+        if scheduler:
+            scheduler.attach_manager(tenant.medication_manager)
+    if 'user_name' in data:
+        tenant.medication_manager.user_name = data['user_name'] or 'User'
+        tenant.medication_manager.save_profile()
+    if 'caregiver_contact' in data:
+        tenant.medication_manager.set_caregiver_contact(data['caregiver_contact'] or '')
+    # Reminders greet the patient by name, so their audio changes too
+    prerender_audio(tenant)
     
     return jsonify({'success': True, 'message': 'User setup completed'})
 
 
+def record_change(tenant: Tenant, kind: str, item):
+    """Fold a patient's state change into their adherence analytics and caches, then publish it"""
+    if kind == 'records_compacted':
+        # Old records left memory; their analytics rows go too (dashboards aren't told)
+        if tenant.analytics:
+            tenant.analytics.compact(item)
+        return
+    if kind == 'record' and tenant.analytics:
+        tenant.analytics.observe(item)
+    elif kind == 'medication_removed':
+        tenant.voice_handler.forget_reminders([item.name])
+    elif kind == 'medications_imported':
+        tenant.voice_handler.forget_reminders(med.name for med in item)
+    publish_change(tenant, kind, item)
+
+
+def publish_change(tenant: Tenant, kind: str, item):
+    """Number a patient's state change and push it to dashboards as a compact delta"""
+    if kind == 'record':
+        delta = tenant.changes.append('record', serialize_record(item))
+    elif kind == 'medication_added':
+        delta = tenant.changes.append('medication_added', serialize_medication(item))
+    elif kind == 'medications_imported':
+        delta = tenant.changes.append('medications_imported',
+                                      {'medications': [serialize_medication(med) for med in item]})
+    else:
+        delta = tenant.changes.append('medication_removed', {'name': item.name})
+    socketio.emit('state_delta', dict(delta, patient_id=tenant.patient_id),
+                  to=caregiver_room(tenant.patient_id))
+
+
 def on_reminder_due(medication):
     """Callback when a medication reminder is due"""
-    global current_medication
-    current_medication = medication
-    reminder_message = voice_handler.generate_reminder(medication)
+    tenant = tenants.get(medication.patient_id)
+    sessions.remind(tenant.patient_id, medication)
+    reminder_message = tenant.voice_handler.generate_reminder(medication)
     
-    # Emit reminder to all connected clients
-    socketio.emit('medication_reminder', {
+    reminder = {
+        'patient_id': tenant.patient_id,
         'medication': {
             'name': medication.name,
             'dosage': medication.dosage,
@@ -243,26 +845,105 @@ def on_reminder_due(medication):
             'doctor_instructions': medication.doctor_instructions
         },
         'message': reminder_message,
+        'audio_url': audio_url(reminder_message),
         'timestamp': datetime.now().isoformat()
-    })
+    }
+    # Emit reminder to the patient's devices only
+    socketio.emit('medication_reminder', reminder, to=patient_room(tenant.patient_id))
+    # Devices with the app closed get it as a push notification (open apps ignore the push)
+    if push:
+        push.submit(tenant.push_subscriptions, reminder)
+
+
+def on_dose_escalated(record):
+    """Callback when a dose's reminders have all gone unanswered"""
+    tenant = tenants.get(record.medication.patient_id)
+    sessions.resolve(tenant.patient_id, record.medication)
+    message = tenant.caregiver_notifier.escalate(record)
+    socketio.emit('caregiver_alert', {
+        'patient_id': tenant.patient_id,
+        'medication_name': record.medication.name,
+        'scheduled_time': record.scheduled_time.isoformat(),
+        'message': message,
+        'timestamp': datetime.now().isoformat()
+    }, to=caregiver_room(tenant.patient_id))
+
+
+def on_dose_missed(record):
+    """Callback when a dose becomes missed: alert the caregiver right away if doses keep being missed"""
+    tenant = tenants.get(record.medication.patient_id)
+    message = tenant.caregiver_notifier.check_and_notify(record.medication)
+    if message:
+        socketio.emit('caregiver_alert', {
+            'patient_id': tenant.patient_id,
+            'medication_name': record.medication.name,
+            'scheduled_time': record.scheduled_time.isoformat(),
+            'message': message,
+            'timestamp': datetime.now().isoformat()
+        }, to=caregiver_room(tenant.patient_id))
 
 
 def initialize_scheduler():
-    """Initialize the reminder scheduler"""
-    global scheduler
+    """
+    Initialize the reminder scheduler and the caregiver notification dispatcher
+    Under run_web.py --production the process is monkey-patched first, so the
+    scheduler's thread and condition variable are green and its callbacks can
+    emit like any other request handler.
+    """
+    global scheduler, push
     if scheduler is None:
         scheduler = ReminderScheduler(
-            medication_manager,
+            None,
             on_reminder_due,
-            check_interval=60
+            escalation_callback=on_dose_escalated,
+            missed_callback=on_dose_missed
         )
         scheduler.start()
+        for tenant in tenants:
+            scheduler.attach_manager(tenant.medication_manager)
+        
+        # Caregiver alerts are delivered by the dispatcher's own thread
+        dispatcher.start()
+        atexit.register(dispatcher.stop)
+        
+        # Web Push messages go out from their own thread too
+        push = PushDispatcher.from_environment()
+        push.start()
+        atexit.register(push.stop)
+        
+        # Render fixed replies and every scheduled reminder to audio in the background
+        if tts:
+            tts.prerender(RESPONSES.values())
+            for tenant in tenants:
+                prerender_audio(tenant)
     return scheduler
 
 
+def load_state():
+    """Open the durable store (MEDMITRA_DB) and restore every patient this worker owns"""
+    global storage, restored_from_storage
+    if storage is not None:
+        return storage
+    storage = SQLiteStore.from_environment()
+    if storage is None:
+        return None
+    
+    for tenant in tenants:
+        tenant.medication_manager.storage = storage
+        tenant.push_subscriptions.storage = storage
+    records_loaded = storage.load(tenants)
+    restored_from_storage = len(tenants) > 0
+    atexit.register(storage.close)
+    print(f"Restored {len(tenants)} patients and {records_loaded} dose records from {storage.path}")
+    return storage
+
+
 # Initialize with sample medications
 def setup_sample_medications():
-    """Setup sample medications for demo"""
+    """Setup sample medications for demo (skipped when state was restored from storage)"""
+    if restored_from_storage or not tenants.owns(DEFAULT_PATIENT_ID):
+        return
+    medication_manager = tenants.get(DEFAULT_PATIENT_ID).medication_manager
     if len(medication_manager.medications) == 0:
         med1 = Medication(
             name="Metoprolol",
@@ -288,7 +969,23 @@ def setup_sample_medications():
 
 @socketio.on('connect')
 def handle_connect():
-    """Handle client connection"""
+    """
+    Handle client connection: join the patient's or the caregiver's room
+    Dashboards (role=caregiver) must present the patient's caregiver token.
+    """
+    patient_id = request.args.get('patient_id') or DEFAULT_PATIENT_ID
+    if not tenants.owns(patient_id):
+        shard = tenants.shard_of(patient_id)
+        raise ConnectionRefusedError('patient belongs to another shard',
+                                     {'shard': shard, 'worker_url': worker_url(shard)})
+    caregiver = request.args.get('role') == 'caregiver'
+    if caregiver and not caregiver_access.verify(patient_id, request.args.get('token')):
+        raise ConnectionRefusedError('invalid caregiver token')
+    socket_patients[request.sid] = patient_id
+    if caregiver:
+        join_room(caregiver_room(patient_id))
+    else:
+        join_room(patient_room(patient_id))
     print('Client connected')
     emit('connected', {'message': 'Connected to MedMitra'})
 
@@ -296,6 +993,8 @@ def handle_connect():
 @socketio.on('disconnect')
 def handle_disconnect():
     """Handle client disconnection"""
+    socket_patients.pop(request.sid, None)
+    sessions.drop(request.sid)
     print('Client disconnected')
 
 
@@ -305,53 +1004,85 @@ def handle_ping():
     emit('pong', {'status': 'ok'})
 
 
+@socketio.on('watch_patient')
+def handle_watch_patient(data):
+    """
+    Subscribe a caregiver dashboard to another patient's updates
+    The patient may live on another worker; its events arrive through the message queue.
+    The dashboard must send that patient's caregiver token.
+    """
+    patient_id = (data or {}).get('patient_id')
+    if not patient_id:
+        return {'success': False, 'error': 'No patient_id provided'}
+    if not caregiver_access.verify(patient_id, data.get('token')):
+        return {'success': False, 'error': 'Invalid caregiver token'}
+    join_room(caregiver_room(patient_id))
+    tenant = tenants.find(patient_id)
+    return {'success': True, 'seq': tenant.changes.seq if tenant else None}
+
+
+@socketio.on('unwatch_patient')
+def handle_unwatch_patient(data):
+    """Unsubscribe a caregiver dashboard from a patient's updates"""
+    patient_id = (data or {}).get('patient_id')
+    if patient_id:
+        leave_room(caregiver_room(patient_id))
+    return {'success': True}
+
+
+@socketio.on('sync')
+def handle_sync(data):
+    """
+    Catch a reconnecting dashboard up from its last seen sequence number
+    Returns the missed deltas, or reset=True when the client must reload. Only sockets
+    in the patient's caregiver room (joined with a valid caregiver token) may sync.
+    """
+    patient_id = (data or {}).get('patient_id') or socket_patients.get(request.sid, DEFAULT_PATIENT_ID)
+    if caregiver_room(patient_id) not in rooms():
+        return {'success': False, 'error': 'Invalid caregiver token'}
+    if not tenants.owns(patient_id):
+        return {'reset': True, 'error': 'Patient is served by another worker'}
+    tenant = tenants.get(patient_id)
+    since = int((data or {}).get('since', 0))
+    deltas = tenant.changes.since(since)
+    if deltas is None:
+        return {'seq': tenant.changes.seq, 'reset': True}
+    return {'seq': tenant.changes.seq, 'deltas': deltas}
+
+
 @socketio.on('user_message')
 def handle_user_message(data):
     """Handle user message via WebSocket"""
-    global current_medication
-    
+    tenant = socket_tenant()
     user_input = data.get('text', '').strip()
     if not user_input:
         return
+    session = socket_session(tenant)
     
     # Process user input
-    response, medication = voice_handler.process_user_input(user_input, current_medication)
-    
-    if medication and medication != current_medication:
-        current_medication = medication
+    response, medication, intent = tenant.voice_handler.process_user_input(user_input, session.medication)
     
-    # Check if medication was taken (multiple ways to confirm)
-    medication_taken = False
-    user_input_lower = user_input.lower()
-    response_lower = response.lower()
+    if medication and medication != session.medication:
+        session.medication = medication
     
-    # Check various ways user might confirm
-    if (any(word in user_input_lower for word in ['haan', 'yes', 'le li', 'le liya', 'ho gaya', 'done', 'ok', 'hmm']) or
-        "note kar deta hoon" in response_lower):
-        medication_taken = True
-        if medication:
-            if scheduler:
-                scheduler.mark_medication_taken(medication)
-            medication_manager.mark_taken(medication, datetime.now())
-            current_medication = None
-            
-            # Notify caregiver dashboard
-            emit('medication_taken', {
-                'medication': {
-                    'name': medication.name,
-                    'dosage': medication.dosage
-                },
-                'timestamp': datetime.now().isoformat()
-            })
+    # A confirmed dose was already marked taken by the voice handler
+    medication_taken = bool(medication) and intent is Intent.YES
+    if medication_taken:
+        confirm_medication_taken(tenant, medication)
+    elif medication and intent is Intent.NO:
+        session.snooze(medication)
+        if scheduler:
+            scheduler.snooze(medication)
     
     # Check for caregiver notifications
     caregiver_alert = None
     if medication:
-        caregiver_alert = caregiver_notifier.check_and_notify(medication)
+        caregiver_alert = tenant.caregiver_notifier.check_and_notify(medication)
     
     # Emit response back to client
     emit('medmitra_response', {
         'response': response,
+        'audio_url': audio_url(response),
         'caregiver_alert': caregiver_alert,
         'medication_taken': medication_taken,
         'medication': {
@@ -362,6 +1093,7 @@ def handle_user_message(data):
 
 
 if __name__ == '__main__':
+    load_state()
     setup_sample_medications()
     initialize_scheduler()
     
@@ -373,6 +1105,7 @@ if __name__ == '__main__':
     print("="*60)
     print(f"Server running on: http://localhost:{port}")
     print(f"Access from mobile: http://<your-ip>:{port}")
+    print(f"Caregiver dashboard: http://localhost:{port}{caregiver_access.dashboard_path(DEFAULT_PATIENT_ID)}")
     print("="*60 + "\n")
     
     socketio.run(app, host='0.0.0.0', port=port, debug=debug, allow_unsafe_werkzeug=True)
@@ -0,0 +1,137 @@
+"""
+Bulk medication import/export for MedMitra
+Streams NDJSON or CSV rows in and out without holding the raw upload in memory
+"""
+import csv
+import io
+import itertools
+import json
+from typing import Callable, IO, Iterable, Iterator, Optional
+from .config import create_medication_from_config
+from .medication import Medication, TimeSlot
+from .recurrence import Recurrence
+
+# Columns of an import/export row, in CSV order
+MEDICATION_FIELDS = ["patient_id", "name", "dosage", "time_slot", "doctor_instructions", "user_name",
+                     "recurrence"]
+FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+# Rows are validated this many at a time; an import stops collecting errors at MAX_ERRORS
+BATCH_SIZE = 500
+MAX_ERRORS = 50
+
+_TIME_SLOTS = {slot.value.lower(): slot.value for slot in TimeSlot}
+
+
+def format_for(content_type: Optional[str], requested: Optional[str] = None) -> str:
+    """Pick ndjson or csv from an explicit ?format= or the request's Content-Type"""
+    if requested:
+        if requested not in FORMATS:
+            raise ValueError(f"Unsupported format '{requested}' (use ndjson or csv)")
+        return requested
+    return "csv" if content_type and "csv" in content_type else "ndjson"
+
+
+def read_rows(stream: IO[bytes], fmt: str) -> Iterator[tuple[int, dict]]:
+    """Yield (line number, row) pairs from an uploaded byte stream"""
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    if fmt == "csv":
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    
+    for line_number, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError as e:
+            row = ValueError(f"invalid JSON: {e.msg}")
+        yield line_number, row
+
+
+def validate_row(row, default_patient_id: str) -> Medication:
+    """Turn one import row into a Medication, raising ValueError if it is unusable"""
+    if isinstance(row, Exception):
+        raise row
+    if not isinstance(row, dict):
+        raise ValueError("row must be an object")
+    
+    values = {field: str(row.get(field) or "").strip() for field in MEDICATION_FIELDS}
+    for field in ("name", "dosage"):
+        if not values[field]:
+            raise ValueError(f"missing {field}")
+    if values["recurrence"]:
+        try:
+            recurrence = Recurrence.parse(values["recurrence"])
+        except (KeyError, ValueError) as e:
+            raise ValueError(f"invalid recurrence '{values['recurrence']}': {e}")
+        values["recurrence"] = str(recurrence)
+        if not values["time_slot"]:
+            # A custom schedule's greeting follows the time of its first dose
+            values["time_slot"] = TimeSlot.for_time(recurrence.first_time()).value
+    if not values["time_slot"]:
+        raise ValueError("missing time_slot")
+    time_slot = _TIME_SLOTS.get(values["time_slot"].lower())
+    if time_slot is None:
+        raise ValueError(f"unknown time_slot '{values['time_slot']}'")
+    
+    medication = create_medication_from_config(dict(values, time_slot=time_slot,
+                                                    user_name=values["user_name"] or "User"))
+    medication.patient_id = values["patient_id"] or default_patient_id
+    return medication
+
+
+def validate_rows(rows: Iterable[tuple[int, dict]], default_patient_id: str,
+                  check_patient: Callable[[str], Optional[str]]) -> tuple[list[Medication], list[dict]]:
+    """
+    Validate every row, BATCH_SIZE rows at a time
+    Args:
+        rows: (line number, row) pairs from read_rows
+        default_patient_id: Patient for rows without a patient_id column
+        check_patient: Returns an error message for patients that can't be imported here
+    Returns: (medications, errors); errors are {"line", "error"} and capped at MAX_ERRORS
+    """
+    medications: list[Medication] = []
+    errors: list[dict] = []
+    rows = iter(rows)
+    while len(errors) < MAX_ERRORS:
+        batch = list(itertools.islice(rows, BATCH_SIZE))
+        if not batch:
+            break
+        for line_number, row in batch:
+            try:
+                medication = validate_row(row, default_patient_id)
+                problem = check_patient(medication.patient_id)
+                if problem:
+                    raise ValueError(problem)
+                medications.append(medication)
+            except ValueError as e:
+                errors.append({"line": line_number, "error": str(e)})
+    return medications, errors[:MAX_ERRORS]
+
+
+def export_rows(medications: Iterable[Medication], fmt: str) -> Iterator[str]:
+    """Yield the medications as NDJSON lines or CSV rows (with a header)"""
+    if fmt == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(MEDICATION_FIELDS)
+        for medication in medications:
+            writer.writerow(_export_values(medication))
+            if buffer.tell() > 64 * 1024:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+        return
+    
+    for medication in medications:
+        yield json.dumps(dict(zip(MEDICATION_FIELDS, _export_values(medication)))) + "\n"
+
+
+def _export_values(medication: Medication) -> list[str]:
+    return [medication.patient_id, medication.name, medication.dosage, medication.time_slot.value,
+            medication.doctor_instructions, medication.user_name,
+            str(medication.recurrence) if medication.recurrence else ""]
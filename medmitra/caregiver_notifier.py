@@ -2,9 +2,15 @@
 Caregiver notification system for MedMitra
 Sends alerts when doses are missed repeatedly
 """
-from datetime import datetime
+from collections import deque
+from datetime import date
 from typing import Optional
-from .medication import Medication, MedicationManager
+from .medication import Medication, MedicationManager, MedicationRecord
+from .dispatch import ConsoleTransport, NotificationDispatcher
+
+
+# Most recent notifications kept in memory per patient (all are still saved to storage)
+NOTIFICATION_HISTORY_LIMIT = 200
 
 
 class CaregiverNotifier:
@@ -12,20 +18,33 @@ class CaregiverNotifier:
     
     def __init__(self, medication_manager: MedicationManager):
         self.medication_manager = medication_manager
-        self.notification_history: list[dict] = []
+        self.notification_history: deque[dict] = deque(maxlen=NOTIFICATION_HISTORY_LIMIT)
+        # Optional background dispatcher; without one, notifications are printed inline
+        self.dispatcher: Optional[NotificationDispatcher] = None
+        # Missed count last reported per medication, for the current day only
+        self._notified_day: Optional[date] = None
+        self._notified: dict[str, int] = {}
     
     def check_and_notify(self, medication: Medication):
         """
         Check if medication has been missed repeatedly and notify caregiver
+        Each medication is reported once per day, and again only if more doses are missed.
         Returns notification message if sent, None otherwise
         """
         missed_count = self.medication_manager.get_missed_count(medication, days=1)
         
         # Notify if 2 or more doses missed in a day
-        if missed_count >= 2:
-            return self.send_notification(medication, missed_count)
+        if missed_count < 2:
+            return None
         
-        return None
+        today = self.medication_manager.now().date()
+        if self._notified_day != today:
+            self._notified_day = today
+            self._notified = {}
+        if self._notified.get(medication.name, 0) >= missed_count:
+            return None
+        self._notified[medication.name] = missed_count
+        return self.send_notification(medication, missed_count)
     
     def send_notification(self, medication: Medication, missed_count: int) -> str:
         """
@@ -38,31 +57,58 @@ class CaregiverNotifier:
         message = (f"{user_name} ne aaj {time_slot} ki dava miss ki hai. "
                   f"Total {missed_count} doses miss ho chuki hain. "
                   f"Kripya unse baat karein aur unki madad karein.")
+        self._deliver(medication, missed_count, message, "missed")
+        return message
+    
+    def escalate(self, record: MedicationRecord) -> str:
+        """
+        Tell the caregiver about a single dose whose reminders all went unanswered
+        Returns the notification message
+        """
+        medication = record.medication
+        user_name = self.medication_manager.user_name
+        missed_count = self.medication_manager.get_missed_count(medication, days=1)
+        
+        message = (f"{user_name} ne {record.scheduled_time.strftime('%H:%M')} baje ki "
+                  f"{medication.name} ki dava baar-baar yaad dilane ke baad bhi nahi li hai. "
+                  f"Kripya unse baat karein aur unki madad karein.")
+        self._deliver(medication, missed_count, message, "escalation", urgent=True)
+        return message
+    
+    def _deliver(self, medication: Medication, missed_count: int, message: str,
+                 kind: str, urgent: bool = False):
+        """
+        Record a notification and hand it to the dispatcher (or print it inline)
+        Args:
+            medication: Medication the alert is about
+            missed_count: Doses of it missed today
+            message: Text for the caregiver
+            kind: "missed" or "escalation"; only queued alerts of the same kind collapse
+            urgent: Skip the dispatcher's batch window
+        """
+        user_name = self.medication_manager.user_name
         
         # Store notification in history
         notification = {
-            "timestamp": datetime.now(),
+            "timestamp": self.medication_manager.now(),
             "user": user_name,
             "medication": medication.name,
             "missed_count": missed_count,
             "message": message
         }
         self.notification_history.append(notification)
+        if self.medication_manager.storage:
+            self.medication_manager.storage.save_notification(self.medication_manager.patient_id, notification)
         
-        # In a real implementation, this would send SMS/email/WhatsApp
-        # For now, we'll just log it
-        self._log_notification(notification)
-        
-        return message
-    
-    def _log_notification(self, notification: dict):
-        """Log notification (in real app, this would send via SMS/email/WhatsApp)"""
-        timestamp = notification["timestamp"].strftime("%Y-%m-%d %H:%M:%S")
-        print(f"\n[CAREGIVER NOTIFICATION - {timestamp}]")
-        print(f"To: {self.medication_manager.caregiver_contact}")
-        print(f"Message: {notification['message']}\n")
+        # Delivery happens off the request path when a dispatcher is attached
+        contact = self.medication_manager.caregiver_contact
+        if self.dispatcher:
+            dedupe_key = f"{self.medication_manager.patient_id}:{medication.name}:{kind}"
+            self.dispatcher.submit(contact, dedupe_key, message, urgent=urgent)
+        else:
+            ConsoleTransport().send(contact, message)
     
     def get_notification_history(self) -> list[dict]:
-        """Get history of all notifications sent"""
-        return self.notification_history
+        """Get history of the most recent notifications sent"""
+        return list(self.notification_history)
 
@@ -0,0 +1,45 @@
+"""
+Versioned change log for MedMitra
+Gives every state change a sequence number so clients can sync incrementally
+"""
+import itertools
+import threading
+from collections import deque
+from typing import Optional
+
+
+class ChangeLog:
+    """Monotonically numbered deltas for one patient, keeping only the most recent ones"""
+    
+    def __init__(self, capacity: int = 1000):
+        """
+        Initialize change log
+        Args:
+            capacity: How many recent deltas to keep for catch-up syncs
+        """
+        self.seq = 0
+        self._deltas: deque[dict] = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+    
+    def append(self, op: str, data: dict) -> dict:
+        """Record a change and return the numbered delta"""
+        with self._lock:
+            self.seq += 1
+            delta = {"seq": self.seq, "op": op, "data": data}
+            self._deltas.append(delta)
+            return delta
+    
+    def since(self, seq: int) -> Optional[list[dict]]:
+        """
+        Get every delta after `seq`
+        Returns None when the log no longer reaches back that far (client must reload)
+        """
+        with self._lock:
+            if seq > self.seq:
+                return None
+            if seq == self.seq:
+                return []
+            first_seq = self._deltas[0]["seq"] if self._deltas else self.seq + 1
+            if first_seq > seq + 1:
+                return None
+            return list(itertools.islice(self._deltas, seq + 1 - first_seq, None))
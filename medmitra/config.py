@@ -2,7 +2,8 @@
 Configuration file for MedMitra
 In a real application, this would load from a config file or database
 """
-from medication import Medication, TimeSlot
+from .medication import Medication, TimeSlot
+from .recurrence import Recurrence
 
 
 def load_medications_from_config() -> list[dict]:
@@ -44,6 +45,7 @@ def create_medication_from_config(config: dict) -> Medication:
         dosage=config["dosage"],
         time_slot=time_slot_map.get(config["time_slot"], TimeSlot.MORNING),
         doctor_instructions=config.get("doctor_instructions", ""),
-        user_name=config.get("user_name", "User")
+        user_name=config.get("user_name", "User"),
+        recurrence=Recurrence.parse(config["recurrence"]) if config.get("recurrence") else None
     )
 
@@ -65,7 +65,7 @@ def demo_medmitra():
     print("DEMO 2: User Confirms Medication Taken")
     print("="*70)
     print("User: Haan")
-    response, _ = voice_handler.process_user_input("Haan", med1)
+    response, _, _ = voice_handler.process_user_input("Haan", med1)
     print(f"MedMitra: {response}\n")
     
     # Demo 3: User asks about medication
@@ -73,7 +73,7 @@ def demo_medmitra():
     print("DEMO 3: User Asks About Medication")
     print("="*70)
     print("User: Yeh dawa kisliye hai?")
-    response, _ = voice_handler.process_user_input("Yeh dawa kisliye hai?", med1)
+    response, _, _ = voice_handler.process_user_input("Yeh dawa kisliye hai?", med1)
     print(f"MedMitra: {response}\n")
     
     # Demo 4: User says "Nahi" (No)
@@ -81,7 +81,7 @@ def demo_medmitra():
     print("DEMO 4: User Hasn't Taken Medication Yet")
     print("="*70)
     print("User: Nahi")
-    response, _ = voice_handler.process_user_input("Nahi", med2)
+    response, _, _ = voice_handler.process_user_input("Nahi", med2)
     print(f"MedMitra: {response}\n")
     
     # Demo 5: Emergency Response
@@ -89,7 +89,7 @@ def demo_medmitra():
     print("DEMO 5: Emergency Situation Handling")
     print("="*70)
     print("User: Mujhe tez dard ho raha hai")
-    response, _ = voice_handler.process_user_input("Mujhe tez dard ho raha hai")
+    response, _, _ = voice_handler.process_user_input("Mujhe tez dard ho raha hai")
     print(f"MedMitra: {response}\n")
     
     # Demo 6: Confused User Support
@@ -97,7 +97,7 @@ def demo_medmitra():
     print("DEMO 6: Emotional Support")
     print("="*70)
     print("User: Main pareshan hoon")
-    response, _ = voice_handler.process_user_input("Main pareshan hoon")
+    response, _, _ = voice_handler.process_user_input("Main pareshan hoon")
     print(f"MedMitra: {response}\n")
     
     # Demo 7: Caregiver Notification
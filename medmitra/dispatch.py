@@ -0,0 +1,213 @@
+"""
+Background delivery of caregiver notifications for MedMitra
+Batches alerts per caregiver into digests and retries failed sends with exponential backoff
+"""
+import heapq
+import importlib
+import itertools
+import os
+import threading
+import time as time_module
+from datetime import datetime
+from typing import Optional
+from .metrics import DELAY_BUCKETS, REGISTRY
+
+
+DISPATCH_LATENCY = REGISTRY.histogram("medmitra_notification_dispatch_seconds",
+                                      "Time from queueing a caregiver alert to delivering it",
+                                      buckets=DELAY_BUCKETS)
+SEND_FAILURES = REGISTRY.counter("medmitra_notification_send_failures_total",
+                                 "Failed caregiver notification sends (each retry counts)")
+
+
+class Transport:
+    """Delivers a message to a caregiver contact; raise an exception to have it retried"""
+    
+    name = "base"
+    
+    def send(self, contact: Optional[str], message: str):
+        raise NotImplementedError
+
+
+class ConsoleTransport(Transport):
+    """Logs notifications (in real app, this would send via SMS/email/WhatsApp)"""
+    
+    name = "console"
+    
+    def send(self, contact: Optional[str], message: str):
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        print(f"\n[CAREGIVER NOTIFICATION - {timestamp}]")
+        print(f"To: {contact}")
+        print(f"Message: {message}\n")
+
+
+class StubTransport(Transport):
+    """Keeps sent messages in memory; can be told to fail the first few sends (for tests)"""
+    
+    name = "stub"
+    
+    def __init__(self, fail_times: int = 0):
+        self.sent: list[tuple[Optional[str], str]] = []
+        self.attempts = 0
+        self.fail_times = fail_times
+    
+    def send(self, contact: Optional[str], message: str):
+        self.attempts += 1
+        if self.attempts <= self.fail_times:
+            raise ConnectionError("stub transport failure")
+        self.sent.append((contact, message))
+
+
+TRANSPORTS = {transport.name: transport for transport in (ConsoleTransport, StubTransport)}
+
+
+def load_transport(spec: str) -> Transport:
+    """Build a transport from a registered name or a "package.module:ClassName" path"""
+    if ":" in spec:
+        module_name, class_name = spec.split(":", 1)
+        return getattr(importlib.import_module(module_name), class_name)()
+    if spec not in TRANSPORTS:
+        raise ValueError(f"Unknown notification transport '{spec}'")
+    return TRANSPORTS[spec]()
+
+
+class _Batch:
+    """Notifications waiting to go to one caregiver"""
+    
+    __slots__ = ("contact", "messages", "attempt", "queued_at")
+    
+    def __init__(self, contact: Optional[str]):
+        self.contact = contact
+        # dedupe key -> message; a newer alert for the same key replaces the older one
+        self.messages: dict[str, str] = {}
+        self.attempt = 0
+        self.queued_at = time_module.monotonic()
+
+
+class NotificationDispatcher:
+    """Sends caregiver notifications from a background thread"""
+    
+    def __init__(self, transport: Transport, batch_window: float = 30.0,
+                 max_retries: int = 5, retry_delay: float = 2.0):
+        """
+        Initialize dispatcher
+        Args:
+            transport: Where messages are delivered
+            batch_window: Seconds to collect further alerts for a caregiver before sending a digest
+            max_retries: Failed sends are retried this many times before being dropped
+            retry_delay: First retry delay in seconds; doubles on every further failure
+        """
+        self.transport = transport
+        self.batch_window = batch_window
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.running = False
+        self._batches: dict[str, _Batch] = {}
+        # Min-heap of (due, seq, batch key); a key has at most one live entry
+        self._due: list[tuple[float, int, str]] = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+    
+    @classmethod
+    def from_environment(cls) -> "NotificationDispatcher":
+        """Dispatcher configured by MEDMITRA_NOTIFY_TRANSPORT and MEDMITRA_NOTIFY_BATCH_SECONDS"""
+        return cls(load_transport(os.environ.get("MEDMITRA_NOTIFY_TRANSPORT", "console")),
+                   batch_window=float(os.environ.get("MEDMITRA_NOTIFY_BATCH_SECONDS", 30)))
+    
+    def start(self):
+        """Start the delivery thread"""
+        if self.running:
+            return
+        self.running = True
+        self._thread = threading.Thread(target=self._dispatch_loop, daemon=True)
+        self._thread.start()
+    
+    def stop(self, flush: bool = True):
+        """Stop the delivery thread, first sending everything still queued if `flush`"""
+        with self._condition:
+            self.running = False
+            self._condition.notify()
+        if self._thread:
+            self._thread.join(timeout=5)
+        if flush:
+            for key in list(self._batches):
+                self._send(key, final=True)
+    
+    def submit(self, contact: Optional[str], dedupe_key: str, message: str, urgent: bool = False):
+        """
+        Queue a message for a caregiver
+        Args:
+            contact: Caregiver's phone/email (messages are batched per contact)
+            dedupe_key: Identifies what the alert is about; queued alerts with the same key collapse
+            message: Text to deliver
+            urgent: Send now (with whatever else is queued for the caregiver) instead of
+                waiting out the batch window
+        """
+        key = contact or ""
+        with self._condition:
+            batch = self._batches.get(key)
+            if batch is None:
+                batch = self._batches[key] = _Batch(contact)
+                if not urgent:
+                    self._schedule(key, time_module.monotonic() + self.batch_window)
+            batch.messages[dedupe_key] = message
+            if urgent:
+                self._unschedule(key)
+                self._schedule(key, time_module.monotonic())
+    
+    def pending(self) -> int:
+        """Number of queued messages not yet delivered"""
+        with self._condition:
+            return sum(len(batch.messages) for batch in self._batches.values())
+    
+    def _schedule(self, key: str, due: float):
+        heapq.heappush(self._due, (due, next(self._sequence), key))
+        self._condition.notify()
+    
+    def _unschedule(self, key: str):
+        """Drop a batch's pending send time (caller holds the condition)"""
+        self._due = [entry for entry in self._due if entry[2] != key]
+        heapq.heapify(self._due)
+    
+    def _dispatch_loop(self):
+        while True:
+            with self._condition:
+                while self.running and (not self._due or self._due[0][0] > time_module.monotonic()):
+                    self._condition.wait(self._due[0][0] - time_module.monotonic() if self._due else None)
+                if not self.running:
+                    return
+                _, _, key = heapq.heappop(self._due)
+            self._send(key)
+    
+    def _send(self, key: str, final: bool = False):
+        """Deliver one caregiver's batch as a single digest, rescheduling it on failure"""
+        with self._condition:
+            batch = self._batches.pop(key, None)
+        if batch is None or not batch.messages:
+            return
+        
+        try:
+            self.transport.send(batch.contact, digest(list(batch.messages.values())))
+            DISPATCH_LATENCY.observe(time_module.monotonic() - batch.queued_at)
+        except Exception as e:
+            SEND_FAILURES.inc()
+            batch.attempt += 1
+            if final or batch.attempt > self.max_retries:
+                print(f"Error sending caregiver notification to {batch.contact}: {e}")
+                return
+            with self._condition:
+                # Alerts queued meanwhile join the retry instead of waiting for their own window
+                newer = self._batches.pop(key, None)
+                if newer:
+                    batch.messages.update(newer.messages)
+                    self._unschedule(key)
+                self._batches[key] = batch
+                self._schedule(key, time_module.monotonic() + self.retry_delay * 2 ** (batch.attempt - 1))
+
+
+def digest(messages: list[str]) -> str:
+    """Combine a caregiver's queued alerts into one message"""
+    if len(messages) == 1:
+        return messages[0]
+    return f"MedMitra: {len(messages)} alerts\n" + "\n".join(f"- {message}" for message in messages)
@@ -0,0 +1,77 @@
+"""
+Intent classification for MedMitra
+Matches every keyword list in a single precompiled regex pass over the user's input
+"""
+import re
+from enum import Enum
+
+
+class Intent(Enum):
+    EMERGENCY = "emergency"
+    YES = "yes"
+    NO = "no"
+    QUESTION = "question"
+    CONFUSED = "confused"
+    UNKNOWN = "unknown"
+
+
+# Keywords per intent, in priority order: when an utterance matches several
+# intents the earliest one here wins (e.g. "nahi, tez dard" is an emergency).
+INTENT_KEYWORDS: dict[Intent, list[str]] = {
+    Intent.EMERGENCY: ["emergency", "severe", "gambhir", "tez dard", "sans nahi aa rahi",
+                       "chest pain", "heart attack", "stroke"],
+    Intent.YES: ["haan", "haanji", "yes", "hmm", "le li", "le liya", "ho gaya", "done", "ok", "okay"],
+    Intent.NO: ["nahi", "no", "abhi nahi", "baad mein", "not yet", "wait"],
+    Intent.QUESTION: ["kisliye", "kyun", "kya hai", "what is", "why", "purpose", "kaam"],
+    Intent.CONFUSED: ["confused", "sad", "upset", "pareshan", "udaas", "samajh nahi aa raha"],
+}
+
+
+def _keyword_pattern(keyword: str) -> str:
+    # The last letter may be drawn out ("hmmm", "nooo"), as speech-to-text often writes it
+    return re.escape(keyword) + "+"
+
+
+def _effective_intents() -> dict[str, Intent]:
+    """
+    Map each keyword to the highest-priority intent among the keywords inside it
+    A phrase is matched as a whole, yet "samajh nahi aa raha" still counts as NO ("nahi"),
+    just as the old per-intent substring checks classified it.
+    """
+    keyword_intents: dict[str, Intent] = {}
+    for intent, keywords in INTENT_KEYWORDS.items():
+        for keyword in keywords:
+            keyword_intents.setdefault(keyword, intent)
+    priority = list(INTENT_KEYWORDS)
+    return {keyword: min((intent for inner, intent in keyword_intents.items()
+                          if re.search(r"\b" + _keyword_pattern(inner) + r"\b", keyword)),
+                         key=priority.index)
+            for keyword in keyword_intents}
+
+
+_EFFECTIVE_INTENTS = _effective_intents()
+
+# Every keyword in one alternation, longest first, so phrases win over the shorter
+# keywords inside them ("le liya" over "le li")
+_PATTERN = re.compile(r"\b(?:" + "|".join(
+    _keyword_pattern(keyword) for keyword in sorted(_EFFECTIVE_INTENTS, key=len, reverse=True)) + r")\b")
+_PRIORITY = {intent: rank for rank, intent in enumerate(INTENT_KEYWORDS)}
+
+
+def _match_intent(matched: str) -> Intent:
+    # Trim a drawn-out last letter back to the keyword ("hmmm" -> "hmm")
+    while matched not in _EFFECTIVE_INTENTS:
+        matched = matched[:-1]
+    return _EFFECTIVE_INTENTS[matched]
+
+
+def classify_intent(text: str) -> Intent:
+    """Classify an utterance; keywords only match whole words ("no" doesn't match "know")"""
+    best = Intent.UNKNOWN
+    for match in _PATTERN.finditer(text.lower()):
+        intent = _match_intent(match.group())
+        if best is Intent.UNKNOWN or _PRIORITY[intent] < _PRIORITY[best]:
+            best = intent
+            if _PRIORITY[best] == 0:
+                break
+    return best
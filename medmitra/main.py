@@ -6,6 +6,7 @@ import sys
 from datetime import datetime
 from .medication import Medication, MedicationManager, TimeSlot
 from .voice_handler import VoiceHandler
+from .intents import Intent
 from .reminder_scheduler import ReminderScheduler
 from .caregiver_notifier import CaregiverNotifier
 
@@ -58,9 +59,21 @@ class MedMitra:
         # In a real voice app, this would use TTS to speak the message
         # For now, we'll just print it
     
+    def on_dose_escalated(self, record):
+        """Callback when a dose's reminders have all gone unanswered"""
+        self.current_medication = None
+        notification = self.caregiver_notifier.escalate(record)
+        print(f"\n[Caregiver Alert]: {notification}\n")
+    
+    def on_dose_missed(self, record):
+        """Callback when a dose becomes missed"""
+        notification = self.caregiver_notifier.check_and_notify(record.medication)
+        if notification:
+            print(f"\n[Caregiver Alert]: {notification}\n")
+    
     def handle_user_response(self, user_input: str):
         """Handle user's voice/text response"""
-        response, medication = self.voice_handler.process_user_input(
+        response, medication, intent = self.voice_handler.process_user_input(
             user_input, 
             self.current_medication
         )
@@ -73,10 +86,13 @@ class MedMitra:
         print("-"*60 + "\n")
         
         # Check if medication was taken and notify caregiver if needed
-        if medication and "note kar deta hoon" in response.lower():
+        if medication and intent is Intent.YES:
             # Medication was taken
             self.scheduler.mark_medication_taken(medication)
             self.current_medication = None
+        elif medication and intent is Intent.NO:
+            # Remind again after the snooze interval
+            self.scheduler.snooze(medication)
         
         # Check for missed doses and notify caregiver
         if medication:
@@ -99,7 +115,8 @@ class MedMitra:
         self.scheduler = ReminderScheduler(
             self.medication_manager,
             self.on_reminder_due,
-            check_interval=60  # Check every minute
+            escalation_callback=self.on_dose_escalated,
+            missed_callback=self.on_dose_missed
         )
         self.scheduler.start()
         
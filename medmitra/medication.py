@@ -1,10 +1,20 @@
 """
 Medication data structure and management for MedMitra
 """
+import re
+import threading
 from dataclasses import dataclass
-from typing import Optional, List
-from datetime import datetime, time
+from functools import lru_cache
+from typing import Callable, Optional, List, Tuple
+from datetime import date, datetime, time, timedelta
 from enum import Enum
+from .records import RecordStore
+from .recurrence import Recurrence
+from .timezones import DEFAULT_TIMEZONE, get_zone, local_now
+
+
+# Patient ID used when a request or medication doesn't name one
+DEFAULT_PATIENT_ID = "default"
 
 
 class TimeSlot(Enum):
@@ -12,6 +22,48 @@ class TimeSlot(Enum):
     AFTERNOON = "Afternoon"
     EVENING = "Evening"
     NIGHT = "Night"
+    
+    @classmethod
+    def for_time(cls, at: time) -> "TimeSlot":
+        """Get the slot a time of day falls in (used to greet custom schedules)"""
+        if at.hour < 12:
+            return cls.MORNING
+        if at.hour < 17:
+            return cls.AFTERNOON
+        if at.hour < 20:
+            return cls.EVENING
+        return cls.NIGHT
+
+
+SLOT_TIMES = {
+    TimeSlot.MORNING: time(8, 0),      # 8:00 AM
+    TimeSlot.AFTERNOON: time(14, 0),   # 2:00 PM
+    TimeSlot.EVENING: time(18, 0),     # 6:00 PM
+    TimeSlot.NIGHT: time(21, 0)        # 9:00 PM
+}
+_SLOT_RULES = {slot: Recurrence.daily_at(at) for slot, at in SLOT_TIMES.items()}
+
+
+# Simple explanations, keyed by a word that appears in the medication's name
+EXPLANATIONS = {
+    "metformin": "Yeh dawa aapke blood sugar ko control karti hai, taaki aap healthy rahein.",
+    "metoprolol": "Yeh dawa aapke blood pressure aur dil ki dhadkan ko normal rakhti hai, taaki dil ko zyada mehnat na karni pade.",
+    "aspirin": "Yeh dawa blood ko thin rakhti hai, taaki clots na banein aur heart healthy rahe.",
+    "atorvastatin": "Yeh dawa cholesterol ko kam karti hai, taaki heart aur blood vessels sahi kaam karein.",
+    "amlodipine": "Yeh dawa blood pressure ko kam karti hai, taaki dil aur blood vessels par zyada pressure na pade.",
+    "omeprazole": "Yeh dawa pet ki acid ko kam karti hai, taaki pet mein jalan na ho.",
+    "levothyroxine": "Yeh dawa thyroid gland ko sahi kaam karne mein madad karti hai.",
+}
+GENERIC_EXPLANATION = ("Yeh dawa aapke doctor ne aapki sehat ke liye prescribe ki hai. "
+                       "Kripya doctor ke instructions ke mutabik lein.")
+_EXPLANATION_INDEX = re.compile("|".join(re.escape(key) for key in EXPLANATIONS))
+
+
+@lru_cache(maxsize=1024)
+def explanation_for(medication_name: str) -> str:
+    """Look up the simple explanation for a medication name (names are matched case-insensitively)"""
+    match = _EXPLANATION_INDEX.search(medication_name.lower())
+    return EXPLANATIONS[match.group()] if match else GENERIC_EXPLANATION
 
 
 @dataclass
@@ -22,36 +74,32 @@ class Medication:
     time_slot: TimeSlot
     doctor_instructions: str
     user_name: str = "User"
+    patient_id: str = DEFAULT_PATIENT_ID
+    # Custom schedule; without one the medication is due once a day at its time slot
+    recurrence: Optional[Recurrence] = None
     
     def get_time(self) -> time:
         """Get the time for this medication based on time slot"""
-        time_map = {
-            TimeSlot.MORNING: time(8, 0),      # 8:00 AM
-            TimeSlot.AFTERNOON: time(14, 0),   # 2:00 PM
-            TimeSlot.EVENING: time(18, 0),     # 6:00 PM
-            TimeSlot.NIGHT: time(21, 0)        # 9:00 PM
-        }
-        return time_map[self.time_slot]
+        return SLOT_TIMES[self.time_slot]
+    
+    @property
+    def schedule(self) -> Recurrence:
+        """The rule this medication is due by"""
+        return self.recurrence or _SLOT_RULES[self.time_slot]
+    
+    def next_occurrence(self, after: datetime) -> Optional[datetime]:
+        """Get the first scheduled datetime strictly after the given moment (None once a course ends)"""
+        return self.schedule.next_after(after)
+    
+    def dosage_on(self, day: date) -> str:
+        """Get the dosage for a day (differs from `dosage` only for tapering courses)"""
+        if self.recurrence is None:
+            return self.dosage
+        return self.recurrence.dosage_on(day, self.dosage)
     
     def get_simple_explanation(self) -> str:
         """Get a simple explanation of what this medication does"""
-        explanations = {
-            "metformin": "Yeh dawa aapke blood sugar ko control karti hai, taaki aap healthy rahein.",
-            "metoprolol": "Yeh dawa aapke blood pressure aur dil ki dhadkan ko normal rakhti hai, taaki dil ko zyada mehnat na karni pade.",
-            "aspirin": "Yeh dawa blood ko thin rakhti hai, taaki clots na banein aur heart healthy rahe.",
-            "atorvastatin": "Yeh dawa cholesterol ko kam karti hai, taaki heart aur blood vessels sahi kaam karein.",
-            "amlodipine": "Yeh dawa blood pressure ko kam karti hai, taaki dil aur blood vessels par zyada pressure na pade.",
-            "omeprazole": "Yeh dawa pet ki acid ko kam karti hai, taaki pet mein jalan na ho.",
-            "levothyroxine": "Yeh dawa thyroid gland ko sahi kaam karne mein madad karti hai.",
-        }
-        
-        name_lower = self.name.lower()
-        for key, explanation in explanations.items():
-            if key in name_lower:
-                return explanation
-        
-        # Generic explanation if specific one not found
-        return f"Yeh dawa aapke doctor ne aapki sehat ke liye prescribe ki hai. Kripya doctor ke instructions ke mutabik lein."
+        return explanation_for(self.name)
 
 
 @dataclass
@@ -63,35 +111,80 @@ class MedicationRecord:
     taken_time: Optional[datetime] = None
     reminder_count: int = 0
     missed: bool = False
+    record_id: Optional[int] = None
 
 
 class MedicationManager:
     """Manages medications and their schedules"""
     
-    def __init__(self):
-        self.medications: List[Medication] = []
-        self.records: List[MedicationRecord] = []
+    def __init__(self, patient_id: str = DEFAULT_PATIENT_ID):
+        self.patient_id = patient_id
+        # Copy-on-write: writers swap in a new tuple under _lock, so readers
+        # (scheduler, routes) iterate a stable snapshot without locking
+        self.medications: Tuple[Medication, ...] = ()
+        self._lock = threading.Lock()
+        self.records = RecordStore()
         self.caregiver_contact: Optional[str] = None
         self.user_name: str = "User"
+        # IANA zone the patient's schedule is written in; record times are in this zone
+        self.timezone: str = DEFAULT_TIMEZONE
+        # Optional durable store (see storage.SQLiteStore); writes are fire-and-forget
+        self.storage = None
+        # Optional change listener, called as on_change(kind, item): a medication, record or cutoff day
+        self.on_change: Optional[Callable[[str, object], None]] = None
     
     def add_medication(self, medication: Medication):
         """Add a new medication to the schedule"""
-        self.medications.append(medication)
+        with self._lock:
+            self.medications = self.medications + (medication,)
+        if self.storage:
+            self.storage.save_medication(medication)
+        self._changed("medication_added", medication)
         if not self.user_name or self.user_name == "User":
             self.user_name = medication.user_name
+            self.save_profile()
+    
+    def add_medications(self, medications: List[Medication]) -> List[Medication]:
+        """
+        Add or replace many medications at once (bulk import)
+        Medications with the same name are replaced, the last one in `medications` winning.
+        Listeners get a single "medications_imported" change. Returns the replaced medications.
+        """
+        by_name = {medication.name: medication for medication in medications}
+        with self._lock:
+            replaced = [med for med in self.medications if med.name in by_name]
+            self.medications = (tuple(med for med in self.medications if med.name not in by_name)
+                                + tuple(by_name.values()))
+        if self.storage:
+            for medication in by_name.values():
+                self.storage.save_medication(medication)
+        self._changed("medications_imported", list(by_name.values()))
+        if (not self.user_name or self.user_name == "User") and by_name:
+            self.user_name = next(iter(by_name.values())).user_name
+            self.save_profile()
+        return replaced
+    
+    def remove_medication(self, name: str) -> Optional[Medication]:
+        """Remove a medication by name, returning it if it was scheduled"""
+        with self._lock:
+            med = next((med for med in self.medications if med.name == name), None)
+            if med is None:
+                return None
+            self.medications = tuple(other for other in self.medications if other is not med)
+        if self.storage:
+            self.storage.delete_medication(med)
+        self._changed("medication_removed", med)
+        return med
     
     def get_medications_for_time(self, current_time: datetime) -> List[Medication]:
         """Get medications due at the current time"""
         due_medications = []
-        current_time_only = current_time.time()
+        window = timedelta(minutes=5)
         
         for med in self.medications:
-            med_time = med.get_time()
-            # Check if current time matches scheduled time (within 5 minutes)
-            # This ensures reminders trigger exactly at the right time
-            time_diff = abs((current_time_only.hour * 60 + current_time_only.minute) - 
-                          (med_time.hour * 60 + med_time.minute))
-            if time_diff <= 5:
+            # Check if a dose is scheduled within 5 minutes of the current time
+            occurrence = med.next_occurrence(current_time - window - timedelta(microseconds=1))
+            if occurrence is not None and occurrence <= current_time + window:
                 due_medications.append(med)
         
         return due_medications
@@ -99,34 +192,89 @@ class MedicationManager:
     def create_record(self, medication: Medication, scheduled_time: datetime) -> MedicationRecord:
         """Create a new medication record"""
         record = MedicationRecord(medication=medication, scheduled_time=scheduled_time)
-        self.records.append(record)
+        self.add_record(record)
         return record
     
-    def mark_taken(self, medication: Medication, taken_time: datetime):
-        """Mark medication as taken"""
-        # Find the most recent record for this medication
-        for record in reversed(self.records):
-            if record.medication.name == medication.name and not record.taken:
-                record.taken = True
-                record.taken_time = taken_time
-                record.missed = False
+    def add_record(self, record: MedicationRecord):
+        """Add a record built elsewhere (e.g. reserved by the scheduler), persisting it"""
+        self.records.add(record)
+        self.update_record(record)
+    
+    def find_record(self, medication_name: str, scheduled_time: datetime) -> Optional[MedicationRecord]:
+        """Get the record of one specific dose, if it exists"""
+        for record in self.records.for_day(medication_name, scheduled_time.date()):
+            if record.scheduled_time == scheduled_time:
                 return record
         return None
     
+    def mark_taken(self, medication: Medication, taken_time: datetime):
+        """Mark medication as taken"""
+        # The most recent untaken record for this medication
+        record = self.records.mark_taken(medication.name, taken_time)
+        if record:
+            self.update_record(record)
+        return record
+    
+    def mark_record_taken(self, record: MedicationRecord, taken_time: datetime) -> bool:
+        """Mark a specific dose taken, persisting it only if it wasn't already"""
+        changed = self.records.mark_record_taken(record, taken_time)
+        if changed:
+            self.update_record(record)
+        return changed
+    
+    def mark_record_missed(self, record: MedicationRecord) -> bool:
+        """Flag an untaken dose as missed, persisting the change"""
+        changed = self.records.mark_record_missed(record)
+        if changed:
+            self.update_record(record)
+        return changed
+    
+    def count_reminder(self, record: MedicationRecord):
+        """Count a reminder (first or repeated) sent for a dose, persisting the change"""
+        self.records.count_reminder(record)
+        self.update_record(record)
+    
+    def compact_records(self, before: date) -> int:
+        """
+        Roll records scheduled before `before` into daily summaries
+        Listeners get a "records_compacted" change with the cutoff day when any were removed.
+        """
+        compacted = self.records.compact(before)
+        if compacted:
+            self._changed("records_compacted", before)
+        return compacted
+    
+    def update_record(self, record: MedicationRecord):
+        """Persist a record after its fields have changed"""
+        if self.storage:
+            self.storage.save_record(record)
+        self._changed("record", record)
+    
+    def _changed(self, kind: str, item: object):
+        if self.on_change:
+            self.on_change(kind, item)
+    
+    def now(self) -> datetime:
+        """Current wall-clock time in the patient's timezone"""
+        return local_now(self.timezone)
+    
     def get_missed_count(self, medication: Medication, days: int = 1) -> int:
         """Get count of missed doses for a medication in recent days"""
-        cutoff = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-        missed_count = 0
-        
-        for record in self.records:
-            if (record.medication.name == medication.name and 
-                record.scheduled_time >= cutoff and 
-                record.missed):
-                missed_count += 1
-        
-        return missed_count
+        return self.records.missed_count(medication.name, self.now().date(), days)
+    
+    def set_timezone(self, zone_name: str):
+        """Set the patient's timezone (raises ValueError for unknown zones)"""
+        get_zone(zone_name)
+        self.timezone = zone_name
+        self.save_profile()
     
     def set_caregiver_contact(self, contact: str):
         """Set caregiver contact information"""
         self.caregiver_contact = contact
+        self.save_profile()
+    
+    def save_profile(self):
+        """Persist the patient's name, caregiver contact and timezone"""
+        if self.storage:
+            self.storage.save_profile(self)
 
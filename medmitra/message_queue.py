@@ -0,0 +1,97 @@
+"""
+Local message queue for multi-worker MedMitra deployments
+Lets Socket.IO emits from one worker process reach clients connected to another,
+without needing Redis or RabbitMQ on a single machine
+"""
+import json
+import socket
+import threading
+from typing import Optional
+from urllib.parse import urlparse
+
+import socketio
+
+
+class LocalMessageBroker:
+    """
+    Fan-out relay over localhost TCP
+    Workers open a SUB connection to receive and a PUB connection to send;
+    every published line is copied to every subscriber.
+    """
+    
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self._server = socket.create_server((host, port))
+        self.host, self.port = self._server.getsockname()[:2]
+        self._subscribers: list[socket.socket] = []
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+    
+    @property
+    def url(self) -> str:
+        """Queue URL to hand to workers (MEDMITRA_MESSAGE_QUEUE)"""
+        return f"local://{self.host}:{self.port}"
+    
+    def start(self):
+        """Start accepting worker connections in the background"""
+        self._thread = threading.Thread(target=self._accept_loop, daemon=True)
+        self._thread.start()
+    
+    def _accept_loop(self):
+        while True:
+            connection, _ = self._server.accept()
+            threading.Thread(target=self._serve, args=(connection,), daemon=True).start()
+    
+    def _serve(self, connection: socket.socket):
+        reader = connection.makefile("rb")
+        role = reader.readline().strip()
+        if role == b"SUB":
+            with self._lock:
+                self._subscribers.append(connection)
+            return
+        
+        for line in reader:
+            with self._lock:
+                for subscriber in list(self._subscribers):
+                    try:
+                        subscriber.sendall(line)
+                    except OSError:
+                        self._subscribers.remove(subscriber)
+        connection.close()
+
+
+class LocalQueueManager(socketio.PubSubManager):
+    """Socket.IO client manager that shares emits through a LocalMessageBroker"""
+    
+    name = "local"
+    
+    def __init__(self, url: str, channel: str = "flask-socketio",
+                 write_only: bool = False, logger=None):
+        """
+        Initialize manager
+        Args:
+            url: Broker address as local://host:port
+        """
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        parsed = urlparse(url)
+        self._address = (parsed.hostname or "127.0.0.1", parsed.port)
+        self._publisher: Optional[socket.socket] = None
+        self._publish_lock = threading.Lock()
+    
+    def _publish(self, data):
+        line = (json.dumps(data) + "\n").encode("utf-8")
+        with self._publish_lock:
+            if self._publisher is None:
+                self._publisher = socket.create_connection(self._address)
+                self._publisher.sendall(b"PUB\n")
+            try:
+                self._publisher.sendall(line)
+            except OSError:
+                # Broker restarted: reconnect once and resend
+                self._publisher = socket.create_connection(self._address)
+                self._publisher.sendall(b"PUB\n" + line)
+    
+    def _listen(self):
+        connection = socket.create_connection(self._address)
+        connection.sendall(b"SUB\n")
+        for line in connection.makefile("rb"):
+            yield json.loads(line)
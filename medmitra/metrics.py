@@ -0,0 +1,241 @@
+"""
+Instrumentation for MedMitra
+Counters, gauges and histograms rendered in the Prometheus text format for /metrics
+"""
+import threading
+import time as time_module
+import weakref
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional
+
+# Histogram bucket upper bounds, in seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DELAY_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+
+class _Shard:
+    """One thread's private slots for a metric"""
+    
+    __slots__ = ("values", "__weakref__")
+    
+    def __init__(self, size: int):
+        self.values = [0.0] * size
+
+
+class _ThreadCells:
+    """
+    Per-thread value slots, summed when scraped
+    Recording touches only the calling thread's own list, so it needs no lock. When a
+    thread (or green thread) ends, its values are folded into a retired total so
+    short-lived request threads don't accumulate.
+    """
+    
+    __slots__ = ("_size", "_local", "_shards", "_retired", "_lock")
+    
+    def __init__(self, size: int):
+        self._size = size
+        self._local = threading.local()
+        self._shards: "weakref.WeakSet[_Shard]" = weakref.WeakSet()
+        self._retired = [0.0] * size
+        # Re-entrant: a shard can be collected (and retired) while totals() holds it
+        self._lock = threading.RLock()
+    
+    def mine(self) -> list[float]:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = _Shard(self._size)
+            weakref.finalize(shard, self._retire, shard.values)
+            with self._lock:
+                self._shards.add(shard)
+        return shard.values
+    
+    def _retire(self, values: list[float]):
+        with self._lock:
+            for index, value in enumerate(values):
+                self._retired[index] += value
+    
+    def totals(self) -> list[float]:
+        with self._lock:
+            totals = list(self._retired)
+            for shard in list(self._shards):
+                for index, value in enumerate(shard.values):
+                    totals[index] += value
+            return totals
+
+
+class Metric:
+    """A named metric, optionally split into children by label values"""
+    
+    kind = "untyped"
+    
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._children: dict[tuple[str, ...], "Metric"] = {}
+        self._lock = threading.Lock()
+    
+    def labels(self, *values: str) -> "Metric":
+        """Get the child for a set of label values (created on first use)"""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} takes labels {self.labelnames}")
+            with self._lock:
+                child = self._children.get(values)
+                if child is None:
+                    child = self._children[values] = self._new_child()
+        return child
+    
+    def _new_child(self) -> "Metric":
+        raise NotImplementedError
+    
+    def samples(self) -> Iterator[tuple[str, dict, float]]:
+        """Yield (sample name, labels, value) for the exposition format"""
+        if not self.labelnames:
+            yield from self._own_samples({})
+            return
+        with self._lock:
+            children = list(self._children.items())
+        for values, child in children:
+            yield from child._own_samples(dict(zip(self.labelnames, values)))
+    
+    def _own_samples(self, labels: dict) -> Iterator[tuple[str, dict, float]]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """A monotonically increasing count"""
+    
+    kind = "counter"
+    
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._cells = _ThreadCells(1)
+    
+    def _new_child(self) -> "Counter":
+        return Counter(self.name, self.documentation)
+    
+    def inc(self, amount: float = 1.0):
+        self._cells.mine()[0] += amount
+    
+    def _own_samples(self, labels: dict) -> Iterator[tuple[str, dict, float]]:
+        yield self.name, labels, self._cells.totals()[0]
+
+
+class Gauge(Metric):
+    """A value that goes up and down, or is read from a callback when scraped"""
+    
+    kind = "gauge"
+    
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = (),
+                 callback: Optional[Callable[[], float]] = None):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+        self._cells = _ThreadCells(1)
+    
+    def _new_child(self) -> "Gauge":
+        return Gauge(self.name, self.documentation)
+    
+    def inc(self, amount: float = 1.0):
+        self._cells.mine()[0] += amount
+    
+    def dec(self, amount: float = 1.0):
+        self._cells.mine()[0] -= amount
+    
+    def _own_samples(self, labels: dict) -> Iterator[tuple[str, dict, float]]:
+        yield self.name, labels, self.callback() if self.callback else self._cells.totals()[0]
+
+
+class Histogram(Metric):
+    """Counts of observations per bucket, plus their sum"""
+    
+    kind = "histogram"
+    
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Slots: one per bucket, one for +Inf, then the sum
+        self._cells = _ThreadCells(len(self.buckets) + 2)
+    
+    def _new_child(self) -> "Histogram":
+        return Histogram(self.name, self.documentation, buckets=self.buckets)
+    
+    def observe(self, value: float):
+        values = self._cells.mine()
+        values[bisect_left(self.buckets, value)] += 1
+        values[-1] += value
+    
+    @contextmanager
+    def time(self):
+        """Observe how long the block takes"""
+        start = time_module.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time_module.perf_counter() - start)
+    
+    def _own_samples(self, labels: dict) -> Iterator[tuple[str, dict, float]]:
+        totals = self._cells.totals()
+        cumulative = 0.0
+        for bound, count in zip(self.buckets + (float("inf"),), totals):
+            cumulative += count
+            yield f"{self.name}_bucket", dict(labels, le=_format_value(bound)), cumulative
+        yield f"{self.name}_count", labels, cumulative
+        yield f"{self.name}_sum", labels, totals[-1]
+
+
+class Registry:
+    """The metrics served by one /metrics endpoint"""
+    
+    def __init__(self):
+        self._metrics: dict[str, Metric] = {}
+        self._lock = threading.Lock()
+    
+    def register(self, metric: Metric) -> Metric:
+        """Add a metric; registering a name twice returns the first metric"""
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+    
+    def counter(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+    
+    def gauge(self, name: str, documentation: str, labelnames: tuple[str, ...] = (),
+              callback: Optional[Callable[[], float]] = None) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames, callback))
+    
+    def histogram(self, name: str, documentation: str, labelnames: tuple[str, ...] = (),
+                  buckets: tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+    
+    def render(self) -> str:
+        """Render every metric in the Prometheus text exposition format"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+               for value in labels.values())
+    return "{" + ",".join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+# Process-wide registry, like prometheus_client's default one
+REGISTRY = Registry()
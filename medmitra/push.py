@@ -0,0 +1,450 @@
+"""
+Web Push delivery for MedMitra
+Reaches patients' devices through their browser's push service even when the app is closed,
+with VAPID-signed, encrypted messages sent from a batched background queue
+"""
+import base64
+import hashlib
+import heapq
+import hmac
+import importlib
+import itertools
+import json
+import os
+import struct
+import threading
+import time as time_module
+import urllib.error
+import urllib.request
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Optional
+from urllib.parse import urlsplit
+from .metrics import DELAY_BUCKETS, REGISTRY
+
+try:
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.hazmat.primitives.asymmetric.utils import decode_dss_signature
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+except ImportError:  # Web Push is optional; reminders then reach open apps over Socket.IO only
+    ec = None
+
+if TYPE_CHECKING:
+    from .storage import SQLiteStore
+
+PUSH_AVAILABLE = ec is not None
+
+PUSH_SENT = REGISTRY.counter("medmitra_push_sent_total", "Web Push messages accepted by push services")
+PUSH_FAILURES = REGISTRY.counter("medmitra_push_send_failures_total",
+                                 "Failed Web Push sends (each retry counts)")
+PUSH_EXPIRED = REGISTRY.counter("medmitra_push_subscriptions_expired_total",
+                                "Push subscriptions dropped because their push service reported them gone")
+PUSH_LATENCY = REGISTRY.histogram("medmitra_push_dispatch_seconds",
+                                  "Time from queueing a push message to its push service accepting it",
+                                  buckets=DELAY_BUCKETS)
+
+# Push services hold undelivered messages this long (seconds); a reminder is stale after that
+PUSH_TTL = 3600
+VAPID_TOKEN_LIFETIME = 12 * 3600
+# Messages are sent as one aes128gcm record, which caps the payload size
+RECORD_SIZE = 4096
+MAX_PAYLOAD = RECORD_SIZE - 17 - 86
+# Status _post reports for a message that can't be encrypted (too large, bad keys); never retried
+UNSENDABLE = -1
+
+
+def b64url(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def b64url_decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+class PushSubscription:
+    """One browser's push endpoint and the keys its messages are encrypted to"""
+    
+    __slots__ = ("endpoint", "p256dh", "auth", "expires_at")
+    
+    def __init__(self, endpoint: str, p256dh: str, auth: str, expires_at: Optional[float] = None):
+        self.endpoint = endpoint
+        self.p256dh = p256dh
+        self.auth = auth
+        # Epoch seconds after which the browser stops accepting messages, if it set one
+        self.expires_at = expires_at
+    
+    @classmethod
+    def from_json(cls, data: dict, allow_http: bool = False) -> "PushSubscription":
+        """
+        Parse the browser's PushSubscription.toJSON() form, raising ValueError if it's incomplete
+        Push services are always HTTPS; plain http endpoints are only accepted with
+        `allow_http` (the local push stub), since the server posts to whatever URL is given.
+        """
+        endpoint = data.get("endpoint")
+        keys = data.get("keys") or {}
+        if not endpoint or not keys.get("p256dh") or not keys.get("auth"):
+            raise ValueError("Subscription needs an endpoint and p256dh/auth keys")
+        parts = urlsplit(endpoint)
+        if not parts.hostname or parts.scheme not in (("https", "http") if allow_http else ("https",)):
+            raise ValueError("Subscription endpoint must be an https URL")
+        expiration = data.get("expirationTime")
+        return cls(endpoint, keys["p256dh"], keys["auth"], expiration / 1000 if expiration else None)
+
+
+class SubscriptionStore:
+    """A patient's push subscriptions, one per device; expired ones are dropped as they are read"""
+    
+    def __init__(self, patient_id: str):
+        self.patient_id = patient_id
+        self.storage: Optional["SQLiteStore"] = None
+        self._subscriptions: dict[str, PushSubscription] = {}
+        self._lock = threading.Lock()
+    
+    def add(self, subscription: PushSubscription):
+        """Add or renew a device's subscription"""
+        self.restore(subscription)
+        if self.storage:
+            self.storage.save_push_subscription(self.patient_id, subscription)
+    
+    def restore(self, subscription: PushSubscription):
+        """Add a subscription loaded from storage (without saving it again)"""
+        with self._lock:
+            self._subscriptions[subscription.endpoint] = subscription
+    
+    def remove(self, endpoint: str) -> bool:
+        """Forget a subscription; returns False if it wasn't known"""
+        with self._lock:
+            removed = self._subscriptions.pop(endpoint, None) is not None
+        if removed and self.storage:
+            self.storage.delete_push_subscription(endpoint)
+        return removed
+    
+    def active(self) -> list[PushSubscription]:
+        """Get the subscriptions that can still receive messages"""
+        now = time_module.time()
+        with self._lock:
+            expired = [endpoint for endpoint, subscription in self._subscriptions.items()
+                       if subscription.expires_at is not None and subscription.expires_at <= now]
+            active = [subscription for endpoint, subscription in self._subscriptions.items()
+                      if endpoint not in expired]
+        for endpoint in expired:
+            self.remove(endpoint)
+        return active
+    
+    def __len__(self) -> int:
+        return len(self._subscriptions)
+
+
+def _load_or_create_key(path: str) -> "ec.EllipticCurvePrivateKey":
+    """Load the server's VAPID key from a configured path, generating and saving one on first use"""
+    if os.path.exists(path):
+        with open(path, "rb") as file:
+            return serialization.load_pem_private_key(file.read(), password=None)
+    key = ec.generate_private_key(ec.SECP256R1())
+    pem = key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                            serialization.NoEncryption())
+    with os.fdopen(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), "wb") as file:
+        file.write(pem)
+    return key
+
+
+def _public_bytes(key) -> bytes:
+    return key.public_bytes(serialization.Encoding.X962, serialization.PublicFormat.UncompressedPoint)
+
+
+class VapidSigner:
+    """Signs the VAPID token (RFC 8292) that identifies this server to push services"""
+    
+    def __init__(self, private_key: "ec.EllipticCurvePrivateKey", subject: str):
+        """
+        Initialize signer
+        Args:
+            private_key: The server's P-256 key; browsers subscribe against its public half
+            subject: Contact for push service operators (mailto: or https: URL)
+        """
+        self.private_key = private_key
+        self.subject = subject
+        self.public_key = b64url(_public_bytes(private_key.public_key()))
+        # Push service origin -> (expiry, token); a token is reused until half its lifetime is gone
+        self._tokens: dict[str, tuple[int, str]] = {}
+    
+    @classmethod
+    def from_environment(cls) -> Optional["VapidSigner"]:
+        """
+        Signer using MEDMITRA_VAPID_KEY_FILE (created on first start) and MEDMITRA_VAPID_SUBJECT
+        None, so push stays off, when cryptography is missing or no key file is configured.
+        """
+        path = os.environ.get("MEDMITRA_VAPID_KEY_FILE")
+        if not PUSH_AVAILABLE or not path:
+            return None
+        return cls(_load_or_create_key(path),
+                   os.environ.get("MEDMITRA_VAPID_SUBJECT", "mailto:admin@medmitra.local"))
+    
+    def authorization(self, endpoint: str) -> str:
+        """Authorization header value for a message to `endpoint`"""
+        parts = urlsplit(endpoint)
+        audience = f"{parts.scheme}://{parts.netloc}"
+        now = int(time_module.time())
+        cached = self._tokens.get(audience)
+        if cached is None or cached[0] - now < VAPID_TOKEN_LIFETIME // 2:
+            expires = now + VAPID_TOKEN_LIFETIME
+            cached = self._tokens[audience] = (
+                expires, self._sign({"aud": audience, "exp": expires, "sub": self.subject}))
+        return f"vapid t={cached[1]}, k={self.public_key}"
+    
+    def _sign(self, claims: dict) -> str:
+        """ES256 JWT: the signature is the raw 64-byte r || s, not DER"""
+        header = b64url(json.dumps({"typ": "JWT", "alg": "ES256"}, separators=(",", ":")).encode())
+        body = b64url(json.dumps(claims, separators=(",", ":")).encode())
+        signing_input = f"{header}.{body}".encode("ascii")
+        r, s = decode_dss_signature(self.private_key.sign(signing_input, ec.ECDSA(hashes.SHA256())))
+        return f"{header}.{body}.{b64url(r.to_bytes(32, 'big') + s.to_bytes(32, 'big'))}"
+
+
+def _hkdf(salt: bytes, ikm: bytes, info: bytes, length: int) -> bytes:
+    """HKDF-SHA256 with a single expand block (length <= 32)"""
+    prk = hmac.new(salt, ikm, hashlib.sha256).digest()
+    return hmac.new(prk, info + b"\x01", hashlib.sha256).digest()[:length]
+
+
+def encrypt(payload: bytes, subscription: PushSubscription) -> bytes:
+    """Encrypt a message to a subscription's keys (RFC 8291, aes128gcm content coding)"""
+    if len(payload) > MAX_PAYLOAD:
+        raise ValueError(f"Push payload of {len(payload)} bytes exceeds {MAX_PAYLOAD}")
+    client_public = b64url_decode(subscription.p256dh)
+    auth_secret = b64url_decode(subscription.auth)
+    # A fresh key pair per message, so every message has its own content key
+    server_key = ec.generate_private_key(ec.SECP256R1())
+    server_public = _public_bytes(server_key.public_key())
+    shared = server_key.exchange(
+        ec.ECDH(), ec.EllipticCurvePublicKey.from_encoded_point(ec.SECP256R1(), client_public))
+    
+    ikm = _hkdf(auth_secret, shared, b"WebPush: info\x00" + client_public + server_public, 32)
+    salt = os.urandom(16)
+    key = _hkdf(salt, ikm, b"Content-Encoding: aes128gcm\x00", 16)
+    nonce = _hkdf(salt, ikm, b"Content-Encoding: nonce\x00", 12)
+    # One record: the payload followed by the last-record delimiter
+    ciphertext = AESGCM(key).encrypt(nonce, payload + b"\x02", None)
+    return salt + struct.pack("!IB", RECORD_SIZE, len(server_public)) + server_public + ciphertext
+
+
+class PushTransport:
+    """Posts an encrypted message to a push service and returns the HTTP status"""
+    
+    name = "base"
+    
+    def post(self, endpoint: str, headers: dict[str, str], body: bytes) -> int:
+        raise NotImplementedError
+
+
+class HttpPushTransport(PushTransport):
+    """Posts to the browser vendor's push service over HTTPS"""
+    
+    name = "http"
+    
+    def __init__(self, timeout: float = 10.0):
+        self.timeout = timeout
+    
+    def post(self, endpoint: str, headers: dict[str, str], body: bytes) -> int:
+        request = urllib.request.Request(endpoint, data=body, headers=headers, method="POST")
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+
+class StubPushTransport(PushTransport):
+    """Keeps messages in memory instead of posting them; endpoints in `gone` answer 410 (for tests)"""
+    
+    name = "stub"
+    
+    def __init__(self):
+        self.sent: list[tuple[str, dict[str, str], bytes]] = []
+        self.gone: set[str] = set()
+    
+    def post(self, endpoint: str, headers: dict[str, str], body: bytes) -> int:
+        if endpoint in self.gone:
+            return 410
+        self.sent.append((endpoint, headers, body))
+        return 201
+
+
+PUSH_TRANSPORTS = {transport.name: transport for transport in (HttpPushTransport, StubPushTransport)}
+
+
+def load_push_transport(spec: str) -> PushTransport:
+    """Build a push transport from a registered name or a "package.module:ClassName" path"""
+    if ":" in spec:
+        module_name, class_name = spec.split(":", 1)
+        return getattr(importlib.import_module(module_name), class_name)()
+    if spec not in PUSH_TRANSPORTS:
+        raise ValueError(f"Unknown push transport '{spec}'")
+    return PUSH_TRANSPORTS[spec]()
+
+
+class _PushJob:
+    """A message waiting to go to one device"""
+    
+    __slots__ = ("store", "subscription", "payload", "attempt", "queued_at")
+    
+    def __init__(self, store: SubscriptionStore, subscription: PushSubscription, payload: bytes):
+        self.store = store
+        self.subscription = subscription
+        self.payload = payload
+        self.attempt = 0
+        self.queued_at = time_module.monotonic()
+
+
+class PushDispatcher:
+    """Sends Web Push messages from a background thread, a batch of concurrent requests at a time"""
+    
+    def __init__(self, signer: Optional[VapidSigner], transport: PushTransport, batch_size: int = 50,
+                 workers: int = 8, max_retries: int = 3, retry_delay: float = 5.0, ttl: int = PUSH_TTL):
+        """
+        Initialize dispatcher
+        Args:
+            signer: VAPID signer; without one, push is disabled and submit() does nothing
+            transport: How messages reach push services
+            batch_size: Most messages taken off the queue per wake-up
+            workers: Requests in flight at once within a batch
+            max_retries: Sends that fail with 429/5xx or a network error are retried this often
+            retry_delay: First retry delay in seconds; doubles on every further failure
+            ttl: Seconds a push service should hold a message for an offline device
+        """
+        self.signer = signer
+        self.transport = transport
+        self.batch_size = batch_size
+        self.workers = workers
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.ttl = ttl
+        self.running = False
+        # Endpoint -> queued job; a newer message for a device replaces the one still queued
+        self._queue: "OrderedDict[str, _PushJob]" = OrderedDict()
+        # Min-heap of (due, seq, job) for failed sends
+        self._retries: list[tuple[float, int, _PushJob]] = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+    
+    @classmethod
+    def from_environment(cls) -> "PushDispatcher":
+        """Dispatcher configured by MEDMITRA_PUSH_TRANSPORT (http or stub) and the VAPID settings"""
+        return cls(VapidSigner.from_environment(),
+                   load_push_transport(os.environ.get("MEDMITRA_PUSH_TRANSPORT", "http")),
+                   batch_size=int(os.environ.get("MEDMITRA_PUSH_BATCH_SIZE", 50)))
+    
+    @property
+    def enabled(self) -> bool:
+        return self.signer is not None
+    
+    def start(self):
+        """Start the delivery thread"""
+        if self.running or not self.enabled:
+            return
+        self.running = True
+        self._executor = ThreadPoolExecutor(max_workers=self.workers)
+        self._thread = threading.Thread(target=self._dispatch_loop, daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        """Stop the delivery thread; queued messages are dropped (reminders would be stale anyway)"""
+        with self._condition:
+            self.running = False
+            self._condition.notify()
+        if self._thread:
+            self._thread.join(timeout=5)
+        if self._executor:
+            self._executor.shutdown(wait=False)
+    
+    def submit(self, store: SubscriptionStore, payload: dict) -> int:
+        """
+        Queue a message for every device a patient has subscribed
+        Returns the number of devices it was queued for
+        """
+        if not self.enabled:
+            return 0
+        body = json.dumps(payload).encode("utf-8")
+        if len(body) > MAX_PAYLOAD:
+            print(f"Error queueing push: payload of {len(body)} bytes exceeds {MAX_PAYLOAD}")
+            return 0
+        subscriptions = store.active()
+        with self._condition:
+            for subscription in subscriptions:
+                job = self._queue.get(subscription.endpoint)
+                if job:
+                    job.payload = body
+                else:
+                    self._queue[subscription.endpoint] = _PushJob(store, subscription, body)
+            self._condition.notify()
+        return len(subscriptions)
+    
+    def pending(self) -> int:
+        """Number of messages not yet accepted by a push service"""
+        with self._condition:
+            return len(self._queue) + len(self._retries)
+    
+    def _dispatch_loop(self):
+        while True:
+            with self._condition:
+                while self.running and not self._queue and not self._retry_due():
+                    self._condition.wait(self._retries[0][0] - time_module.monotonic() if self._retries else None)
+                if not self.running:
+                    return
+                batch = []
+                while self._retry_due() and len(batch) < self.batch_size:
+                    batch.append(heapq.heappop(self._retries)[2])
+                while self._queue and len(batch) < self.batch_size:
+                    batch.append(self._queue.popitem(last=False)[1])
+            self._send_batch(batch)
+    
+    def _retry_due(self) -> bool:
+        return bool(self._retries) and self._retries[0][0] <= time_module.monotonic()
+    
+    def _send_batch(self, batch: list[_PushJob]):
+        """Send a batch concurrently, then drop gone subscriptions and reschedule failures"""
+        for job, status in zip(batch, self._executor.map(self._post, batch)):
+            endpoint = job.subscription.endpoint
+            if 200 <= status < 300:
+                PUSH_SENT.inc()
+                PUSH_LATENCY.observe(time_module.monotonic() - job.queued_at)
+            elif status in (404, 410):
+                # The browser unsubscribed or the subscription expired
+                PUSH_EXPIRED.inc()
+                job.store.remove(endpoint)
+            else:
+                PUSH_FAILURES.inc()
+                job.attempt += 1
+                if status == UNSENDABLE:
+                    continue
+                retryable = status == 0 or status == 429 or status >= 500
+                if not retryable or job.attempt > self.max_retries:
+                    print(f"Error sending push to {endpoint}: status {status}")
+                    continue
+                with self._condition:
+                    due = time_module.monotonic() + self.retry_delay * 2 ** (job.attempt - 1)
+                    heapq.heappush(self._retries, (due, next(self._sequence), job))
+    
+    def _post(self, job: _PushJob) -> int:
+        """Encrypt, sign and post one message; network errors count as status 0"""
+        endpoint = job.subscription.endpoint
+        try:
+            body = encrypt(job.payload, job.subscription)
+        except ValueError as e:
+            print(f"Error encrypting push to {endpoint}: {e}")
+            return UNSENDABLE
+        try:
+            headers = {
+                "Authorization": self.signer.authorization(endpoint),
+                "Content-Encoding": "aes128gcm",
+                "Content-Type": "application/octet-stream",
+                "TTL": str(self.ttl),
+                "Urgency": "high"
+            }
+            return self.transport.post(endpoint, headers, body)
+        except Exception as e:
+            print(f"Error sending push to {endpoint}: {e}")
+            return 0
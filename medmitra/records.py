@@ -0,0 +1,300 @@
+"""
+Indexed storage for medication intake records
+Keeps records ordered by scheduled time with per-medication, per-day lookups
+"""
+import itertools
+import os
+import threading
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+from typing import TYPE_CHECKING, Iterable, Iterator, Optional
+
+if TYPE_CHECKING:
+    from .medication import MedicationRecord
+
+
+# Position of a record in scheduled order: (scheduled_time, insertion sequence).
+# The sequence breaks ties between doses scheduled at the same minute.
+RecordKey = tuple[datetime, int]
+
+# Detailed records older than this many days are rolled into DailySummary totals
+RECORD_RETENTION_DAYS = int(os.environ.get("MEDMITRA_RETENTION_DAYS", 90))
+
+
+@dataclass
+class DailySummary:
+    """Adherence totals for one medication on one day, kept after its records are compacted"""
+    medication_name: str
+    day: date
+    scheduled: int = 0
+    taken: int = 0
+    missed: int = 0
+
+
+class _TimeIndex:
+    """Records ordered by RecordKey"""
+    
+    __slots__ = ("keys", "records")
+    
+    def __init__(self):
+        self.keys: list[RecordKey] = []
+        self.records: list["MedicationRecord"] = []
+    
+    def add(self, key: RecordKey, record: "MedicationRecord"):
+        position = bisect_right(self.keys, key)
+        self.keys.insert(position, key)
+        self.records.insert(position, record)
+    
+    def newest_first(self, before: Optional[RecordKey] = None,
+                     not_before: Optional[datetime] = None) -> Iterator[tuple[RecordKey, "MedicationRecord"]]:
+        """Iterate newest first over keys < before and scheduled at or after not_before"""
+        start = bisect_left(self.keys, before) if before else len(self.keys)
+        stop = bisect_left(self.keys, (not_before, -1)) if not_before else 0
+        for index in range(start - 1, stop - 1, -1):
+            yield self.keys[index], self.records[index]
+    
+    def remove(self, key: RecordKey):
+        position = bisect_left(self.keys, key)
+        if position < len(self.keys) and self.keys[position] == key:
+            del self.keys[position]
+            del self.records[position]
+    
+    def drop_before(self, key: RecordKey) -> list["MedicationRecord"]:
+        """Remove and return every record ordered before `key`"""
+        position = bisect_left(self.keys, key)
+        dropped = self.records[:position]
+        del self.keys[:position]
+        del self.records[:position]
+        return dropped
+
+
+class RecordStore:
+    """
+    MedicationRecords indexed by (medication name, scheduled date), ordered by scheduled_time
+    Each store (one per patient) has its own lock, so writers for different patients never
+    contend; record fields change only through the store so taken/missed updates can't race.
+    """
+    
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._sequence = itertools.count()
+        self._all = _TimeIndex()
+        self._by_name: dict[str, _TimeIndex] = {}
+        # (medication name or None for all, status) -> records with that status, so filtered
+        # history pages walk only matching records; _keys finds a record's entry when it moves
+        self._by_status: dict[tuple[Optional[str], str], _TimeIndex] = {}
+        self._keys: dict[int, RecordKey] = {}
+        # (medication name, scheduled date) -> that day's doses, in order
+        self._by_day: dict[tuple[str, date], list["MedicationRecord"]] = {}
+        # medication name -> doses not yet taken, in order (taken ones are dropped lazily)
+        self._open: dict[str, list["MedicationRecord"]] = {}
+        # (medication name, day) -> totals for days whose records were compacted away
+        self.summaries: dict[tuple[str, date], DailySummary] = {}
+    
+    def add(self, record: "MedicationRecord"):
+        """Add a record, keeping every index in scheduled_time order"""
+        name = record.medication.name
+        with self._lock:
+            key = (record.scheduled_time, next(self._sequence))
+            self._all.add(key, record)
+            self._by_name.setdefault(name, _TimeIndex()).add(key, record)
+            self._keys[id(record)] = key
+            self._index_status(key, record, record_status(record))
+            _insert_ordered(self._by_day.setdefault((name, record.scheduled_time.date()), []), record)
+            if not record.taken:
+                _insert_ordered(self._open.setdefault(name, []), record)
+    
+    def extend(self, records: Iterable["MedicationRecord"]):
+        """Add several records"""
+        for record in records:
+            self.add(record)
+    
+    def latest_open(self, medication_name: str) -> Optional["MedicationRecord"]:
+        """Get the most recently scheduled dose of a medication that isn't taken yet"""
+        with self._lock:
+            open_records = self._open.get(medication_name)
+            while open_records:
+                record = open_records[-1]
+                if not record.taken:
+                    return record
+                open_records.pop()
+            return None
+    
+    def mark_taken(self, medication_name: str, taken_time: datetime) -> Optional["MedicationRecord"]:
+        """Mark the most recent untaken dose of a medication as taken"""
+        with self._lock:
+            record = self.latest_open(medication_name)
+            if record is None:
+                return None
+            self.mark_record_taken(record, taken_time)
+            return record
+    
+    def mark_record_taken(self, record: "MedicationRecord", taken_time: datetime) -> bool:
+        """Mark a specific dose taken; returns False if it already was"""
+        with self._lock:
+            if record.taken:
+                return False
+            status = record_status(record)
+            record.taken = True
+            record.taken_time = taken_time
+            record.missed = False
+            self._restatus(record, status)
+            return True
+    
+    def mark_record_missed(self, record: "MedicationRecord") -> bool:
+        """Flag an untaken dose as missed; returns False if it was taken or already missed"""
+        with self._lock:
+            if record.taken or record.missed:
+                return False
+            record.missed = True
+            self._restatus(record, "pending")
+            return True
+    
+    def _index_status(self, key: RecordKey, record: "MedicationRecord", status: str):
+        for name in (None, record.medication.name):
+            self._by_status.setdefault((name, status), _TimeIndex()).add(key, record)
+    
+    def _restatus(self, record: "MedicationRecord", old_status: str):
+        """Move a record whose status changed to its new status index (caller holds the lock)"""
+        key = self._keys.get(id(record))
+        if key is None:
+            # Not added yet (or compacted away); add() indexes it by its status then
+            return
+        for name in (None, record.medication.name):
+            self._by_status[(name, old_status)].remove(key)
+        self._index_status(key, record, record_status(record))
+    
+    def count_reminder(self, record: "MedicationRecord"):
+        """Count one more reminder sent for a dose"""
+        with self._lock:
+            record.reminder_count += 1
+    
+    def for_day(self, medication_name: str, day: date) -> list["MedicationRecord"]:
+        """Get a medication's doses scheduled on a given day"""
+        with self._lock:
+            return list(self._by_day.get((medication_name, day), ()))
+    
+    def since(self, medication_name: str, start: datetime) -> list["MedicationRecord"]:
+        """Get a medication's doses scheduled at or after `start`, newest first"""
+        with self._lock:
+            index = self._by_name.get(medication_name)
+            if index is None:
+                return []
+            return [record for _, record in index.newest_first(not_before=start)]
+    
+    def missed_count(self, medication_name: str, until: date, days: int = 1) -> int:
+        """Count missed doses of a medication over the given number of days ending on `until`"""
+        count = 0
+        for offset in range(days):
+            key = (medication_name, until - timedelta(days=offset))
+            day_records = self._by_day.get(key)
+            if day_records is not None:
+                count += sum(1 for record in day_records if record.missed)
+            elif key in self.summaries:
+                count += self.summaries[key].missed
+        return count
+    
+    def compact(self, before: date) -> int:
+        """
+        Roll every record scheduled before `before` into per-day summaries
+        Returns the number of records removed from memory
+        """
+        cutoff = (datetime.combine(before, time()), -1)
+        with self._lock:
+            dropped = self._all.drop_before(cutoff)
+            if not dropped:
+                return 0
+            for indexes in (self._by_name, self._by_status):
+                for name in list(indexes):
+                    indexes[name].drop_before(cutoff)
+                    if not indexes[name].keys:
+                        del indexes[name]
+            for name in list(self._open):
+                open_records = self._open[name]
+                stale = 0
+                while stale < len(open_records) and open_records[stale].scheduled_time < cutoff[0]:
+                    stale += 1
+                del open_records[:stale]
+            for record in dropped:
+                del self._keys[id(record)]
+                name = record.medication.name
+                day = record.scheduled_time.date()
+                self._by_day.pop((name, day), None)
+                summary = self.summaries.setdefault((name, day), DailySummary(name, day))
+                summary.scheduled += 1
+                summary.taken += record.taken
+                summary.missed += record.missed
+            return len(dropped)
+    
+    def add_summary(self, summary: DailySummary):
+        """Restore a day's totals (from storage), merging with any already present"""
+        with self._lock:
+            existing = self.summaries.setdefault((summary.medication_name, summary.day),
+                                                 DailySummary(summary.medication_name, summary.day))
+            existing.scheduled += summary.scheduled
+            existing.taken += summary.taken
+            existing.missed += summary.missed
+    
+    def recent(self, limit: Optional[int] = None) -> list["MedicationRecord"]:
+        """Get records newest first, optionally stopping after `limit`"""
+        with self._lock:
+            return [record for _, record in itertools.islice(self._all.newest_first(), limit)]
+    
+    def page(self, limit: int, before: Optional[RecordKey] = None,
+             medication_name: Optional[str] = None, start: Optional[datetime] = None,
+             end: Optional[datetime] = None, status: Optional[str] = None
+             ) -> tuple[list["MedicationRecord"], Optional[RecordKey]]:
+        """
+        Get one page of history, newest first
+        Args:
+            limit: Maximum records to return
+            before: Cursor from the previous page (only older records are returned)
+            medication_name: Only this medication
+            start: Only doses scheduled at or after this time
+            end: Only doses scheduled before this time
+            status: Only "taken", "missed" or "pending" doses
+        Returns: (records, cursor for the next page or None when exhausted)
+        """
+        if end is not None:
+            end_key = (end, -1)
+            before = min(before, end_key) if before else end_key
+        
+        records: list["MedicationRecord"] = []
+        last_key = None
+        with self._lock:
+            if status:
+                index = self._by_status.get((medication_name, status))
+            else:
+                index = self._all if medication_name is None else self._by_name.get(medication_name)
+            if index is None:
+                return [], None
+            # Every record the index yields matches, so this reads at most limit + 1 of them
+            for key, record in index.newest_first(before, start):
+                if len(records) == limit:
+                    return records, last_key
+                records.append(record)
+                last_key = key
+        return records, None
+    
+    def __iter__(self) -> Iterator["MedicationRecord"]:
+        with self._lock:
+            return iter(list(self._all.records))
+    
+    def __len__(self) -> int:
+        return len(self._all.records)
+
+
+def record_status(record: "MedicationRecord") -> str:
+    """Get a record's display status: taken, missed or pending"""
+    if record.taken:
+        return "taken"
+    return "missed" if record.missed else "pending"
+
+
+def _insert_ordered(records: list["MedicationRecord"], record: "MedicationRecord"):
+    """Insert keeping scheduled_time order; O(1) for the usual in-order append"""
+    index = len(records)
+    while index > 0 and records[index - 1].scheduled_time > record.scheduled_time:
+        index -= 1
+    records.insert(index, record)
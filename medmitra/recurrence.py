@@ -0,0 +1,250 @@
+"""
+Recurrence rules for MedMitra medication schedules
+RRULE-like rules (daily/weekly times, every N hours, weekdays-only, courses with an end date,
+tapering doses) compiled into an O(log n) next-occurrence calculator
+"""
+import heapq
+import itertools
+import math
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime, time, timedelta
+from typing import Iterable, Iterator, Optional, TypeVar
+
+T = TypeVar("T")
+
+WEEKDAYS = ["MO", "TU", "WE", "TH", "FR", "SA", "SU"]
+FREQUENCIES = ("DAILY", "WEEKLY", "HOURLY")
+
+# Day/hour counting for INTERVAL starts here when a rule has no DTSTART (a Monday)
+DEFAULT_ANCHOR = datetime(2001, 1, 1)
+HOURS_PER_WEEK = 7 * 24
+
+
+class Recurrence:
+    """
+    When a medication is due
+    Rules use RRULE syntax, e.g. "FREQ=DAILY;BYHOUR=8,20", "FREQ=HOURLY;INTERVAL=6",
+    "FREQ=WEEKLY;BYDAY=MO,TU,WE,TH,FR;BYHOUR=9;UNTIL=2026-12-31", plus
+    X-TAPER=<day>:<dosage>,... for doses that step down over a course.
+    """
+    
+    __slots__ = ("freq", "interval", "times", "weekdays", "start", "until", "taper",
+                 "_minutes", "_taper_days", "_cycle", "_steps")
+    
+    def __init__(self, freq: str = "DAILY", interval: int = 1, times: Iterable[time] = (),
+                 weekdays: Optional[Iterable[int]] = None, start: Optional[datetime] = None,
+                 until: Optional[date] = None, taper: Iterable[tuple[int, str]] = ()):
+        """
+        Initialize rule
+        Args:
+            freq: DAILY or WEEKLY (at `times` on matching days) or HOURLY (every `interval` hours)
+            interval: Every N days/weeks/hours, counted from `start`
+            times: Times of day for DAILY/WEEKLY rules; for HOURLY, only their hours
+                count (BYHOUR limits which hours a dose may fall in)
+            weekdays: Allowed weekdays (0 = Monday); None allows every day
+            start: First moment the course can be due (also anchors INTERVAL)
+            until: Last day of the course
+            taper: (days since start, dosage) steps for doses that change over the course
+        """
+        freq = freq.upper()
+        if freq not in FREQUENCIES:
+            raise ValueError(f"Unsupported FREQ '{freq}'")
+        if interval < 1:
+            raise ValueError("INTERVAL must be at least 1")
+        self.freq = freq
+        self.interval = interval
+        self.times = tuple(sorted(set(times)))
+        if freq != "HOURLY" and not self.times:
+            raise ValueError(f"FREQ={freq} needs BYHOUR")
+        if weekdays is None and freq == "WEEKLY":
+            # As in RRULE, a weekly rule without BYDAY repeats on its start's weekday
+            weekdays = [(start or DEFAULT_ANCHOR).weekday()]
+        self.weekdays = frozenset(weekdays) if weekdays is not None else None
+        if self.weekdays is not None and not self.weekdays:
+            raise ValueError("BYDAY must name at least one day")
+        self.start = start
+        self.until = until
+        self.taper = tuple(sorted(taper))
+        # Compiled forms: minutes after midnight, and taper day offsets, for bisection
+        self._minutes = [t.hour * 60 + t.minute for t in self.times]
+        self._taper_days = [day for day, _ in self.taper]
+        self._cycle, self._steps = self._compile_hourly() if freq == "HOURLY" else (1, [0])
+    
+    @classmethod
+    def daily_at(cls, at: time) -> "Recurrence":
+        """Once a day at a fixed time (what a plain TimeSlot means)"""
+        return cls("DAILY", times=[at])
+    
+    @classmethod
+    def parse(cls, rule: str) -> "Recurrence":
+        """Build a rule from its RRULE-style text"""
+        parts = {}
+        for part in rule.strip().removeprefix("RRULE:").split(";"):
+            if part.strip():
+                key, _, value = part.partition("=")
+                parts[key.strip().upper()] = value.strip()
+        
+        hours = [int(hour) for hour in parts["BYHOUR"].split(",")] if "BYHOUR" in parts else []
+        minutes = [int(minute) for minute in parts["BYMINUTE"].split(",")] if "BYMINUTE" in parts else [0]
+        weekdays = None
+        if "BYDAY" in parts:
+            try:
+                weekdays = [WEEKDAYS.index(day.strip().upper()) for day in parts["BYDAY"].split(",")]
+            except ValueError:
+                raise ValueError(f"Unknown day in BYDAY={parts['BYDAY']}")
+        times = [time(hour, minute) for hour, minute in itertools.product(hours, minutes)]
+        times += [time.fromisoformat(value.strip())
+                  for value in filter(None, parts.get("X-BYTIME", "").split(","))]
+        taper = []
+        for step in filter(None, parts.get("X-TAPER", "").split(",")):
+            day, _, dosage = step.partition(":")
+            taper.append((int(day), dosage.strip()))
+        
+        return cls(freq=parts.get("FREQ", "DAILY"),
+                   interval=int(parts.get("INTERVAL", 1)),
+                   times=times,
+                   weekdays=weekdays,
+                   start=datetime.fromisoformat(parts["DTSTART"]) if "DTSTART" in parts else None,
+                   until=date.fromisoformat(parts["UNTIL"][:10]) if "UNTIL" in parts else None,
+                   taper=taper)
+    
+    def __str__(self) -> str:
+        parts = [f"FREQ={self.freq}"]
+        if self.interval != 1:
+            parts.append(f"INTERVAL={self.interval}")
+        if self.times:
+            hours = sorted({t.hour for t in self.times})
+            minutes = sorted({t.minute for t in self.times})
+            if len(hours) * len(minutes) == len(self.times):
+                parts.append("BYHOUR=" + ",".join(map(str, hours)))
+                if minutes != [0]:
+                    parts.append("BYMINUTE=" + ",".join(map(str, minutes)))
+            else:
+                # Times that aren't an hour x minute grid can't be written as
+                # BYHOUR/BYMINUTE, so spell them out with the X-BYTIME extension
+                parts.append("X-BYTIME=" + ",".join(t.strftime("%H:%M") for t in self.times))
+        if self.weekdays is not None:
+            parts.append("BYDAY=" + ",".join(WEEKDAYS[day] for day in sorted(self.weekdays)))
+        if self.start:
+            parts.append(f"DTSTART={self.start.isoformat()}")
+        if self.until:
+            parts.append(f"UNTIL={self.until.isoformat()}")
+        if self.taper:
+            parts.append("X-TAPER=" + ",".join(f"{day}:{dosage}" for day, dosage in self.taper))
+        return ";".join(parts)
+    
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Recurrence) and str(self) == str(other)
+    
+    def __hash__(self) -> int:
+        return hash(str(self))
+    
+    def next_after(self, after: datetime) -> Optional[datetime]:
+        """Get the first occurrence strictly after `after`, or None once the course has ended"""
+        if self.start and after < self.start:
+            after = self.start - timedelta(microseconds=1)
+        if self.freq == "HOURLY":
+            occurrence = self._next_hourly(after)
+        else:
+            occurrence = self._next_daily(after)
+        if occurrence is None or (self.until and occurrence.date() > self.until):
+            return None
+        return occurrence
+    
+    def first_time(self) -> time:
+        """Time of day of the first dose (used to pick a greeting/time slot)"""
+        if self.times:
+            return self.times[0]
+        return (self.start or DEFAULT_ANCHOR).time()
+    
+    def dosage_on(self, day: date, default: str) -> str:
+        """Dosage for a day of a tapering course (`default` outside the taper steps)"""
+        if not self.taper:
+            return default
+        anchor = (self.start or DEFAULT_ANCHOR).date()
+        index = bisect_right(self._taper_days, (day - anchor).days) - 1
+        return self.taper[index][1] if index >= 0 else default
+    
+    def _day_matches(self, day: date) -> bool:
+        if self.weekdays is not None and day.weekday() not in self.weekdays:
+            return False
+        if self.interval == 1:
+            return True
+        anchor = (self.start or DEFAULT_ANCHOR).date()
+        if self.freq == "WEEKLY":
+            anchor -= timedelta(days=anchor.weekday())
+            return ((day - anchor).days // 7) % self.interval == 0
+        return (day - anchor).days % self.interval == 0
+    
+    def _next_daily(self, after: datetime) -> Optional[datetime]:
+        day = after.date()
+        # Later today, if a time remains (times are whole minutes, so this is strictly after)
+        index = bisect_right(self._minutes, after.hour * 60 + after.minute)
+        if index < len(self._minutes) and self._day_matches(day):
+            return datetime.combine(day, self.times[index])
+        # Otherwise the first time on the next matching day; any rule repeats within this bound
+        for _ in range(7 * self.interval):
+            day += timedelta(days=1)
+            if self.until and day > self.until:
+                return None
+            if self._day_matches(day):
+                return datetime.combine(day, self.times[0])
+        return None
+    
+    def _compile_hourly(self) -> tuple[int, list[int]]:
+        """
+        Which steps of an HOURLY rule fall on an allowed weekday and hour
+        A step's hour of the week repeats every `cycle` steps, so the allowed ones are
+        listed as offsets within one cycle.
+        Returns: (cycle length in steps, sorted allowed offsets)
+        """
+        anchor = self.start or DEFAULT_ANCHOR
+        first_hour = anchor.weekday() * 24 + anchor.hour
+        cycle = HOURS_PER_WEEK // math.gcd(self.interval, HOURS_PER_WEEK)
+        hours = {t.hour for t in self.times} or None
+        steps = []
+        for offset in range(cycle):
+            day, hour = divmod((first_hour + offset * self.interval) % HOURS_PER_WEEK, 24)
+            if (self.weekdays is None or day in self.weekdays) and (hours is None or hour in hours):
+                steps.append(offset)
+        return cycle, steps
+    
+    def _next_hourly(self, after: datetime) -> Optional[datetime]:
+        if not self._steps:
+            # No step ever lands on an allowed day and hour
+            return None
+        anchor = self.start or DEFAULT_ANCHOR
+        step = timedelta(hours=self.interval)
+        count = (after - anchor) // step + 1
+        # Jump straight to the next allowed step in this cycle, or the first in the next one
+        cycle_start = count - count % self._cycle
+        index = bisect_left(self._steps, count - cycle_start)
+        if index == len(self._steps):
+            cycle_start += self._cycle
+            index = 0
+        return anchor + (cycle_start + self._steps[index]) * step
+
+
+def merge_occurrences(schedules: Iterable[tuple[Recurrence, T]], start: datetime,
+                      end: datetime) -> Iterator[tuple[datetime, T]]:
+    """
+    Yield every (occurrence, item) in [start, end) across many schedules, in time order
+    Only occurrences actually inside the window are computed: O(n + k log n) for n
+    schedules and k occurrences.
+    """
+    heap = []
+    tiebreak = itertools.count()
+    before_start = start - timedelta(microseconds=1)
+    for recurrence, item in schedules:
+        occurrence = recurrence.next_after(before_start)
+        if occurrence is not None and occurrence < end:
+            heap.append((occurrence, next(tiebreak), recurrence, item))
+    heapq.heapify(heap)
+    while heap:
+        occurrence, _, recurrence, item = heap[0]
+        yield occurrence, item
+        following = recurrence.next_after(occurrence)
+        if following is not None and following < end:
+            heapq.heapreplace(heap, (following, next(tiebreak), recurrence, item))
+        else:
+            heapq.heappop(heap)
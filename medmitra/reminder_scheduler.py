@@ -2,32 +2,139 @@
 Reminder scheduling system for MedMitra
 Manages time-based medication reminders
 """
+import heapq
+import itertools
 import threading
-import time as time_module
-from datetime import datetime, time
+import warnings
+from datetime import date, datetime, timedelta
+from enum import Enum
 from typing import Callable, Optional
-from .medication import Medication, MedicationManager, MedicationRecord, TimeSlot
+from .medication import Medication, MedicationManager, MedicationRecord
+from .metrics import DELAY_BUCKETS, REGISTRY
+from .records import RECORD_RETENTION_DAYS
+from .timezones import to_local, to_utc, utc_now
+
+
+# A reminder that comes due within this window is still delivered (matches the
+# old +/- 5 minute polling window); anything staler is skipped and re-armed.
+DUE_GRACE = timedelta(minutes=5)
+
+# Upper bound on a single sleep so wall-clock jumps (NTP, suspend) are noticed.
+MAX_SLEEP_SECONDS = 300
+
+FIRE_DELAY = REGISTRY.histogram("medmitra_reminder_fire_delay_seconds",
+                                "How late reminders fire relative to their scheduled time",
+                                buckets=DELAY_BUCKETS)
+REMINDERS_SENT = REGISTRY.counter("medmitra_reminders_sent_total",
+                                  "Reminders delivered, by first or repeated reminder", ("kind",))
+
+# A snoozed ("Nahi") or unanswered reminder is repeated after this long (the reply
+# promises "10 minute baad"), up to MAX_REMINDERS reminders per dose in total.
+SNOOZE_INTERVAL = timedelta(minutes=10)
+MAX_REMINDERS = 3
+
+# A dose still untaken this long after its scheduled time is marked missed. Escalation
+# (reminders running out, about 30 minutes in) only tells the caregiver; the patient can
+# still take the dose until this deadline.
+MISSED_AFTER = timedelta(hours=1)
+
+# Answers ("Haan", "Nahi") apply to the latest dose scheduled within this window, so a
+# dose due just before midnight can still be answered after it
+ANSWER_WINDOW = timedelta(hours=24)
+
+
+class DoseState(Enum):
+    """Where a dose is in its reminder lifecycle"""
+    DUE = "due"
+    REMINDED = "reminded"
+    SNOOZED = "snoozed"
+    REREMINDED = "re-reminded"
+    TAKEN = "taken"
+    MISSED = "missed"
+    ESCALATED = "escalated"
+
+
+# States whose dose still has a follow-up timer armed
+ACTIVE_DOSE_STATES = (DoseState.REMINDED, DoseState.SNOOZED, DoseState.REREMINDED)
+
+
+class _Dose:
+    """A reminded dose; `seq` identifies its one live follow-up timer (None when disarmed)"""
+    
+    __slots__ = ("record", "manager", "state", "seq")
+    
+    def __init__(self, record: MedicationRecord, manager: MedicationManager):
+        self.record = record
+        self.manager = manager
+        self.state = DoseState.DUE
+        self.seq: Optional[int] = None
 
 
 class ReminderScheduler:
     """Manages scheduled medication reminders"""
     
-    def __init__(self, medication_manager: MedicationManager, 
+    def __init__(self, medication_manager: Optional[MedicationManager],
                  reminder_callback: Callable[[Medication], None],
-                 check_interval: int = 30):
+                 check_interval: Optional[int] = None,
+                 retention_days: int = RECORD_RETENTION_DAYS,
+                 escalation_callback: Optional[Callable[[MedicationRecord], None]] = None,
+                 snooze_interval: timedelta = SNOOZE_INTERVAL, max_reminders: int = MAX_REMINDERS,
+                 missed_callback: Optional[Callable[[MedicationRecord], None]] = None,
+                 missed_after: timedelta = MISSED_AFTER):
         """
         Initialize scheduler
         Args:
-            medication_manager: Manager for medications
-            reminder_callback: Function to call when reminder is due
-            check_interval: How often to check for due medications (in seconds)
+            medication_manager: Manager for medications (more can be added with attach_manager)
+            reminder_callback: Function to call when reminder is due (and for each repeat)
+            check_interval: Deprecated and ignored; the scheduler sleeps until the next deadline
+            retention_days: Days of detailed dose records to keep in memory; older ones are
+                rolled into daily summaries once a day
+            escalation_callback: Called with a dose's record once its reminders run out untaken
+            snooze_interval: Delay before a snoozed or unanswered reminder is repeated
+            max_reminders: Reminders sent for a dose before it is escalated
+            missed_callback: Called with a dose's record once, when it becomes missed without
+                having been escalated (the caregiver already heard about an escalated dose)
+            missed_after: How long after its scheduled time an untaken dose counts as missed
         """
+        if check_interval is not None:
+            warnings.warn("ReminderScheduler(check_interval=...) is deprecated and ignored",
+                          DeprecationWarning, stacklevel=2)
         self.medication_manager = medication_manager
         self.reminder_callback = reminder_callback
-        self.check_interval = check_interval
+        self.retention_days = retention_days
+        self.escalation_callback = escalation_callback
+        self.snooze_interval = snooze_interval
+        self.max_reminders = max_reminders
+        self.missed_callback = missed_callback
+        self.missed_after = missed_after
+        self._compacted_on: Optional[date] = None
+        self._evicted_at: Optional[datetime] = None
         self.running = False
         self.scheduler_thread: Optional[threading.Thread] = None
+        # pending_reminders and _managers are shared with request threads; guard them with _condition
         self.pending_reminders: dict[str, MedicationRecord] = {}
+        self._managers: dict[str, MedicationManager] = {}
+        
+        # Deadline index, bucketed by UTC instant: patients whose local slots coincide
+        # (e.g. 08:00 in the same zone) share one bucket, so the heap holds one key per
+        # distinct instant and a tick touches only the buckets that are due.
+        # Bucket entries are (seq, medication, manager, local scheduled time). Entries are
+        # never removed in place; one is live only while _armed maps its medication to
+        # (seq, bucket), and _live counts a bucket's live entries.
+        self._deadlines: list[datetime] = []
+        self._buckets: dict[datetime, list[tuple[int, Medication, MedicationManager, datetime]]] = {}
+        self._live: dict[datetime, int] = {}
+        self._armed: dict[int, tuple[int, datetime]] = {}
+        # Follow-up timers for reminded doses: min-heap of (fire_at, seq, dose), live
+        # only while dose.seq == seq. Waiting doses cost nothing until their deadline.
+        self._dose_timers: list[tuple[datetime, int, _Dose]] = []
+        self._doses: dict[str, _Dose] = {}
+        # Miss deadlines: min-heap of (UTC miss-at time, seq, record, manager), one per
+        # reminded dose. Doses taken in time are skipped when their deadline comes up;
+        # escalated doses stay in _doses until then so the deadline knows not to alert again.
+        self._miss_deadlines: list[tuple[datetime, int, MedicationRecord, MedicationManager]] = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
     
     def start(self):
         """Start the reminder scheduler"""
@@ -35,77 +142,401 @@ class ReminderScheduler:
             return
         
         self.running = True
+        if self.medication_manager is not None:
+            self.attach_manager(self.medication_manager)
         self.scheduler_thread = threading.Thread(target=self._scheduler_loop, daemon=True)
         self.scheduler_thread.start()
         print("MedMitra reminder scheduler started.")
     
     def stop(self):
         """Stop the reminder scheduler"""
-        self.running = False
+        with self._condition:
+            self.running = False
+            self._condition.notify()
         if self.scheduler_thread:
             self.scheduler_thread.join(timeout=2)
         print("MedMitra reminder scheduler stopped.")
     
+    def attach_manager(self, manager: MedicationManager):
+        """Arm (or re-arm, e.g. after a timezone change) reminders for a patient's medications"""
+        today = manager.now().date()
+        with self._condition:
+            self._managers[manager.patient_id] = manager
+            for medication in manager.medications:
+                # Doses already recorded today (e.g. before a restart) must not fire again
+                for record in manager.records.for_day(medication.name, today):
+                    key = self._reminder_key(medication, record.scheduled_time)
+                    if key not in self.pending_reminders and not (record.taken or record.missed):
+                        self._arm_miss(record, manager)
+                    self.pending_reminders[key] = record
+        for medication in manager.medications:
+            self.schedule_medication(medication, manager)
+    
+    def schedule_medication(self, medication: Medication,
+                            manager: Optional[MedicationManager] = None):
+        """Arm (or re-arm) the next reminder for a medication"""
+        manager = manager or self.medication_manager
+        with self._condition:
+            self._managers.setdefault(manager.patient_id, manager)
+        # Schedules are in the patient's wall-clock time; DST and zone offsets apply per dose
+        occurrence = medication.next_occurrence(manager.now() - DUE_GRACE)
+        if occurrence is None:
+            # The course has ended; drop any reminder armed under the old schedule
+            self.unschedule_medication(medication)
+        else:
+            self._arm(medication, occurrence, manager)
+    
+    def unschedule_medication(self, medication: Medication):
+        """Cancel any upcoming reminder for a medication"""
+        with self._condition:
+            self._disarm(medication)
+            self._condition.notify()
+    
+    def next_fire_time(self) -> Optional[datetime]:
+        """Get the time (UTC) of the earliest armed reminder, if any"""
+        with self._condition:
+            self._discard_stale()
+            return self._deadlines[0] if self._deadlines else None
+    
+    def due_between(self, start: datetime, end: datetime) -> list[tuple[datetime, Medication]]:
+        """
+        Get every reminder due in [start, end) (aware datetimes), across all patients, in time order
+        Walks the live deadline heap without popping it: only buckets earlier than `end`
+        (and their heap children) are visited, so this costs O(k log n) for k results.
+        Repeating medications contribute every occurrence in the window, not just the armed one.
+        Returns (UTC fire time, medication) pairs.
+        """
+        armed = []
+        with self._condition:
+            deadlines = self._deadlines
+            # Heap of (deadline, index into deadlines) still to visit
+            frontier = [(deadlines[0], 0)] if deadlines and deadlines[0] < end else []
+            while frontier:
+                deadline, index = heapq.heappop(frontier)
+                for child in (2 * index + 1, 2 * index + 2):
+                    if child < len(deadlines) and deadlines[child] < end:
+                        heapq.heappush(frontier, (deadlines[child], child))
+                for seq, medication, manager, local_time in self._buckets.get(deadline, ()):
+                    if self._armed.get(id(medication)) == (seq, deadline):
+                        armed.append((deadline, medication, manager.timezone, local_time))
+        
+        due = []
+        for fire_at, medication, zone_name, local_time in armed:
+            while fire_at < end:
+                if fire_at >= start:
+                    due.append((fire_at, medication))
+                local_time = medication.next_occurrence(local_time)
+                if local_time is None:
+                    break
+                fire_at = to_utc(local_time, zone_name)
+        due.sort(key=lambda item: item[0])
+        return due
+    
+    def _arm(self, medication: Medication, local_time: datetime, manager: MedicationManager):
+        """Arm a medication's reminder for a wall-clock time in its patient's timezone"""
+        fire_at = to_utc(local_time, manager.timezone)
+        with self._condition:
+            self._disarm(medication)
+            seq = next(self._sequence)
+            self._armed[id(medication)] = (seq, fire_at)
+            if fire_at not in self._buckets:
+                self._buckets[fire_at] = []
+                heapq.heappush(self._deadlines, fire_at)
+            self._buckets[fire_at].append((seq, medication, manager, local_time))
+            self._live[fire_at] = self._live.get(fire_at, 0) + 1
+            self._condition.notify()
+    
+    def _disarm(self, medication: Medication):
+        armed = self._armed.pop(id(medication), None)
+        if armed:
+            self._live[armed[1]] -= 1
+    
+    def _discard_stale(self):
+        # A bucket whose entries were all cancelled is dropped without visiting them
+        while self._deadlines and not self._live.get(self._deadlines[0]):
+            deadline = heapq.heappop(self._deadlines)
+            self._buckets.pop(deadline, None)
+            self._live.pop(deadline, None)
+        while self._dose_timers and self._dose_timers[0][2].seq != self._dose_timers[0][1]:
+            heapq.heappop(self._dose_timers)
+    
+    def _arm_dose(self, dose: _Dose, state: DoseState, fire_at: datetime):
+        """Move a dose to `state` and (re)arm its single follow-up timer"""
+        with self._condition:
+            dose.state = state
+            dose.seq = next(self._sequence)
+            heapq.heappush(self._dose_timers, (fire_at, dose.seq, dose))
+            self._condition.notify()
+    
+    def _arm_miss(self, record: MedicationRecord, manager: MedicationManager):
+        """Arm the deadline after which an untaken dose is marked missed (caller holds _condition)"""
+        miss_at = to_utc(record.scheduled_time, manager.timezone) + self.missed_after
+        heapq.heappush(self._miss_deadlines, (miss_at, next(self._sequence), record, manager))
+        self._condition.notify()
+    
+    def _pop_due_misses(self, current_time: datetime) -> list[tuple[MedicationRecord, MedicationManager]]:
+        due = []
+        while self._miss_deadlines and self._miss_deadlines[0][0] <= current_time:
+            _, _, record, manager = heapq.heappop(self._miss_deadlines)
+            if not (record.taken or record.missed):
+                due.append((record, manager))
+        return due
+    
+    def _pop_due_doses(self, current_time: datetime) -> list[_Dose]:
+        due = []
+        self._discard_stale()
+        while self._dose_timers and self._dose_timers[0][0] <= current_time:
+            _, _, dose = heapq.heappop(self._dose_timers)
+            dose.seq = None
+            due.append(dose)
+            self._discard_stale()
+        return due
+    
+    def _pop_due(self, current_time: datetime) -> list[tuple[datetime, datetime, Medication, MedicationManager]]:
+        due = []
+        self._discard_stale()
+        while self._deadlines and self._deadlines[0] <= current_time:
+            deadline = heapq.heappop(self._deadlines)
+            self._live.pop(deadline, None)
+            for seq, medication, manager, local_time in self._buckets.pop(deadline):
+                if self._armed.get(id(medication)) == (seq, deadline):
+                    del self._armed[id(medication)]
+                    due.append((deadline, local_time, medication, manager))
+            self._discard_stale()
+        return due
+    
+    def _seconds_until_next(self, current_time: datetime) -> float:
+        self._discard_stale()
+        timeout = float(MAX_SLEEP_SECONDS)
+        if self._deadlines:
+            timeout = min(timeout, (self._deadlines[0] - current_time).total_seconds())
+        if self._dose_timers:
+            timeout = min(timeout, (self._dose_timers[0][0] - current_time).total_seconds())
+        if self._miss_deadlines:
+            timeout = min(timeout, (self._miss_deadlines[0][0] - current_time).total_seconds())
+        return max(timeout, 0.0)
+    
     def _scheduler_loop(self):
-        """Main scheduler loop that checks for due medications"""
+        """Main scheduler loop: sleep until the earliest deadline, then fire it"""
         while self.running:
             try:
-                current_time = datetime.now()
-                due_medications = self.medication_manager.get_medications_for_time(current_time)
-                
-                for medication in due_medications:
-                    # Check if we already have a pending reminder for this medication today
-                    reminder_key = f"{medication.name}_{current_time.date()}"
-                    
-                    if reminder_key not in self.pending_reminders:
-                        # Create a record for this reminder
-                        scheduled_datetime = current_time.replace(
-                            hour=medication.get_time().hour,
-                            minute=medication.get_time().minute,
-                            second=0,
-                            microsecond=0
-                        )
-                        record = self.medication_manager.create_record(medication, scheduled_datetime)
-                        self.pending_reminders[reminder_key] = record
-                        
-                        # Trigger reminder
-                        self.reminder_callback(medication)
-                
-                # Check for missed medications (not taken after 1 hour of scheduled time)
-                self._check_missed_medications(current_time)
-                
+                with self._condition:
+                    timeout = self._seconds_until_next(utc_now())
+                    if timeout > 0:
+                        self._condition.wait(timeout)
+                    if not self.running:
+                        break
+                self._tick(utc_now())
+            
             except Exception as e:
                 print(f"Error in scheduler loop: {e}")
-            
-            time_module.sleep(self.check_interval)
-    
-    def _check_missed_medications(self, current_time: datetime):
-        """Check if any medications were missed and mark them"""
-        for key, record in list(self.pending_reminders.items()):
-            if not record.taken:
-                # If more than 1 hour has passed since scheduled time
-                time_diff = (current_time - record.scheduled_time).total_seconds() / 3600
-                if time_diff > 1:
-                    record.missed = True
-                    record.reminder_count += 1
-                    
-                    # If reminder count is high, mark as missed
-                    if record.reminder_count >= 3:
-                        # This will be handled by caregiver notifier
-                        pass
+    
+    def _tick(self, current_time: datetime):
+        """Fire every reminder, follow-up and miss deadline due by `current_time` (UTC)"""
+        with self._condition:
+            due = self._pop_due(current_time)
+            follow_ups = self._pop_due_doses(current_time)
+            misses = self._pop_due_misses(current_time)
+        
+        for fire_at, scheduled_datetime, medication, manager in due:
+            self._fire(medication, manager, fire_at, scheduled_datetime, current_time)
+        for dose in follow_ups:
+            self._follow_up(dose, current_time)
+        for record, manager in misses:
+            self._mark_missed(record, manager)
+        
+        self._evict_finalized(current_time)
+        self._compact_records(current_time)
+    
+    def _fire(self, medication: Medication, manager: MedicationManager, fire_at: datetime,
+              scheduled_datetime: datetime, current_time: datetime):
+        """
+        Deliver a due reminder and re-arm the medication's next occurrence
+        `fire_at` and `current_time` are UTC; `scheduled_datetime` is the patient's wall-clock
+        time, which the next occurrence is computed from and the record is keyed by.
+        """
+        following = medication.next_occurrence(scheduled_datetime)
+        if following is not None:
+            self._arm(medication, following, manager)
+        
+        FIRE_DELAY.observe((current_time - fire_at).total_seconds())
+        if current_time - fire_at > DUE_GRACE:
+            return
+        
+        # Check if we already have a pending reminder for this dose
+        reminder_key = self._reminder_key(medication, scheduled_datetime)
+        with self._condition:
+            if reminder_key in self.pending_reminders:
+                return
+            # Reserve the key before the record is saved, so an offline ack can't create it too
+            record = MedicationRecord(medication=medication, scheduled_time=scheduled_datetime)
+            dose = _Dose(record, manager)
+            self.pending_reminders[reminder_key] = record
+            self._doses[reminder_key] = dose
+            self._arm_miss(record, manager)
+        manager.add_record(record)
+        
+        # Trigger reminder, repeating it later unless the patient answers
+        manager.count_reminder(record)
+        self._arm_dose(dose, DoseState.REMINDED, current_time + self.snooze_interval)
+        REMINDERS_SENT.labels("first").inc()
+        self.reminder_callback(medication)
+    
+    def _follow_up(self, dose: _Dose, current_time: datetime):
+        """A snoozed or unanswered dose's timer expired: remind again, or give up and escalate"""
+        record = dose.record
+        if record.taken or record.missed:
+            self._finish_dose(dose, DoseState.TAKEN if record.taken else DoseState.MISSED)
+            return
+        
+        if record.reminder_count < self.max_reminders:
+            dose.manager.count_reminder(record)
+            self._arm_dose(dose, DoseState.REREMINDED, current_time + self.snooze_interval)
+            REMINDERS_SENT.labels("repeat").inc()
+            self.reminder_callback(record.medication)
+            return
+        
+        # Tell the caregiver now; the dose only becomes missed at its deadline
+        with self._condition:
+            dose.state = DoseState.ESCALATED
+            dose.seq = None
+        if self.escalation_callback:
+            self.escalation_callback(record)
+    
+    def _finish_dose(self, dose: _Dose, state: DoseState):
+        """Move a dose to a final state and cancel its follow-up timer"""
+        with self._condition:
+            dose.state = state
+            dose.seq = None
+            self._doses.pop(self._reminder_key(dose.record.medication, dose.record.scheduled_time), None)
+    
+    def _latest_dose(self, medication: Medication) -> Optional[_Dose]:
+        """The most recently scheduled dose of a medication reminded in the last day that is still open"""
+        with self._condition:
+            manager = self._managers.get(medication.patient_id)
+        if manager is None:
+            return None
+        recent = manager.records.since(medication.name, manager.now() - ANSWER_WINDOW)
+        with self._condition:
+            for record in recent:
+                dose = self._doses.get(self._reminder_key(medication, record.scheduled_time))
+                if dose:
+                    return dose
+        return None
+    
+    def snooze(self, medication: Medication) -> bool:
+        """
+        Repeat the medication's current reminder after the snooze interval
+        Returns False when no reminded dose of it is waiting for an answer.
+        """
+        dose = self._latest_dose(medication)
+        if dose is None or dose.state not in ACTIVE_DOSE_STATES:
+            return False
+        self._arm_dose(dose, DoseState.SNOOZED, utc_now() + self.snooze_interval)
+        return True
+    
+    def get_dose_state(self, medication: Medication) -> Optional[DoseState]:
+        """Get the state of the medication's latest open dose, if one is being reminded"""
+        dose = self._latest_dose(medication)
+        return dose.state if dose else None
+    
+    def _mark_missed(self, record: MedicationRecord, manager: MedicationManager):
+        """Mark a dose missed at its deadline, notifying once unless it was already escalated"""
+        with self._condition:
+            dose = self._doses.get(self._reminder_key(record.medication, record.scheduled_time))
+        escalated = dose is not None and dose.state is DoseState.ESCALATED
+        if dose is not None:
+            self._finish_dose(dose, DoseState.MISSED)
+        if manager.mark_record_missed(record) and self.missed_callback and not escalated:
+            self.missed_callback(record)
+    
+    def _evict_finalized(self, current_time: datetime):
+        """
+        Drop pending entries from earlier days (in each patient's zone) once they are taken or missed
+        Runs once an hour, which is soon enough after midnight in every zone.
+        """
+        hour = current_time.replace(minute=0, second=0, microsecond=0)
+        if self._evicted_at == hour:
+            return
+        self._evicted_at = hour
+        with self._condition:
+            today = {patient_id: to_local(current_time, manager.timezone).date()
+                     for patient_id, manager in self._managers.items()}
+            finished = [key for key, record in self.pending_reminders.items()
+                        if (record.taken or record.missed)
+                        and record.scheduled_time.date() < today.get(record.medication.patient_id, date.max)]
+            for key in finished:
+                del self.pending_reminders[key]
+    
+    def _compact_records(self, current_time: datetime):
+        """Once a day, roll records older than the retention window into daily summaries"""
+        if self._compacted_on == current_time.date():
+            return
+        self._compacted_on = current_time.date()
+        with self._condition:
+            managers = list(self._managers.values())
+        for manager in managers:
+            manager.compact_records(manager.now().date() - timedelta(days=self.retention_days))
     
     def mark_medication_taken(self, medication: Medication):
         """Mark medication as taken and remove from pending reminders"""
-        current_date = datetime.now().date()
-        reminder_key = f"{medication.name}_{current_date}"
+        with self._condition:
+            manager = self._managers.get(medication.patient_id)
+        if manager is None:
+            return
+        now = manager.now()
+        # Only the latest dose counts; a medication can be due several times a day
+        recent = manager.records.since(medication.name, now - ANSWER_WINDOW)
+        record = recent[0] if recent else None
         
-        if reminder_key in self.pending_reminders:
-            record = self.pending_reminders[reminder_key]
-            record.taken = True
-            record.taken_time = datetime.now()
-            # Don't remove from pending, just mark as taken (for history)
+        if record:
+            # No-op when the voice handler already marked this dose;
+            # don't remove from pending, just mark as taken (for history)
+            manager.mark_record_taken(record, now)
+            with self._condition:
+                dose = self._doses.get(self._reminder_key(medication, record.scheduled_time))
+            if dose:
+                self._finish_dose(dose, DoseState.TAKEN)
+    
+    def acknowledge_dose(self, medication: Medication, scheduled_time: datetime,
+                         taken_time: datetime) -> bool:
+        """
+        Mark one specific dose taken, e.g. a confirmation queued while the patient's device was offline
+        The dose's record is created if its reminder never fired here, and it won't fire afterwards.
+        Returns False if the dose was already taken, so replayed confirmations change nothing.
+        """
+        with self._condition:
+            manager = self._managers.get(medication.patient_id)
+        if manager is None:
+            raise ValueError(f"Patient {medication.patient_id} has no reminders scheduled here")
+        
+        reminder_key = self._reminder_key(medication, scheduled_time)
+        record = manager.find_record(medication.name, scheduled_time)
+        created = False
+        with self._condition:
+            record = record or self.pending_reminders.get(reminder_key)
+            if record is None:
+                record = MedicationRecord(medication=medication, scheduled_time=scheduled_time)
+                created = True
+            self.pending_reminders.setdefault(reminder_key, record)
+            dose = self._doses.get(reminder_key)
+        if created:
+            manager.add_record(record)
+        
+        changed = manager.mark_record_taken(record, taken_time)
+        if dose:
+            self._finish_dose(dose, DoseState.TAKEN)
+        return changed
+    
+    @staticmethod
+    def _reminder_key(medication: Medication, scheduled_time: datetime) -> str:
+        return f"{medication.patient_id}:{medication.name}@{scheduled_time.isoformat()}"
+    
+    def armed_count(self) -> int:
+        """Number of medications with an upcoming reminder armed"""
+        return len(self._armed)
     
     def get_pending_reminders(self) -> list[MedicationRecord]:
         """Get list of pending reminders"""
-        return [record for record in self.pending_reminders.values() if not record.taken]
-
+        with self._condition:
+            return [record for record in self.pending_reminders.values() if not record.taken]
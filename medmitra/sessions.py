@@ -0,0 +1,134 @@
+"""
+Conversation sessions for MedMitra
+Each open dialog (a Socket.IO connection or a REST client) keeps its own context, so
+two devices or tabs answering reminders don't overwrite each other's active dose
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+from .medication import Medication
+
+
+class ConversationSession:
+    """Dialog context for one client: the dose being discussed and doses it snoozed"""
+    
+    __slots__ = ("key", "patient_id", "medication", "snoozed", "expires_at")
+    
+    def __init__(self, key: str, patient_id: str, medication: Optional[Medication] = None):
+        self.key = key
+        self.patient_id = patient_id
+        self.medication = medication
+        # Doses the patient put off from this session, awaiting their next reminder
+        self.snoozed: tuple[Medication, ...] = ()
+        self.expires_at = 0.0
+    
+    def snooze(self, medication: Medication):
+        """Note that the patient put this dose off"""
+        if not any(med is medication for med in self.snoozed):
+            self.snoozed += (medication,)
+    
+    def clear(self, medication: Medication):
+        """Forget a dose that was taken, escalated or reminded again"""
+        if self.medication is medication:
+            self.medication = None
+        if any(med is medication for med in self.snoozed):
+            self.snoozed = tuple(med for med in self.snoozed if med is not medication)
+
+
+class SessionStore:
+    """
+    Sessions by key, expiring after a period of inactivity and bounded in number
+    Sessions are kept in least-recently-used order, so expired ones are always at the
+    front and both expiry and eviction pop from there.
+    """
+    
+    def __init__(self, ttl: float = 1800.0, max_sessions: int = 10000):
+        """
+        Initialize session store
+        Args:
+            ttl: Seconds a session lives after it was last used
+            max_sessions: Most sessions kept; the least recently used go first
+        """
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, ConversationSession]" = OrderedDict()
+        # Patient ID -> keys of that patient's live sessions
+        self._by_patient: dict[str, set[str]] = {}
+        self._lock = threading.Lock()
+    
+    @classmethod
+    def from_environment(cls) -> "SessionStore":
+        """Store configured by MEDMITRA_SESSION_TTL (seconds) and MEDMITRA_SESSION_LIMIT"""
+        return cls(ttl=float(os.environ.get("MEDMITRA_SESSION_TTL", 1800)),
+                   max_sessions=int(os.environ.get("MEDMITRA_SESSION_LIMIT", 10000)))
+    
+    @staticmethod
+    def patient_key(patient_id: str) -> str:
+        """Key of the session shared by a patient's clients that don't name their own"""
+        return f"patient:{patient_id}"
+    
+    def get(self, key: str, patient_id: str) -> ConversationSession:
+        """
+        Get a session, creating it on first use and renewing its expiry
+        A new session picks up the patient's outstanding reminder, so a freshly opened
+        tab can answer it.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._expire(now)
+            session = self._sessions.get(key)
+            if session is not None and session.patient_id != patient_id:
+                self._remove(key)
+                session = None
+            if session is None:
+                shared = self._sessions.get(self.patient_key(patient_id))
+                session = ConversationSession(key, patient_id, shared.medication if shared else None)
+                self._sessions[key] = session
+                self._by_patient.setdefault(patient_id, set()).add(key)
+                while len(self._sessions) > self.max_sessions:
+                    self._remove(next(iter(self._sessions)))
+            else:
+                self._sessions.move_to_end(key)
+            session.expires_at = now + self.ttl
+            return session
+    
+    def drop(self, key: str):
+        """Forget a session (e.g. when its socket disconnects)"""
+        with self._lock:
+            if key in self._sessions:
+                self._remove(key)
+    
+    def remind(self, patient_id: str, medication: Medication):
+        """Make a due dose the active one in every session of the patient"""
+        self.get(self.patient_key(patient_id), patient_id)
+        with self._lock:
+            for key in self._by_patient.get(patient_id, ()):
+                session = self._sessions[key]
+                session.clear(medication)
+                session.medication = medication
+    
+    def resolve(self, patient_id: str, medication: Medication):
+        """Clear a dose that no longer needs an answer from every session of the patient"""
+        with self._lock:
+            for key in self._by_patient.get(patient_id, ()):
+                self._sessions[key].clear(medication)
+    
+    def _expire(self, now: float):
+        while self._sessions:
+            key, session = next(iter(self._sessions.items()))
+            if session.expires_at > now:
+                break
+            self._remove(key)
+    
+    def _remove(self, key: str):
+        session = self._sessions.pop(key)
+        keys = self._by_patient.get(session.patient_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_patient[session.patient_id]
+    
+    def __len__(self) -> int:
+        return len(self._sessions)
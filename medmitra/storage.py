@@ -0,0 +1,395 @@
+"""
+Durable storage for MedMitra
+SQLite (WAL) store with batched write-behind for medications, dose records and notifications
+"""
+import itertools
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time as time_module
+from contextlib import contextmanager
+from datetime import date, datetime, time, timedelta
+from typing import TYPE_CHECKING, Optional
+from .medication import Medication, MedicationManager, MedicationRecord, TimeSlot
+from .records import RECORD_RETENTION_DAYS, DailySummary
+from .recurrence import Recurrence
+from .push import PushSubscription
+
+if TYPE_CHECKING:
+    from .tenants import TenantRegistry
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS patients (
+    patient_id TEXT PRIMARY KEY,
+    user_name TEXT NOT NULL,
+    caregiver_contact TEXT,
+    timezone TEXT
+);
+CREATE TABLE IF NOT EXISTS medications (
+    patient_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    dosage TEXT NOT NULL,
+    time_slot TEXT NOT NULL,
+    doctor_instructions TEXT NOT NULL,
+    user_name TEXT NOT NULL,
+    recurrence TEXT,
+    PRIMARY KEY (patient_id, name)
+);
+CREATE TABLE IF NOT EXISTS records (
+    record_id INTEGER PRIMARY KEY,
+    patient_id TEXT NOT NULL,
+    medication_name TEXT NOT NULL,
+    dosage TEXT NOT NULL,
+    time_slot TEXT NOT NULL,
+    scheduled_time TEXT NOT NULL,
+    taken INTEGER NOT NULL,
+    taken_time TEXT,
+    reminder_count INTEGER NOT NULL,
+    missed INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS records_by_patient ON records (patient_id, scheduled_time);
+CREATE INDEX IF NOT EXISTS records_by_time ON records (scheduled_time);
+CREATE TABLE IF NOT EXISTS notifications (
+    notification_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    patient_id TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    medication TEXT NOT NULL,
+    missed_count INTEGER NOT NULL,
+    message TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS push_subscriptions (
+    endpoint TEXT PRIMARY KEY,
+    patient_id TEXT NOT NULL,
+    p256dh TEXT NOT NULL,
+    auth TEXT NOT NULL,
+    expires_at REAL
+);
+"""
+
+# Columns added after the first release: (table, column, definition) for ALTER TABLE
+MIGRATIONS = [
+    ("medications", "recurrence", "TEXT"),
+    ("patients", "timezone", "TEXT"),
+]
+
+# Write-behind tuning: a batch is committed when it reaches BATCH_SIZE
+# statements or FLUSH_INTERVAL seconds after its first statement.
+BATCH_SIZE = 500
+FLUSH_INTERVAL = 0.5
+
+# A batch that fails with a transient error (database locked or busy) is retried this
+# often, waiting WRITE_RETRY_DELAY seconds and doubling; after that its writes are
+# committed one at a time, so only a write that can never succeed is lost
+WRITE_RETRIES = 5
+WRITE_RETRY_DELAY = 0.2
+TRANSIENT_ERRORS = ("database is locked", "database table is locked", "database is busy", "disk I/O error")
+
+
+def _offload(function, *args):
+    """
+    Run blocking SQLite work on a real OS thread when the process is monkey-patched
+    (run_web.py --production); otherwise a commit would stall every green thread
+    """
+    patcher = sys.modules.get("eventlet.patcher")
+    if patcher is not None and patcher.is_monkey_patched("thread"):
+        from eventlet import tpool
+        return tpool.execute(function, *args)
+    gevent_monkey = sys.modules.get("gevent.monkey")
+    if gevent_monkey is not None and gevent_monkey.is_module_patched("threading"):
+        import gevent
+        return gevent.get_hub().threadpool.apply(function, args)
+    return function(*args)
+
+
+class SQLiteStore:
+    """
+    Write-behind SQLite store; callers never wait on disk I/O
+    Under eventlet/gevent the writer is a green thread, so its commits run in the hub's
+    OS thread pool instead (see _offload).
+    """
+    
+    def __init__(self, path: str, shard_index: int = 0, shard_count: int = 1):
+        """
+        Open (or create) the database
+        Args:
+            path: SQLite database file
+            shard_index: This worker's shard; record IDs are allocated in its own residue class
+            shard_count: Total worker shards sharing the database
+        """
+        self.path = path
+        self._connection = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(SCHEMA)
+        self._migrate()
+        self._connection.commit()
+        
+        # Workers sharing the file allocate IDs n*shard_count + shard_index, so they never collide
+        last_id = self._connection.execute("SELECT MAX(record_id) FROM records").fetchone()[0] or 0
+        first_id = last_id + 1 + (shard_index - (last_id + 1)) % shard_count
+        self._record_ids = itertools.count(first_id, shard_count)
+        self._id_lock = threading.Lock()
+        
+        # Items are (sql, params) statements, lists of statements that commit together,
+        # flush Events, or None to stop
+        self._queue: queue.Queue = queue.Queue()
+        self._local = threading.local()
+        self._writer = threading.Thread(target=self._writer_loop, daemon=True)
+        self._writer.start()
+    
+    @classmethod
+    def from_environment(cls) -> Optional["SQLiteStore"]:
+        """Open the store named by MEDMITRA_DB (e.g. medmitra.db); unset or empty keeps everything in memory"""
+        path = os.environ.get("MEDMITRA_DB")
+        if not path:
+            return None
+        return cls(path,
+                   shard_index=int(os.environ.get("MEDMITRA_SHARD_INDEX", 0)),
+                   shard_count=int(os.environ.get("MEDMITRA_SHARD_COUNT", 1)))
+    
+    # Loading
+    
+    def load(self, registry: "TenantRegistry", retention_days: int = RECORD_RETENTION_DAYS) -> int:
+        """
+        Rebuild every tenant owned by this worker from the database
+        Records older than retention_days are loaded as daily summaries only
+        Returns the number of dose records loaded
+        """
+        cutoff = datetime.combine(date.today() - timedelta(days=retention_days), time()).isoformat()
+        connection = sqlite3.connect(self.path, timeout=30)
+        managers: dict[str, MedicationManager] = {}
+        
+        def manager_for(patient_id: str) -> Optional[MedicationManager]:
+            if patient_id not in managers:
+                managers[patient_id] = (registry.get(patient_id).medication_manager
+                                        if registry.owns(patient_id) else None)
+            return managers[patient_id]
+        
+        for patient_id, user_name, caregiver_contact, timezone in connection.execute(
+                "SELECT patient_id, user_name, caregiver_contact, timezone FROM patients"):
+            manager = manager_for(patient_id)
+            if manager:
+                manager.user_name = user_name
+                manager.caregiver_contact = caregiver_contact
+                if timezone:
+                    manager.timezone = timezone
+        
+        medications: dict[tuple[str, str], Medication] = {}
+        for patient_id, name, dosage, time_slot, instructions, user_name, recurrence in connection.execute(
+                "SELECT patient_id, name, dosage, time_slot, doctor_instructions, user_name, recurrence "
+                "FROM medications ORDER BY rowid"):
+            manager = manager_for(patient_id)
+            if manager:
+                medication = Medication(name, dosage, TimeSlot(time_slot), instructions, user_name,
+                                        patient_id, Recurrence.parse(recurrence) if recurrence else None)
+                manager.medications += (medication,)
+                medications[(patient_id, name)] = medication
+        
+        loaded = 0
+        for (record_id, patient_id, name, dosage, time_slot, scheduled_time,
+             taken, taken_time, reminder_count, missed) in connection.execute(
+                "SELECT record_id, patient_id, medication_name, dosage, time_slot, scheduled_time, "
+                "taken, taken_time, reminder_count, missed FROM records "
+                "WHERE scheduled_time >= ? ORDER BY scheduled_time", (cutoff,)):
+            manager = manager_for(patient_id)
+            if not manager:
+                continue
+            medication = medications.get((patient_id, name))
+            if medication is None:
+                # Deleted medication: keep its history with a detached copy
+                medication = Medication(name, dosage, TimeSlot(time_slot), "",
+                                        manager.user_name, patient_id)
+                medications[(patient_id, name)] = medication
+            manager.records.add(MedicationRecord(
+                medication=medication,
+                scheduled_time=datetime.fromisoformat(scheduled_time),
+                taken=bool(taken),
+                taken_time=datetime.fromisoformat(taken_time) if taken_time else None,
+                reminder_count=reminder_count,
+                missed=bool(missed),
+                record_id=record_id
+            ))
+            loaded += 1
+        
+        for patient_id, name, day, scheduled, taken, missed in connection.execute(
+                "SELECT patient_id, medication_name, substr(scheduled_time, 1, 10), "
+                "COUNT(*), SUM(taken), SUM(missed) FROM records WHERE scheduled_time < ? "
+                "GROUP BY patient_id, medication_name, substr(scheduled_time, 1, 10)", (cutoff,)):
+            manager = manager_for(patient_id)
+            if manager:
+                manager.records.add_summary(
+                    DailySummary(name, date.fromisoformat(day), scheduled, taken, missed))
+        
+        for patient_id, timestamp, medication_name, missed_count, message in connection.execute(
+                "SELECT patient_id, timestamp, medication, missed_count, message "
+                "FROM notifications ORDER BY notification_id"):
+            if manager_for(patient_id):
+                registry.get(patient_id).caregiver_notifier.notification_history.append({
+                    "timestamp": datetime.fromisoformat(timestamp),
+                    "user": manager_for(patient_id).user_name,
+                    "medication": medication_name,
+                    "missed_count": missed_count,
+                    "message": message
+                })
+        
+        for patient_id, endpoint, p256dh, auth, expires_at in connection.execute(
+                "SELECT patient_id, endpoint, p256dh, auth, expires_at FROM push_subscriptions"):
+            if manager_for(patient_id):
+                registry.get(patient_id).push_subscriptions.restore(
+                    PushSubscription(endpoint, p256dh, auth, expires_at))
+        
+        connection.close()
+        return loaded
+    
+    # Write-behind events
+    
+    def save_profile(self, manager: MedicationManager):
+        """Persist a patient's name, caregiver contact and timezone"""
+        self._enqueue(
+            "INSERT OR REPLACE INTO patients (patient_id, user_name, caregiver_contact, timezone) "
+            "VALUES (?, ?, ?, ?)",
+            (manager.patient_id, manager.user_name, manager.caregiver_contact, manager.timezone))
+    
+    def save_medication(self, medication: Medication):
+        """Persist a new or changed medication"""
+        self._enqueue(
+            "INSERT OR REPLACE INTO medications "
+            "(patient_id, name, dosage, time_slot, doctor_instructions, user_name, recurrence) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (medication.patient_id, medication.name, medication.dosage,
+             medication.time_slot.value, medication.doctor_instructions, medication.user_name,
+             str(medication.recurrence) if medication.recurrence else None))
+    
+    def delete_medication(self, medication: Medication):
+        """Remove a medication (its dose history is kept)"""
+        self._enqueue("DELETE FROM medications WHERE patient_id = ? AND name = ?",
+                      (medication.patient_id, medication.name))
+    
+    def save_record(self, record: MedicationRecord):
+        """Persist a new or changed dose record, assigning it an ID on first save"""
+        if record.record_id is None:
+            with self._id_lock:
+                record.record_id = next(self._record_ids)
+        medication = record.medication
+        self._enqueue(
+            "INSERT OR REPLACE INTO records (record_id, patient_id, medication_name, dosage, time_slot, "
+            "scheduled_time, taken, taken_time, reminder_count, missed) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (record.record_id, medication.patient_id, medication.name,
+             medication.dosage_on(record.scheduled_time.date()), medication.time_slot.value, record.scheduled_time.isoformat(), int(record.taken),
+             record.taken_time.isoformat() if record.taken_time else None,
+             record.reminder_count, int(record.missed)))
+    
+    def save_notification(self, patient_id: str, notification: dict):
+        """Persist a caregiver notification"""
+        self._enqueue(
+            "INSERT INTO notifications (patient_id, timestamp, medication, missed_count, message) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (patient_id, notification["timestamp"].isoformat(), notification["medication"],
+             notification["missed_count"], notification["message"]))
+    
+    def save_push_subscription(self, patient_id: str, subscription: PushSubscription):
+        """Persist a new or renewed push subscription"""
+        self._enqueue(
+            "INSERT OR REPLACE INTO push_subscriptions (endpoint, patient_id, p256dh, auth, expires_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (subscription.endpoint, patient_id, subscription.p256dh, subscription.auth,
+             subscription.expires_at))
+    
+    def delete_push_subscription(self, endpoint: str):
+        """Remove a push subscription that was withdrawn or has expired"""
+        self._enqueue("DELETE FROM push_subscriptions WHERE endpoint = ?", (endpoint,))
+    
+    @contextmanager
+    def transaction(self):
+        """Queue every write made by this thread inside the block as one atomic commit"""
+        statements: list = []
+        self._local.statements = statements
+        try:
+            yield
+        finally:
+            self._local.statements = None
+        if statements:
+            self._queue.put(statements)
+    
+    def flush(self, timeout: Optional[float] = None):
+        """Block until every queued write has been committed"""
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+    
+    def close(self):
+        """Commit outstanding writes and close the database"""
+        self._queue.put(None)
+        self._writer.join()
+        self._connection.close()
+    
+    def _migrate(self):
+        """Add columns that databases created by older versions are missing"""
+        for table, column, definition in MIGRATIONS:
+            columns = {row[1] for row in self._connection.execute(f"PRAGMA table_info({table})")}
+            if column not in columns:
+                self._connection.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    
+    def _enqueue(self, sql: str, params: tuple):
+        statements = getattr(self._local, "statements", None)
+        if statements is not None:
+            statements.append((sql, params))
+        else:
+            self._queue.put((sql, params))
+    
+    def _writer_loop(self):
+        """Drain the queue, committing statements in batches"""
+        running = True
+        while running:
+            batch = [self._queue.get()]
+            deadline = time_module.monotonic() + FLUSH_INTERVAL
+            while len(batch) < BATCH_SIZE and isinstance(batch[-1], (tuple, list)):
+                remaining = deadline - time_module.monotonic()
+                try:
+                    batch.append(self._queue.get(timeout=remaining) if remaining > 0
+                                 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            running = batch[-1] is not None
+            self._commit(batch)
+    
+    def _commit(self, batch: list):
+        """Commit a batch, retrying transient failures; flush Events are set once it is done"""
+        writes = [item for item in batch if isinstance(item, (tuple, list))]
+        try:
+            for attempt in range(WRITE_RETRIES + 1):
+                try:
+                    _offload(self._execute, writes)
+                    return
+                except sqlite3.Error as e:
+                    if not str(e).startswith(TRANSIENT_ERRORS):
+                        # A constraint or schema error: the same batch would fail again
+                        print(f"Error writing to MedMitra database: {e}")
+                        break
+                    print(f"Error writing to MedMitra database (attempt {attempt + 1}): {e}")
+                    if attempt < WRITE_RETRIES:
+                        time_module.sleep(WRITE_RETRY_DELAY * 2 ** attempt)
+            # Salvage the batch write by write (a transaction's statements stay together)
+            for item in writes:
+                try:
+                    _offload(self._execute, [item])
+                except sqlite3.Error as e:
+                    print(f"Error writing to MedMitra database, dropping {item!r}: {e}")
+        finally:
+            for item in batch:
+                if isinstance(item, threading.Event):
+                    item.set()
+    
+    def _execute(self, writes: list):
+        """Run writes in one transaction"""
+        with self._connection:
+            for item in writes:
+                if isinstance(item, tuple):
+                    self._connection.execute(*item)
+                else:
+                    for statement in item:
+                        self._connection.execute(*statement)
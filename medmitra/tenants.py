@@ -0,0 +1,130 @@
+"""
+Multi-patient support for MedMitra
+Keeps per-patient state in a registry and shards patients across worker processes
+"""
+import hashlib
+import os
+import threading
+from typing import Callable, Iterator, Optional
+from .medication import MedicationManager, DEFAULT_PATIENT_ID
+from .changes import ChangeLog
+from .voice_handler import VoiceHandler
+from .caregiver_notifier import CaregiverNotifier
+from .analytics import AdherenceAnalytics, ANALYTICS_AVAILABLE
+from .push import SubscriptionStore
+
+
+def shard_for(patient_id: str, shard_count: int) -> int:
+    """Get the shard that owns a patient (stable across processes and restarts)"""
+    digest = hashlib.blake2b(patient_id.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % shard_count
+
+
+class WrongShardError(Exception):
+    """Raised when a patient is requested from a worker that doesn't own it"""
+    
+    def __init__(self, patient_id: str, shard: int):
+        super().__init__(f"Patient {patient_id} belongs to shard {shard}")
+        self.patient_id = patient_id
+        self.shard = shard
+
+
+class Tenant:
+    """All state MedMitra keeps for a single patient"""
+    
+    __slots__ = ("patient_id", "medication_manager", "voice_handler", "caregiver_notifier",
+                 "changes", "analytics", "push_subscriptions")
+    
+    def __init__(self, patient_id: str):
+        self.patient_id = patient_id
+        self.medication_manager = MedicationManager(patient_id)
+        self.voice_handler = VoiceHandler(self.medication_manager)
+        self.caregiver_notifier = CaregiverNotifier(self.medication_manager)
+        self.changes = ChangeLog()
+        # None when numpy isn't installed
+        self.analytics = AdherenceAnalytics(self.medication_manager) if ANALYTICS_AVAILABLE else None
+        self.push_subscriptions = SubscriptionStore(patient_id)
+
+
+class TenantRegistry:
+    """Patient ID -> Tenant lookup for the shard served by this process"""
+    
+    def __init__(self, shard_index: int = 0, shard_count: int = 1,
+                 on_create: Optional[Callable[[Tenant], None]] = None,
+                 shard_urls: Optional[list[str]] = None):
+        """
+        Initialize registry
+        Args:
+            shard_index: Shard owned by this worker process
+            shard_count: Total number of worker shards
+            on_create: Called once for every tenant created on demand
+            shard_urls: Public base URL of each shard's worker, in shard order; "{host}" is
+                replaced by the hostname the client used. Clients sent to the wrong worker
+                are pointed at the right one with it.
+        """
+        if not 0 <= shard_index < shard_count:
+            raise ValueError(f"Shard index {shard_index} out of range for {shard_count} shards")
+        self.shard_index = shard_index
+        self.shard_count = shard_count
+        self.on_create = on_create
+        self.shard_urls = shard_urls or []
+        self._tenants: dict[str, Tenant] = {}
+        self._lock = threading.Lock()
+    
+    @classmethod
+    def from_environment(cls, **kwargs) -> "TenantRegistry":
+        """
+        Create a registry from MEDMITRA_SHARD_INDEX / MEDMITRA_SHARD_COUNT
+        MEDMITRA_SHARD_URLS lists each shard's worker URL, comma-separated (run_web.py --workers sets it)
+        """
+        shard_urls = os.environ.get("MEDMITRA_SHARD_URLS")
+        return cls(shard_index=int(os.environ.get("MEDMITRA_SHARD_INDEX", 0)),
+                   shard_count=int(os.environ.get("MEDMITRA_SHARD_COUNT", 1)),
+                   shard_urls=[url.strip().rstrip("/") for url in shard_urls.split(",")] if shard_urls else None,
+                   **kwargs)
+    
+    def owns(self, patient_id: str) -> bool:
+        """Check whether this worker serves the given patient"""
+        return self.shard_count == 1 or shard_for(patient_id, self.shard_count) == self.shard_index
+    
+    def shard_of(self, patient_id: str) -> int:
+        """Get the shard that owns a patient"""
+        return shard_for(patient_id, self.shard_count)
+    
+    def shard_url(self, shard: int, host: str) -> Optional[str]:
+        """Base URL of the worker serving a shard, as reached through `host` (None if not configured)"""
+        if shard >= len(self.shard_urls):
+            return None
+        return self.shard_urls[shard].replace("{host}", host)
+    
+    def get(self, patient_id: str = DEFAULT_PATIENT_ID) -> Tenant:
+        """Get a patient's tenant, creating it on first use"""
+        tenant = self._tenants.get(patient_id)
+        if tenant is not None:
+            return tenant
+        
+        if not self.owns(patient_id):
+            raise WrongShardError(patient_id, shard_for(patient_id, self.shard_count))
+        
+        with self._lock:
+            tenant = self._tenants.get(patient_id)
+            if tenant is None:
+                tenant = Tenant(patient_id)
+                self._tenants[patient_id] = tenant
+                created = True
+            else:
+                created = False
+        
+        if created and self.on_create:
+            self.on_create(tenant)
+        return tenant
+    
+    def find(self, patient_id: str) -> Optional[Tenant]:
+        """Get a patient's tenant without creating it"""
+        return self._tenants.get(patient_id)
+    
+    def __iter__(self) -> Iterator[Tenant]:
+        return iter(list(self._tenants.values()))
+    
+    def __len__(self) -> int:
+        return len(self._tenants)
@@ -0,0 +1,58 @@
+"""
+Timezone helpers for MedMitra
+Schedules are written in each patient's local wall-clock time; the scheduler keeps deadlines in UTC
+"""
+import os
+from datetime import datetime, timezone
+from functools import lru_cache
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+
+def _server_timezone() -> str:
+    """IANA name of the server's zone, falling back to UTC when it can't be determined"""
+    if os.environ.get("TZ"):
+        return os.environ["TZ"]
+    try:
+        target = os.path.realpath("/etc/localtime")
+        if "zoneinfo/" in target:
+            return target.split("zoneinfo/", 1)[1]
+    except OSError:
+        pass
+    return "UTC"
+
+
+# Zone for patients that haven't set one (MEDMITRA_DEFAULT_TIMEZONE, else the server's)
+DEFAULT_TIMEZONE = os.environ.get("MEDMITRA_DEFAULT_TIMEZONE") or _server_timezone()
+
+
+@lru_cache(maxsize=None)
+def get_zone(name: str) -> ZoneInfo:
+    """Look up a zone by IANA name (e.g. Asia/Kolkata), raising ValueError for unknown names"""
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f"Unknown timezone '{name}'")
+
+
+def utc_now() -> datetime:
+    """Current time as an aware UTC datetime"""
+    return datetime.now(timezone.utc)
+
+
+def local_now(zone_name: str) -> datetime:
+    """Current wall-clock time in a zone, as a naive datetime"""
+    return datetime.now(get_zone(zone_name)).replace(tzinfo=None)
+
+
+def to_utc(local: datetime, zone_name: str) -> datetime:
+    """
+    Convert a naive wall-clock time in a zone to aware UTC
+    Times skipped by a DST jump resolve to the same offset past the jump; repeated times
+    resolve to their first occurrence (fold=0), so a dose never fires twice.
+    """
+    return local.replace(tzinfo=get_zone(zone_name)).astimezone(timezone.utc)
+
+
+def to_local(moment: datetime, zone_name: str) -> datetime:
+    """Convert an aware datetime to naive wall-clock time in a zone"""
+    return moment.astimezone(get_zone(zone_name)).replace(tzinfo=None)
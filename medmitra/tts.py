@@ -0,0 +1,186 @@
+"""
+Server-side text-to-speech for MedMitra
+Renders reminder and reply text to compressed audio ahead of time and keeps it in a
+content-addressed, size-bounded (LRU) cache on disk
+"""
+import hashlib
+import os
+import queue
+import shutil
+import subprocess
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+
+class TTSEngine:
+    """Turns text into audio bytes; `voice` is part of every cache key"""
+    
+    voice = "base"
+    extension = "wav"
+    mimetype = "audio/wav"
+    
+    def render(self, text: str) -> bytes:
+        raise NotImplementedError
+
+
+class EspeakEngine(TTSEngine):
+    """
+    Offline synthesis with espeak-ng (or espeak)
+    Output is compressed to Ogg/Opus when ffmpeg is installed, otherwise kept as WAV.
+    """
+    
+    def __init__(self, language: str = "hi", speed: int = 140):
+        self.command = shutil.which("espeak-ng") or shutil.which("espeak")
+        if not self.command:
+            raise RuntimeError("espeak-ng is not installed")
+        self.ffmpeg = shutil.which("ffmpeg")
+        self.language = language
+        self.speed = speed
+        self.voice = f"espeak:{language}:{speed}"
+        if self.ffmpeg:
+            self.voice += ":opus"
+            self.extension = "ogg"
+            self.mimetype = "audio/ogg"
+    
+    def render(self, text: str) -> bytes:
+        wav = subprocess.run([self.command, "-v", self.language, "-s", str(self.speed), "--stdout", text],
+                             capture_output=True, check=True, timeout=60).stdout
+        if not self.ffmpeg:
+            return wav
+        return subprocess.run([self.ffmpeg, "-loglevel", "error", "-i", "pipe:0",
+                               "-c:a", "libopus", "-b:a", "24k", "-f", "ogg", "pipe:1"],
+                              input=wav, capture_output=True, check=True, timeout=60).stdout
+
+
+class AudioCache:
+    """Audio files named by content hash, evicting least recently used ones past max_bytes"""
+    
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        # file name -> size, least recently used first
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._size = 0
+        
+        # Pick up audio rendered by earlier runs, oldest access first
+        existing = []
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if os.path.isfile(path) and not name.startswith("."):
+                stat = os.stat(path)
+                existing.append((stat.st_mtime, name, stat.st_size))
+        for _, name, size in sorted(existing):
+            self._entries[name] = size
+            self._size += size
+    
+    def path(self, name: str) -> Optional[str]:
+        """Get the file for a cache entry (marking it recently used), or None if missing"""
+        with self._lock:
+            if name not in self._entries:
+                return None
+            self._entries.move_to_end(name)
+        path = os.path.join(self.directory, name)
+        try:
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self._size -= self._entries.pop(name, 0)
+            return None
+        return path
+    
+    def __contains__(self, name: str) -> bool:
+        return name in self._entries
+    
+    def put(self, name: str, data: bytes):
+        """Store an entry atomically, then evict old entries until the cache fits"""
+        handle, temporary = tempfile.mkstemp(dir=self.directory, prefix=".render-")
+        with os.fdopen(handle, "wb") as file:
+            file.write(data)
+        os.replace(temporary, os.path.join(self.directory, name))
+        
+        with self._lock:
+            self._size += len(data) - self._entries.pop(name, 0)
+            self._entries[name] = len(data)
+            while self._size > self.max_bytes and len(self._entries) > 1:
+                evicted, size = self._entries.popitem(last=False)
+                self._size -= size
+                try:
+                    os.remove(os.path.join(self.directory, evicted))
+                except OSError:
+                    pass
+
+
+class TTSService:
+    """Pre-renders text to audio in the background and resolves text to cached audio files"""
+    
+    def __init__(self, engine: TTSEngine, cache: AudioCache):
+        self.engine = engine
+        self.cache = cache
+        self._queue: queue.Queue = queue.Queue()
+        self._queued: set[str] = set()
+        self._queued_lock = threading.Lock()
+        self._worker: Optional[threading.Thread] = None
+    
+    @classmethod
+    def from_environment(cls) -> Optional["TTSService"]:
+        """
+        Build the service from MEDMITRA_TTS (espeak, or off by default), MEDMITRA_TTS_CACHE
+        (directory, default tts_cache) and MEDMITRA_TTS_CACHE_MB (default 200)
+        Returns None when TTS is off or the engine isn't installed; clients then use
+        browser speech synthesis.
+        """
+        if os.environ.get("MEDMITRA_TTS", "off").lower() != "espeak":
+            return None
+        try:
+            engine = EspeakEngine(language=os.environ.get("MEDMITRA_TTS_LANGUAGE", "hi"))
+        except RuntimeError as e:
+            print(f"Error starting server-side TTS: {e}")
+            return None
+        cache = AudioCache(os.environ.get("MEDMITRA_TTS_CACHE", "tts_cache"),
+                           int(os.environ.get("MEDMITRA_TTS_CACHE_MB", 200)) * 1024 * 1024)
+        return cls(engine, cache)
+    
+    def audio_id(self, text: str) -> str:
+        """Content address of the audio for some text with this engine's voice"""
+        digest = hashlib.sha256(f"{self.engine.voice}\n{text}".encode("utf-8")).hexdigest()
+        return f"{digest}.{self.engine.extension}"
+    
+    def lookup(self, text: str) -> Optional[str]:
+        """
+        Get the audio ID for text if it is already rendered
+        Otherwise queue it for rendering and return None (the client speaks it itself)
+        """
+        audio_id = self.audio_id(text)
+        if audio_id in self.cache:
+            return audio_id
+        self.prerender([text])
+        return None
+    
+    def prerender(self, texts: Iterable[str]):
+        """Queue texts for background rendering (already cached or queued ones are skipped)"""
+        with self._queued_lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._render_loop, daemon=True)
+                self._worker.start()
+        for text in texts:
+            audio_id = self.audio_id(text)
+            with self._queued_lock:
+                if audio_id in self.cache or audio_id in self._queued:
+                    continue
+                self._queued.add(audio_id)
+            self._queue.put((audio_id, text))
+    
+    def _render_loop(self):
+        while True:
+            audio_id, text = self._queue.get()
+            try:
+                self.cache.put(audio_id, self.engine.render(text))
+            except Exception as e:
+                print(f"Error rendering reminder audio: {e}")
+            finally:
+                with self._queued_lock:
+                    self._queued.discard(audio_id)
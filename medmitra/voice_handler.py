@@ -2,9 +2,42 @@
 Voice interaction handler for MedMitra
 Handles user responses and generates appropriate Hindi/English mixed responses
 """
-from datetime import datetime
-from typing import Optional
+from typing import Iterable, Optional
 from .medication import Medication, MedicationManager, TimeSlot
+from .intents import Intent, classify_intent
+from .metrics import REGISTRY
+
+
+TIME_SLOT_GREETINGS = {
+    TimeSlot.MORNING: "subah",
+    TimeSlot.AFTERNOON: "dopahar",
+    TimeSlot.EVENING: "shaam",
+    TimeSlot.NIGHT: "raat"
+}
+INTENT_SECONDS = REGISTRY.histogram("medmitra_intent_classification_seconds",
+                                    "Time to classify one patient utterance")
+
+REMINDER_CLOSING = ("Kripya ek gilas paani ke saath le lijiye.\n\n"
+                    "Kya aapne dava le li? Aap 'Haan' ya 'Nahi' bol sakte hain.")
+
+# Fixed replies (also pre-rendered to audio when server-side TTS is enabled)
+RESPONSES = {
+    "taken": ("Bahut accha. Main aapke record mein note kar deta hoon. "
+              "Dhanyavaad, apna dhyan rakhiye."),
+    "not_yet": ("Koi baat nahi. Main 10 minute baad dubara yaad kara dunga. "
+                "Kripya dava le lijiye."),
+    "confused": ("Main yahan hoon aapki madad ke liye. Aap akelay nahi hain. "
+                 "Kya main aapki koi aur madad kar sakta hoon?"),
+    "emergency": ("Kripya apne doctor ya nearest clinic se turant sampark karein. "
+                  "Main emergency medical advice nahi de sakta. "
+                  "Agar zarurat ho to 102 ya 108 par call karein."),
+    "yes_no_medication": "Accha. Kya main aapki koi aur madad kar sakta hoon?",
+    "no_no_medication": "Theek hai. Kya main aapki koi aur madad kar sakta hoon?",
+    "which_medication": ("Kya aap kisi specific dava ke baare mein poochh rahe hain? "
+                         "Kripya dava ka naam bataiye."),
+    "not_understood": ("Main aapki baat samajh nahi paya. Kya aap 'Haan' ya 'Nahi' bol sakte hain? "
+                       "Ya phir aap koi sawaal poochh sakte hain."),
+}
 
 
 class VoiceHandler:
@@ -12,52 +45,60 @@ class VoiceHandler:
     
     def __init__(self, medication_manager: MedicationManager):
         self.medication_manager = medication_manager
+        # Rendered reminders by medication name: (fingerprint, text)
+        self._reminder_cache: dict[str, tuple[tuple, str]] = {}
     
     def get_time_slot_greeting(self, time_slot: TimeSlot) -> str:
         """Get greeting based on time slot"""
-        greetings = {
-            TimeSlot.MORNING: "subah",
-            TimeSlot.AFTERNOON: "dopahar",
-            TimeSlot.EVENING: "shaam",
-            TimeSlot.NIGHT: "raat"
-        }
-        return greetings.get(time_slot, "waqt")
+        return TIME_SLOT_GREETINGS.get(time_slot, "waqt")
     
     def generate_reminder(self, medication: Medication) -> str:
-        """Generate a reminder message for medication"""
+        """
+        Generate a reminder message for medication
+        Rendered text is cached per medication and re-rendered only when the
+        medication's fields or the patient's name have changed.
+        """
         user_name = self.medication_manager.user_name
-        time_slot_name = self.get_time_slot_greeting(medication.time_slot)
-        
-        # Build the reminder message
-        message = f"Namaste, {user_name}. Ab {time_slot_name} ki dava ka waqt ho gaya hai.\n\n"
-        message += f"Dava ka naam hai {medication.name} {medication.dosage}.\n\n"
-        
-        # Add simple explanation
-        explanation = medication.get_simple_explanation()
-        message += f"{explanation}\n\n"
+        # Tapering courses change dosage from day to day
+        dosage = medication.dosage_on(self.medication_manager.now().date())
+        fingerprint = (medication.name, dosage, medication.time_slot,
+                       medication.doctor_instructions, user_name)
+        cached = self._reminder_cache.get(medication.name)
+        if cached and cached[0] == fingerprint:
+            return cached[1]
         
+        parts = [
+            f"Namaste, {user_name}. Ab {self.get_time_slot_greeting(medication.time_slot)} "
+            f"ki dava ka waqt ho gaya hai.",
+            f"Dava ka naam hai {medication.name} {dosage}.",
+            # Add simple explanation
+            medication.get_simple_explanation(),
+        ]
         # Add doctor instructions if available
         if medication.doctor_instructions:
-            message += f"Doctor ki instructions: {medication.doctor_instructions}\n\n"
-        
+            parts.append(f"Doctor ki instructions: {medication.doctor_instructions}")
         # Add water reminder
-        message += "Kripya ek gilas paani ke saath le lijiye.\n\n"
-        message += "Kya aapne dava le li? Aap 'Haan' ya 'Nahi' bol sakte hain."
+        parts.append(REMINDER_CLOSING)
         
+        message = "\n\n".join(parts)
+        self._reminder_cache[medication.name] = (fingerprint, message)
         return message
     
+    def forget_reminders(self, names: Iterable[str]):
+        """Drop cached reminders for medications that were removed or replaced"""
+        for name in names:
+            self._reminder_cache.pop(name, None)
+    
     def handle_yes_response(self, medication: Medication) -> str:
         """Handle when user confirms they took the medication"""
         # Mark as taken
-        self.medication_manager.mark_taken(medication, datetime.now())
+        self.medication_manager.mark_taken(medication, self.medication_manager.now())
         
-        return ("Bahut accha. Main aapke record mein note kar deta hoon. "
-                "Dhanyavaad, apna dhyan rakhiye.")
+        return RESPONSES["taken"]
     
     def handle_no_response(self, medication: Medication) -> str:
         """Handle when user says they haven't taken the medication"""
-        return ("Koi baat nahi. Main 10 minute baad dubara yaad kara dunga. "
-                "Kripya dava le lijiye.")
+        return RESPONSES["not_yet"]
     
     def handle_medication_question(self, medication: Medication) -> str:
         """Handle when user asks what the medication is for"""
@@ -66,60 +107,46 @@ class VoiceHandler:
     
     def handle_confused_response(self) -> str:
         """Handle when user seems confused or sad"""
-        return ("Main yahan hoon aapki madad ke liye. Aap akelay nahi hain. "
-                "Kya main aapki koi aur madad kar sakta hoon?")
+        return RESPONSES["confused"]
     
     def handle_emergency_symptoms(self) -> str:
         """Handle when user mentions severe symptoms"""
-        return ("Kripya apne doctor ya nearest clinic se turant sampark karein. "
-                "Main emergency medical advice nahi de sakta. "
-                "Agar zarurat ho to 102 ya 108 par call karein.")
+        return RESPONSES["emergency"]
     
-    def process_user_input(self, user_input: str, current_medication: Optional[Medication] = None) -> tuple[str, Optional[Medication]]:
+    def process_user_input(self, user_input: str, current_medication: Optional[Medication] = None) -> tuple[str, Optional[Medication], Intent]:
         """
         Process user input and return appropriate response
-        Returns: (response_message, medication_if_relevant)
+        Returns: (response_message, medication_if_relevant, intent)
+        A YES intent with a medication means the dose has been marked taken.
         """
-        user_input_lower = user_input.lower().strip()
+        with INTENT_SECONDS.time():
+            intent = classify_intent(user_input)
         
-        # Emergency keywords
-        emergency_keywords = ["emergency", "severe", "gambhir", "tez dard", "sans nahi aa rahi", 
-                             "chest pain", "heart attack", "stroke"]
-        if any(keyword in user_input_lower for keyword in emergency_keywords):
-            return (self.handle_emergency_symptoms(), None)
+        if intent is Intent.EMERGENCY:
+            return (self.handle_emergency_symptoms(), None, intent)
         
-        # Yes responses
-        yes_keywords = ["haan", "yes", "hmm", "le li", "le liya", "ho gaya", "done", "ok"]
-        if any(keyword in user_input_lower for keyword in yes_keywords):
+        if intent is Intent.YES:
             if current_medication:
-                return (self.handle_yes_response(current_medication), current_medication)
-            return ("Accha. Kya main aapki koi aur madad kar sakta hoon?", None)
+                return (self.handle_yes_response(current_medication), current_medication, intent)
+            return (RESPONSES["yes_no_medication"], None, intent)
         
-        # No responses
-        no_keywords = ["nahi", "no", "abhi nahi", "baad mein", "not yet", "wait"]
-        if any(keyword in user_input_lower for keyword in no_keywords):
+        if intent is Intent.NO:
             if current_medication:
-                return (self.handle_no_response(current_medication), current_medication)
-            return ("Theek hai. Kya main aapki koi aur madad kar sakta hoon?", None)
+                return (self.handle_no_response(current_medication), current_medication, intent)
+            return (RESPONSES["no_no_medication"], None, intent)
         
-        # Medication question
-        question_keywords = ["kisliye", "kyun", "kya hai", "what is", "why", "purpose", "kaam"]
-        if any(keyword in user_input_lower for keyword in question_keywords):
+        if intent is Intent.QUESTION:
             if current_medication:
-                return (self.handle_medication_question(current_medication), current_medication)
+                return (self.handle_medication_question(current_medication), current_medication, intent)
             # Try to find medication in input
+            user_input_lower = user_input.lower()
             for med in self.medication_manager.medications:
                 if med.name.lower() in user_input_lower:
-                    return (self.handle_medication_question(med), med)
-            return ("Kya aap kisi specific dava ke baare mein poochh rahe hain? "
-                   "Kripya dava ka naam bataiye.", None)
+                    return (self.handle_medication_question(med), med, intent)
+            return (RESPONSES["which_medication"], None, intent)
         
-        # Confused/sad responses
-        confused_keywords = ["confused", "sad", "upset", "pareshan", "udaas", "samajh nahi aa raha"]
-        if any(keyword in user_input_lower for keyword in confused_keywords):
-            return (self.handle_confused_response(), None)
+        if intent is Intent.CONFUSED:
+            return (self.handle_confused_response(), None, intent)
         
         # Default response
-        return ("Main aapki baat samajh nahi paya. Kya aap 'Haan' ya 'Nahi' bol sakte hain? "
-               "Ya phir aap koi sawaal poochh sakte hain.", current_medication)
-
+        return (RESPONSES["not_understood"], current_medication, intent)
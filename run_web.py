@@ -1,21 +1,55 @@
 """
 Launcher script for MedMitra Web Application
 Run this to start the web server
+
+    python run_web.py                            # development server
+    python run_web.py --async-mode threading     # development server on real threads
+    python run_web.py --production               # eventlet/gevent server
+    python run_web.py --production --workers 4   # 4 sharded worker processes
 """
-from medmitra.app import app, socketio, setup_sample_medications, initialize_scheduler
+import argparse
 import os
+import secrets
+import sys
 
-if __name__ == '__main__':
-    # Setup sample medications
-    setup_sample_medications()
-    
-    # Initialize scheduler
-    initialize_scheduler()
-    
-    port = int(os.environ.get('PORT', 5000))
-    debug = os.environ.get('DEBUG', 'False').lower() == 'true'
-    
-    # Try to get local IP address
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Start the MedMitra web server")
+    parser.add_argument('--production', action='store_true',
+                        default=os.environ.get('MEDMITRA_MODE', '').lower() == 'production',
+                        help='use an async (eventlet/gevent) server instead of the Werkzeug dev server')
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('MEDMITRA_WORKERS', 1)),
+                        help='worker processes in production mode; patients are sharded across them')
+    parser.add_argument('--async-mode', choices=['auto', 'eventlet', 'gevent', 'threading'], default='auto',
+                        help='async library for production mode; "threading" makes the development '
+                             'server use real threads even when eventlet/gevent is installed')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.production and args.async_mode == 'threading':
+        parser.error('production mode needs eventlet or gevent, not threading')
+    return args
+
+
+def patch_for_async(async_mode: str) -> str:
+    """Monkey-patch the standard library for green threads; must run before other imports"""
+    if async_mode in ('auto', 'eventlet'):
+        try:
+            import eventlet
+            eventlet.monkey_patch()
+            return 'eventlet'
+        except ImportError:
+            if async_mode == 'eventlet':
+                raise
+    try:
+        from gevent import monkey
+        monkey.patch_all()
+        return 'gevent'
+    except ImportError:
+        sys.exit("Production mode needs eventlet or gevent: pip install eventlet")
+
+
+def get_local_ip() -> str:
+    """Try to get local IP address"""
     import socket
     try:
         s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
@@ -24,6 +58,11 @@ if __name__ == '__main__':
         s.close()
     except:
         local_ip = "YOUR_IP_ADDRESS"
+    return local_ip
+
+
+def print_banner(port: int, workers: int = 1, dashboard_path: str = '/dashboard'):
+    local_ip = get_local_ip()
     
     print("\n" + "="*70)
     print("  🏥 MedMitra Web Server Starting...")
@@ -31,6 +70,9 @@ if __name__ == '__main__':
     print(f"🌐 Local:    http://localhost:{port}")
     print(f"📱 Mobile:   http://{local_ip}:{port}")
     print(f"💻 Network:  http://0.0.0.0:{port}")
+    print(f"👩‍⚕️ Caregiver: http://{local_ip}:{port}{dashboard_path}")
+    if workers > 1:
+        print(f"⚙️  Workers:  {workers} (ports {port}-{port + workers - 1}, one patient shard each)")
     print("="*70)
     print("\n📱 To access from mobile device:")
     print(f"   1. Connect mobile to same Wi-Fi network")
@@ -39,6 +81,88 @@ if __name__ == '__main__':
     print("\n   See MOBILE_ACCESS.md for detailed instructions")
     print("\nPress Ctrl+C to stop the server\n")
     print("="*70 + "\n")
+
+
+def run_workers(args, port: int):
+    """Start one production worker per shard, sharing emits through a message queue"""
+    import subprocess
+    from medmitra.message_queue import LocalMessageBroker
     
-    socketio.run(app, host='0.0.0.0', port=port, debug=debug, allow_unsafe_werkzeug=True)
+    # Workers must agree on the caregiver secret, or a dashboard link only works on one of them
+    if not os.environ.get('MEDMITRA_CAREGIVER_SECRET'):
+        os.environ['MEDMITRA_CAREGIVER_SECRET'] = secrets.token_hex(32)
+    
+    queue_url = os.environ.get('MEDMITRA_MESSAGE_QUEUE')
+    if not queue_url:
+        broker = LocalMessageBroker()
+        broker.start()
+        queue_url = broker.url
+    
+    # Each worker can point clients at the worker that owns their patient ({host} is the
+    # hostname the client used); behind a proxy, set MEDMITRA_SHARD_URLS to public URLs instead
+    if not os.environ.get('MEDMITRA_SHARD_URLS'):
+        os.environ['MEDMITRA_SHARD_URLS'] = ','.join(
+            f'http://{{host}}:{port + index}' for index in range(args.workers))
+    
+    processes = []
+    for index in range(args.workers):
+        env = dict(os.environ,
+                   PORT=str(port + index),
+                   MEDMITRA_SHARD_INDEX=str(index),
+                   MEDMITRA_SHARD_COUNT=str(args.workers),
+                   MEDMITRA_MESSAGE_QUEUE=queue_url)
+        processes.append(subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), '--production', '--worker',
+             '--async-mode', args.async_mode],
+            env=env))
+    
+    from medmitra.access import CaregiverAccess
+    from medmitra.medication import DEFAULT_PATIENT_ID
+    print_banner(port, args.workers, CaregiverAccess.from_environment().dashboard_path(DEFAULT_PATIENT_ID))
+    try:
+        for process in processes:
+            process.wait()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+
+
+def run_server(args, port: int):
+    """Run a single server process (development, or one production worker)"""
+    if args.production:
+        os.environ['MEDMITRA_ASYNC_MODE'] = patch_for_async(args.async_mode)
+    elif args.async_mode == 'threading':
+        os.environ['MEDMITRA_ASYNC_MODE'] = 'threading'
+    
+    from medmitra.app import (app, socketio, load_state, setup_sample_medications, initialize_scheduler,
+                              caregiver_access)
+    from medmitra.medication import DEFAULT_PATIENT_ID
+    dashboard_path = caregiver_access.dashboard_path(DEFAULT_PATIENT_ID)
+    
+    # Restore patients and history from the database (MEDMITRA_DB)
+    load_state()
+    
+    # Setup sample medications
+    setup_sample_medications()
+    
+    # Initialize scheduler
+    initialize_scheduler()
+    
+    if args.production:
+        if not args.worker:
+            print_banner(port, dashboard_path=dashboard_path)
+        socketio.run(app, host='0.0.0.0', port=port)
+    else:
+        debug = os.environ.get('DEBUG', 'False').lower() == 'true'
+        print_banner(port, dashboard_path=dashboard_path)
+        socketio.run(app, host='0.0.0.0', port=port, debug=debug, allow_unsafe_werkzeug=True)
+
 
+if __name__ == '__main__':
+    args = parse_args()
+    port = int(os.environ.get('PORT', 5000))
+    
+    if args.production and args.workers > 1 and not args.worker:
+        run_workers(args, port)
+    else:
+        run_server(args, port)
@@ -7,21 +7,40 @@ class MedMitraClient {
         this.isListening = false;
         this.synthesis = window.speechSynthesis;
         this.currentUtterance = null;
+        this.currentAudio = null;
         this.currentReminderMedication = null;
         this.waitingForMedicationResponse = false;
+        this.patientId = new URLSearchParams(window.location.search).get('patient_id') || 'default';
+        // Per-tab dialog session for REST calls, so tabs don't answer each other's reminders
+        this.sessionId = sessionStorage.getItem('medmitraSessionId') || Math.random().toString(36).slice(2);
+        sessionStorage.setItem('medmitraSessionId', this.sessionId);
         
         this.initializeSocket();
         this.initializeVoiceRecognition();
         this.initializeUI();
+        this.initializeOfflineSupport();
     }
 
     initializeSocket() {
+        // The Socket.IO script comes from a CDN and is missing when the app opens offline
+        if (typeof io === 'undefined') {
+            this.updateStatus('disconnected', 'Offline');
+            return;
+        }
+        
         // Connect to Flask-SocketIO server
-        this.socket = io();
+        this.socket = io({ query: { patient_id: this.patientId, role: 'patient' } });
         
         this.socket.on('connect', () => {
             console.log('Connected to MedMitra server');
             this.updateStatus('connected', 'Connected');
+            // Replay "taken" confirmations queued while offline
+            this.flushQueue();
+        });
+        
+        this.socket.on('connect_error', (error) => {
+            // Refused because the patient is served by another worker
+            if (error.data && error.data.worker_url) this.moveToWorker(error.data.worker_url);
         });
         
         this.socket.on('disconnect', () => {
@@ -34,6 +53,9 @@ class MedMitraClient {
         });
         
         this.socket.on('medication_reminder', (data) => {
+            if (data.patient_id && data.patient_id !== this.patientId) {
+                return;
+            }
             this.waitingForMedicationResponse = true;
             this.handleReminder(data);
             // Show browser notification if app is in background
@@ -55,6 +77,135 @@ class MedMitraClient {
         }, 30000); // Ping every 30 seconds
     }
     
+    initializeOfflineSupport() {
+        this.doseQueue = 'indexedDB' in window ? new DoseQueue(this.patientId) : null;
+        this.localReminderTimers = [];
+        this.localDose = null;
+        this.flushing = false;
+        
+        // Remind from the last downloaded schedule straight away, then refresh it
+        this.armLocalReminders(this.cachedSchedule());
+        this.syncSchedule();
+        setInterval(() => this.syncSchedule(), SCHEDULE_REFRESH_MS);
+        window.addEventListener('online', () => {
+            this.flushQueue();
+            this.syncSchedule();
+        });
+    }
+    
+    scheduleKey() {
+        return `medmitraSchedule:${this.patientId}`;
+    }
+    
+    cachedSchedule() {
+        try {
+            return JSON.parse(localStorage.getItem(this.scheduleKey())) || [];
+        } catch (error) {
+            return [];
+        }
+    }
+    
+    async syncSchedule() {
+        try {
+            const response = await this.fetchApi(`/api/schedule?hours=${SCHEDULE_HOURS}`);
+            if (!response.ok) {
+                return;
+            }
+            const data = await response.json();
+            localStorage.setItem(this.scheduleKey(), JSON.stringify(data.doses));
+            this.armLocalReminders(data.doses);
+        } catch (error) {
+            console.log('Schedule download failed, using the cached schedule:', error);
+        }
+    }
+    
+    armLocalReminders(doses) {
+        this.localReminderTimers.forEach((timer) => clearTimeout(timer));
+        const now = Date.now();
+        this.localReminderTimers = doses
+            .map((dose) => [dose, new Date(dose.scheduled_time).getTime() - now])
+            .filter(([, delay]) => delay > 0)
+            .map(([dose, delay]) => setTimeout(() => this.fireLocalReminder(dose), delay));
+    }
+    
+    fireLocalReminder(dose) {
+        // Connected devices get the server's own reminder
+        if (this.socket && this.socket.connected) {
+            return;
+        }
+        this.localDose = dose;
+        const reminder = {
+            medication: {
+                name: dose.medication_name,
+                dosage: dose.dosage,
+                time_slot: dose.time_slot
+            },
+            message: `${dose.medication_name} ${dose.dosage} lene ka waqt ho gaya hai.\n\n` +
+                (dose.doctor_instructions ? `${dose.doctor_instructions}\n\n` : '') +
+                'Kya aapne dava le li?'
+        };
+        this.waitingForMedicationResponse = true;
+        this.handleReminder(reminder);
+        this.showBrowserNotification(reminder);
+    }
+    
+    handleOfflineMessage(text) {
+        // Without the server only a "taken" answer to a local reminder can be handled; it is queued
+        const lower = text.toLowerCase();
+        const confirmed = ['haan', 'yes', 'le li', 'ho gaya'].some((word) => lower.includes(word));
+        if (this.localDose && this.doseQueue && confirmed) {
+            this.queueTaken(this.localDose);
+        } else {
+            this.showError('Aap offline hain. Internet aane par dobara koshish karein.');
+        }
+    }
+    
+    async queueTaken(dose) {
+        try {
+            await this.doseQueue.add(dose.dose_id, localIsoString(new Date()));
+        } catch (error) {
+            console.error('Error queueing dose:', error);
+            this.showError('Failed to save your answer. Please try again.');
+            return;
+        }
+        this.localDose = null;
+        this.currentReminderMedication = null;
+        this.waitingForMedicationResponse = false;
+        this.addMessage('✅ Dava note kar li gayi hai. Internet aane par sync ho jayegi.', 'medmitra');
+        document.getElementById('reminderCard').style.display = 'none';
+    }
+    
+    async flushQueue() {
+        if (!this.doseQueue || this.flushing) {
+            return;
+        }
+        this.flushing = true;
+        try {
+            const pending = await this.doseQueue.all();
+            for (let start = 0; start < pending.length; start += ACK_BATCH_SIZE) {
+                const acks = pending.slice(start, start + ACK_BATCH_SIZE)
+                    .map((item) => ({ dose_id: item.dose_id, taken_time: item.taken_time }));
+                const response = await this.fetchApi('/api/doses/ack', {
+                    method: 'POST',
+                    headers: {
+                        'Content-Type': 'application/json',
+                    },
+                    body: JSON.stringify({ acks: acks })
+                });
+                if (!response.ok) {
+                    break;
+                }
+                // Every ack with a result is settled (taken, duplicate or rejected); the rest stay queued
+                const data = await response.json();
+                await this.doseQueue.remove(data.results.map((result) => result.dose_id));
+            }
+        } catch (error) {
+            console.log('Syncing queued doses failed, will retry when back online:', error);
+        } finally {
+            this.flushing = false;
+        }
+    }
+    
     async requestNotificationPermission() {
         if ('Notification' in window && Notification.permission === 'default') {
             try {
@@ -63,6 +214,38 @@ class MedMitraClient {
                 console.log('Notification permission request failed:', error);
             }
         }
+        if ('Notification' in window && Notification.permission === 'granted') {
+            this.subscribeToPush();
+        }
+    }
+    
+    async subscribeToPush() {
+        // Lets the server remind this device even after the app is closed
+        if (!('serviceWorker' in navigator) || !('PushManager' in window)) {
+            return;
+        }
+        try {
+            const keyResponse = await this.fetchApi('/api/push/key');
+            if (!keyResponse.ok) {
+                return; // Push isn't configured on this server
+            }
+            const { public_key: publicKey } = await keyResponse.json();
+            const registration = await navigator.serviceWorker.ready;
+            const subscription = await registration.pushManager.getSubscription() ||
+                await registration.pushManager.subscribe({
+                    userVisibleOnly: true,
+                    applicationServerKey: urlBase64ToUint8Array(publicKey)
+                });
+            await this.fetchApi('/api/push/subscribe', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                },
+                body: JSON.stringify(subscription.toJSON())
+            });
+        } catch (error) {
+            console.log('Push subscription failed:', error);
+        }
     }
     
     showBrowserNotification(data) {
@@ -352,6 +535,8 @@ class MedMitraClient {
         // Send to server via WebSocket
         if (this.socket && this.socket.connected) {
             this.socket.emit('user_message', { text: text });
+        } else if (!navigator.onLine) {
+            this.handleOfflineMessage(text);
         } else {
             // Fallback to REST API
             this.sendMessageViaAPI(text);
@@ -360,7 +545,7 @@ class MedMitraClient {
 
     async sendMessageViaAPI(text) {
         try {
-            const response = await fetch('/api/user/response', {
+            const response = await this.fetchApi('/api/user/response', {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
@@ -371,15 +556,16 @@ class MedMitraClient {
             const data = await response.json();
             this.handleResponse(data);
         } catch (error) {
+            // The server can't be reached; answer a local reminder from the queue instead
             console.error('Error sending message:', error);
-            this.showError('Failed to send message. Please try again.');
+            this.handleOfflineMessage(text);
         }
     }
 
     handleResponse(data) {
         const response = data.response;
         this.addMessage(response, 'medmitra');
-        this.speak(response);
+        this.speak(response, data.audio_url);
         
         // Check if medication was taken
         if (data.medication_taken) {
@@ -488,7 +674,7 @@ class MedMitraClient {
         
         // Speak the reminder (only if page is visible)
         if (!document.hidden) {
-            this.speak(data.message);
+            this.speak(data.message, data.audio_url);
         }
         
         // Auto-start voice listening after reminder is spoken
@@ -518,13 +704,14 @@ class MedMitraClient {
 
     async checkCurrentReminder() {
         try {
-            const response = await fetch('/api/reminder/current');
+            const response = await this.fetchApi('/api/reminder/current');
             const data = await response.json();
             
             if (data.has_reminder) {
                 this.handleReminder({
                     message: data.reminder_text,
-                    medication: data.medication
+                    medication: data.medication,
+                    audio_url: data.audio_url
                 });
             }
         } catch (error) {
@@ -532,6 +719,27 @@ class MedMitraClient {
         }
     }
 
+    apiUrl(path) {
+        const separator = path.includes('?') ? '&' : '?';
+        return `${path}${separator}patient_id=${encodeURIComponent(this.patientId)}&session_id=${this.sessionId}`;
+    }
+
+    async fetchApi(path, options) {
+        const response = await fetch(this.apiUrl(path), options);
+        if (response.status === 421) {
+            // The patient is served by another worker: reopen this page there
+            const hint = await response.clone().json().catch(() => ({}));
+            this.moveToWorker(hint.worker_url);
+        }
+        return response;
+    }
+
+    moveToWorker(workerUrl) {
+        if (workerUrl && new URL(workerUrl).origin !== window.location.origin) {
+            window.location.replace(workerUrl + window.location.pathname + window.location.search);
+        }
+    }
+
     addMessage(text, type) {
         const chatMessages = document.getElementById('chatMessages');
         const messageDiv = document.createElement('div');
@@ -551,11 +759,32 @@ class MedMitraClient {
         chatMessages.scrollTop = chatMessages.scrollHeight;
     }
 
-    speak(text) {
+    speak(text, audioUrl = null) {
         // Stop any current speech
         if (this.currentUtterance) {
             this.synthesis.cancel();
         }
+        if (this.currentAudio) {
+            this.currentAudio.pause();
+            this.currentAudio = null;
+        }
+        
+        // Prefer audio rendered on the server; fall back to browser speech if it can't play
+        if (audioUrl) {
+            const audio = new Audio(audioUrl);
+            this.currentAudio = audio;
+            audio.onended = () => {
+                this.currentAudio = null;
+            };
+            audio.play().catch((error) => {
+                console.error('Reminder audio playback error:', error);
+                if (this.currentAudio === audio) {
+                    this.currentAudio = null;
+                    this.speak(text);
+                }
+            });
+            return;
+        }
         
         // Create new utterance
         const utterance = new SpeechSynthesisUtterance(text);
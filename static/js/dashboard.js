@@ -6,41 +6,165 @@ class Dashboard {
         this.currentTab = 'medications';
         this.medications = [];
         this.history = [];
+        this.historyCursor = null;
+        this.seq = null;
+        const params = new URLSearchParams(window.location.search);
+        this.patientId = params.get('patient_id') || 'default';
+        // Caregiver token from the dashboard link the server printed; without it no live updates
+        this.token = params.get('token') || '';
         
         this.initializeSocket();
         this.initializeUI();
-        this.loadMedications();
-        this.loadHistory();
+        this.reloadAll();
     }
 
     initializeSocket() {
-        this.socket = io();
+        this.socket = io({ query: { patient_id: this.patientId, role: 'caregiver', token: this.token } });
         
-        this.socket.on('connect', () => {
-            console.log('Connected to MedMitra server');
-        });
-        
-        this.socket.on('medication_reminder', (data) => {
-            // Update history when reminder is sent
-            this.loadHistory();
+        this.socket.on('connect_error', (error) => {
+            if (error.data && error.data.worker_url) {
+                this.moveToWorker(error.data.worker_url);
+                return;
+            }
+            console.warn('Live updates unavailable:', error.message);
         });
         
-        this.socket.on('medication_taken', (data) => {
-            // Update history when medication is taken
-            this.loadHistory();
+        this.socket.on('connect', () => {
+            console.log('Connected to MedMitra server');
+            // Catch up on anything missed while disconnected
+            if (this.seq !== null) {
+                this.syncState();
+            }
         });
         
-        this.socket.on('medication_added', (data) => {
-            // Reload medications when new one is added
-            this.loadMedications();
+        this.socket.on('state_delta', (delta) => {
+            if (this.isForPatient(delta)) this.handleDelta(delta);
         });
-        
-        this.socket.on('medication_deleted', (data) => {
-            // Reload medications when one is deleted
-            this.loadMedications();
+    }
+
+    async reloadAll() {
+        this.seq = null;
+        const seqs = await Promise.all([this.loadMedications(), this.loadHistory()]);
+        // Deltas are idempotent upserts, so resuming from the older snapshot is safe
+        if (seqs.every(seq => typeof seq === 'number')) {
+            this.seq = Math.min(...seqs);
+            this.syncState();
+        }
+    }
+
+    syncState() {
+        this.socket.emit('sync', { since: this.seq }, (result) => {
+            if (result.success === false) {
+                console.warn('Live updates unavailable:', result.error);
+                return;
+            }
+            if (result.reset) {
+                this.reloadAll();
+                return;
+            }
+            result.deltas.forEach(delta => this.handleDelta(delta));
         });
     }
 
+    handleDelta(delta) {
+        if (this.seq === null || delta.seq <= this.seq) {
+            return;
+        }
+        if (delta.seq !== this.seq + 1) {
+            // Missed one or more deltas - ask the server for the gap
+            this.syncState();
+            return;
+        }
+        this.applyDelta(delta);
+        this.seq = delta.seq;
+    }
+
+    applyDelta(delta) {
+        const data = delta.data;
+        switch (delta.op) {
+            case 'medication_added':
+                this.medications = this.medications.filter(med => med.name !== data.name).concat([data]);
+                this.renderMedications();
+                this.renderMedicationFilter();
+                break;
+            case 'medications_imported': {
+                const names = new Set(data.medications.map(med => med.name));
+                this.medications = this.medications.filter(med => !names.has(med.name)).concat(data.medications);
+                this.renderMedications();
+                this.renderMedicationFilter();
+                break;
+            }
+            case 'medication_removed':
+                this.medications = this.medications.filter(med => med.name !== data.name);
+                this.renderMedications();
+                this.renderMedicationFilter();
+                break;
+            case 'record':
+                this.upsertHistoryRecord(data);
+                break;
+        }
+    }
+
+    upsertHistoryRecord(record) {
+        const index = this.history.findIndex(item => item.dose_id === record.dose_id);
+        const matches = this.recordMatchesFilters(record);
+
+        if (index >= 0) {
+            if (matches) {
+                this.history[index] = record;
+            } else {
+                this.history.splice(index, 1);
+            }
+        } else if (matches) {
+            // Only place it if it falls inside the pages already loaded
+            const position = this.history.findIndex(item => item.scheduled_time < record.scheduled_time);
+            if (position >= 0) {
+                this.history.splice(position, 0, record);
+            } else if (!this.historyCursor) {
+                this.history.push(record);
+            } else {
+                return;
+            }
+        } else {
+            return;
+        }
+        this.renderHistory();
+    }
+
+    recordMatchesFilters(record) {
+        const params = this.historyQuery();
+        const status = record.taken ? 'taken' : (record.missed ? 'missed' : 'pending');
+        if (params.has('status') && params.get('status') !== status) return false;
+        if (params.has('medication') && params.get('medication') !== record.medication_name) return false;
+        if (params.has('start') && record.scheduled_time.slice(0, 10) < params.get('start')) return false;
+        return true;
+    }
+
+    isForPatient(data) {
+        return !data.patient_id || data.patient_id === this.patientId;
+    }
+
+    apiUrl(path) {
+        const separator = path.includes('?') ? '&' : '?';
+        return `${path}${separator}patient_id=${encodeURIComponent(this.patientId)}`;
+    }
+
+    async fetchApi(path, options) {
+        const response = await fetch(this.apiUrl(path), options);
+        if (response.status === 421) {
+            // The patient is served by another worker: reopen this page there
+            const hint = await response.clone().json().catch(() => ({}));
+            this.moveToWorker(hint.worker_url);
+        }
+        return response;
+    }
+
+    moveToWorker(workerUrl) {
+        if (workerUrl && new URL(workerUrl).origin !== window.location.origin) {
+            window.location.replace(workerUrl + window.location.pathname + window.location.search);
+        }
+    }
+
     initializeUI() {
         // Tab switching
         document.querySelectorAll('.nav-tab').forEach(tab => {
@@ -70,9 +194,15 @@ class Dashboard {
             this.addMedication();
         });
 
-        // History filter
-        document.getElementById('historyFilter').addEventListener('change', (e) => {
-            this.filterHistory(e.target.value);
+        // History filters
+        ['historyFilter', 'historyStatusFilter', 'historyMedicationFilter'].forEach(id => {
+            document.getElementById(id).addEventListener('change', () => {
+                this.loadHistory();
+            });
+        });
+
+        document.getElementById('loadMoreHistoryBtn').addEventListener('click', () => {
+            this.loadHistory(true);
         });
 
         // Copy patient link
@@ -117,7 +247,7 @@ For detailed instructions, see: PATIENT_MOBILE_SETUP.md
         }
 
         // Set patient link
-        const patientLink = window.location.origin + '/';
+        const patientLink = window.location.origin + '/?patient_id=' + encodeURIComponent(this.patientId);
         document.getElementById('patientLink').value = patientLink;
 
         // Close modal on outside click
@@ -146,10 +276,12 @@ For detailed instructions, see: PATIENT_MOBILE_SETUP.md
 
     async loadMedications() {
         try {
-            const response = await fetch('/api/medications');
+            const response = await this.fetchApi('/api/medications');
             const data = await response.json();
             this.medications = data.medications;
             this.renderMedications();
+            this.renderMedicationFilter();
+            return data.seq;
         } catch (error) {
             console.error('Error loading medications:', error);
         }
@@ -199,6 +331,16 @@ For detailed instructions, see: PATIENT_MOBILE_SETUP.md
         `).join('');
     }
 
+    renderMedicationFilter() {
+        const select = document.getElementById('historyMedicationFilter');
+        const selected = select.value;
+        select.innerHTML = '<option value="">All Medications</option>' +
+            this.medications.map(med => `
+                <option value="${this.escapeHtml(med.name)}">${this.escapeHtml(med.name)}</option>
+            `).join('');
+        select.value = this.medications.some(med => med.name === selected) ? selected : '';
+    }
+
     async addMedication() {
         const formData = {
             name: document.getElementById('medName').value,
@@ -209,7 +351,7 @@ For detailed instructions, see: PATIENT_MOBILE_SETUP.md
         };
 
         try {
-            const response = await fetch('/api/medications', {
+            const response = await this.fetchApi('/api/medications', {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json'
@@ -220,8 +362,8 @@ For detailed instructions, see: PATIENT_MOBILE_SETUP.md
             const data = await response.json();
             
             if (data.success) {
+                // The medication list updates from the server's state_delta
                 this.closeMedicationModal();
-                this.loadMedications();
                 // Reset form
                 document.getElementById('medicationForm').reset();
             } else {
@@ -239,15 +381,13 @@ For detailed instructions, see: PATIENT_MOBILE_SETUP.md
         }
 
         try {
-            const response = await fetch(`/api/medications/${encodeURIComponent(medName)}`, {
+            const response = await this.fetchApi(`/api/medications/${encodeURIComponent(medName)}`, {
                 method: 'DELETE'
             });
 
             const data = await response.json();
             
-            if (data.success) {
-                this.loadMedications();
-            } else {
+            if (!data.success) {
                 alert('Error: ' + (data.error || 'Failed to delete medication'));
             }
         } catch (error) {
@@ -256,18 +396,45 @@ For detailed instructions, see: PATIENT_MOBILE_SETUP.md
         }
     }
 
-    async loadHistory() {
+    historyQuery() {
+        const params = new URLSearchParams({ limit: 50 });
+        const range = document.getElementById('historyFilter').value;
+        const status = document.getElementById('historyStatusFilter').value;
+        const medication = document.getElementById('historyMedicationFilter').value;
+
+        if (range === 'today' || range === 'week') {
+            const start = new Date();
+            if (range === 'week') {
+                start.setDate(start.getDate() - 6);
+            }
+            params.set('start', this.formatDate(start));
+        }
+        if (status) params.set('status', status);
+        if (medication) params.set('medication', medication);
+        return params;
+    }
+
+    async loadHistory(loadMore = false) {
+        const params = this.historyQuery();
+        if (loadMore && this.historyCursor) {
+            params.set('cursor', this.historyCursor);
+        }
+
         try {
-            const response = await fetch('/api/history');
+            const response = await this.fetchApi(`/api/history?${params}`);
             const data = await response.json();
-            this.history = data.history || [];
-            this.renderHistory();
+            const page = data.history || [];
+            this.history = loadMore ? this.history.concat(page) : page;
+            this.historyCursor = data.next_cursor || null;
+            this.renderHistory(loadMore ? page : null);
+            document.getElementById('loadMoreHistoryBtn').style.display = this.historyCursor ? 'block' : 'none';
+            return data.seq;
         } catch (error) {
             console.error('Error loading history:', error);
         }
     }
 
-    renderHistory() {
+    renderHistory(appended = null) {
         const list = document.getElementById('historyList');
         
         if (this.history.length === 0) {
@@ -279,7 +446,7 @@ For detailed instructions, see: PATIENT_MOBILE_SETUP.md
             return;
         }
 
-        list.innerHTML = this.history.map(record => {
+        const html = (appended || this.history).map(record => {
             const date = new Date(record.scheduled_time);
             const status = record.taken ? 'taken' : (record.missed ? 'missed' : 'pending');
             const statusText = record.taken ? 'Taken' : (record.missed ? 'Missed' : 'Pending');
@@ -299,12 +466,17 @@ For detailed instructions, see: PATIENT_MOBILE_SETUP.md
                 </div>
             `;
         }).join('');
+
+        if (appended) {
+            list.insertAdjacentHTML('beforeend', html);
+        } else {
+            list.innerHTML = html;
+        }
     }
 
-    filterHistory(filter) {
-        // This would filter the history based on the filter value
-        // For now, we'll just reload all history
-        this.loadHistory();
+    formatDate(date) {
+        const pad = (n) => String(n).padStart(2, '0');
+        return `${date.getFullYear()}-${pad(date.getMonth() + 1)}-${pad(date.getDate())}`;
     }
 
     openMedicationModal() {
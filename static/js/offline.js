@@ -0,0 +1,74 @@
+// MedMitra offline and push support
+// The patient app downloads its upcoming doses ahead of time so reminders still fire
+// while the phone is offline, and queues "taken" confirmations until it reconnects.
+
+const SCHEDULE_HOURS = 48;
+const SCHEDULE_REFRESH_MS = 60 * 60 * 1000; // Re-download the schedule every hour
+const ACK_BATCH_SIZE = 100;
+
+// Naive local ISO time (no "Z"), matching the patient-local times the server uses
+function localIsoString(date) {
+    const offset = date.getTimezoneOffset() * 60000;
+    return new Date(date.getTime() - offset).toISOString().slice(0, 19);
+}
+
+// VAPID public keys are served base64url-encoded; PushManager wants raw bytes
+function urlBase64ToUint8Array(base64String) {
+    const padding = '='.repeat((4 - base64String.length % 4) % 4);
+    const raw = atob((base64String + padding).replace(/-/g, '+').replace(/_/g, '/'));
+    return Uint8Array.from(raw, (char) => char.charCodeAt(0));
+}
+
+class DoseQueue {
+    // "Taken" confirmations waiting to reach the server, kept in IndexedDB so they survive reloads
+    constructor(patientId) {
+        this.patientId = patientId;
+        this.storeName = 'pendingAcks';
+        this.dbPromise = null;
+    }
+
+    open() {
+        if (!this.dbPromise) {
+            this.dbPromise = new Promise((resolve, reject) => {
+                const request = indexedDB.open('medmitra', 1);
+                request.onupgradeneeded = () => {
+                    const store = request.result.createObjectStore(this.storeName, { keyPath: 'key' });
+                    store.createIndex('patientId', 'patientId');
+                };
+                request.onsuccess = () => resolve(request.result);
+                request.onerror = () => reject(request.error);
+            });
+        }
+        return this.dbPromise;
+    }
+
+    async transaction(mode, work) {
+        const db = await this.open();
+        return new Promise((resolve, reject) => {
+            const tx = db.transaction(this.storeName, mode);
+            const request = work(tx.objectStore(this.storeName));
+            tx.oncomplete = () => resolve(request ? request.result : undefined);
+            tx.onerror = () => reject(tx.error);
+        });
+    }
+
+    add(doseId, takenTime) {
+        // Keyed by patient and dose, so confirming the same dose twice queues it once
+        return this.transaction('readwrite', (store) => store.put({
+            key: `${this.patientId}|${doseId}`,
+            patientId: this.patientId,
+            dose_id: doseId,
+            taken_time: takenTime
+        }));
+    }
+
+    all() {
+        return this.transaction('readonly', (store) => store.index('patientId').getAll(this.patientId));
+    }
+
+    remove(doseIds) {
+        return this.transaction('readwrite', (store) => {
+            doseIds.forEach((doseId) => store.delete(`${this.patientId}|${doseId}`));
+        });
+    }
+}
@@ -1,8 +1,9 @@
 // MedMitra Service Worker for PWA
-const CACHE_NAME = 'medmitra-v1';
+const CACHE_NAME = 'medmitra-v4';
 const urlsToCache = [
   '/',
   '/static/css/style.css',
+  '/static/js/offline.js',
   '/static/js/app.js',
   '/static/manifest.json'
 ];
@@ -19,8 +20,10 @@ self.addEventListener('install', (event) => {
 
 // Fetch event - serve from cache, fallback to network
 self.addEventListener('fetch', (event) => {
+  // Pages are opened with ?patient_id=...; serve them all from the cached app shell
+  const options = event.request.mode === 'navigate' ? { ignoreSearch: true } : {};
   event.respondWith(
-    caches.match(event.request)
+    caches.match(event.request, options)
       .then((response) => {
         // Return cached version or fetch from network
         return response || fetch(event.request);
@@ -43,3 +46,41 @@ self.addEventListener('activate', (event) => {
   );
 });
 
+// Push event - show a reminder sent while the app was closed
+self.addEventListener('push', (event) => {
+  const data = event.data ? event.data.json() : {};
+  const medication = data.medication || {};
+  event.waitUntil(
+    clients.matchAll({ type: 'window', includeUncontrolled: true })
+      .then((windows) => {
+        // An app on screen already got this reminder over its socket
+        if (windows.some((client) => client.visibilityState === 'visible')) {
+          return;
+        }
+        return self.registration.showNotification('🔔 Medication Reminder', {
+          body: medication.name
+            ? `${medication.name} ${medication.dosage} - Time to take your medication!`
+            : 'Time to take your medication!',
+          icon: '/static/icon-192.png',
+          badge: '/static/icon-192.png',
+          tag: 'medication-reminder',
+          renotify: true,
+          requireInteraction: true,
+          vibrate: [200, 100, 200],
+          data: { url: data.patient_id ? `/?patient_id=${encodeURIComponent(data.patient_id)}` : '/' }
+        });
+      })
+  );
+});
+
+// Notification click - open (or focus) the app so the patient can answer
+self.addEventListener('notificationclick', (event) => {
+  event.notification.close();
+  event.waitUntil(
+    clients.matchAll({ type: 'window', includeUncontrolled: true })
+      .then((windows) => {
+        const existing = windows.find((client) => 'focus' in client);
+        return existing ? existing.focus() : clients.openWindow(event.notification.data.url);
+      })
+  );
+});
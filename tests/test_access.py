@@ -0,0 +1,47 @@
+"""
+Tests for caregiver tokens and the caregiver-only Socket.IO events
+"""
+from medmitra.access import CaregiverAccess
+from medmitra.medication import Medication, TimeSlot
+
+
+def test_token_is_per_patient_and_per_secret():
+    access = CaregiverAccess(b"secret")
+    token = access.token_for("sharma")
+    
+    assert access.verify("sharma", token)
+    assert not access.verify("verma", token)
+    assert not access.verify("sharma", None) and not access.verify("sharma", "")
+    assert not CaregiverAccess(b"other secret").verify("sharma", token)
+    assert access.dashboard_path("sharma").endswith(f"token={token}")
+
+
+def connect(web, patient_id: str, **query):
+    query = "&".join(f"{key}={value}" for key, value in dict(patient_id=patient_id, **query).items())
+    return web.socketio.test_client(web.app, query_string=query)
+
+
+def test_caregiver_socket_needs_the_patients_token():
+    from medmitra import app as web
+    
+    assert not connect(web, "access-refused", role="caregiver", token="guess").is_connected()
+    assert not connect(web, "access-refused", role="caregiver").is_connected()
+    token = web.caregiver_access.token_for("access-refused")
+    assert connect(web, "access-refused", role="caregiver", token=token).is_connected()
+
+
+def test_only_caregivers_can_sync_a_patients_changes():
+    from medmitra import app as web
+    
+    web.tenants.get("access-sync").medication_manager.add_medication(
+        Medication("Aspirin", "75mg", TimeSlot.MORNING, "", patient_id="access-sync"))
+    patient = connect(web, "access-sync")
+    caregiver = connect(web, "access-sync", role="caregiver", token=web.caregiver_access.token_for("access-sync"))
+    
+    refused = patient.emit("sync", {"since": 0}, callback=True)
+    assert refused["success"] is False and "deltas" not in refused
+    assert "deltas" not in patient.emit("sync", {"since": 0, "patient_id": "access-sync"}, callback=True)
+    
+    synced = caregiver.emit("sync", {"since": 0}, callback=True)
+    assert [delta["op"] for delta in synced["deltas"]] == ["medication_added"]
+    assert "deltas" not in caregiver.emit("sync", {"since": 0, "patient_id": "access-other"}, callback=True)
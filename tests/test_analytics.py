@@ -0,0 +1,174 @@
+"""
+Tests for the columnar adherence analytics
+"""
+import random
+from datetime import date, datetime, timedelta
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from medmitra.analytics import AdherenceAnalytics, compare_patients
+from medmitra.medication import Medication, MedicationManager, MedicationRecord, TimeSlot
+
+START = datetime(2026, 9, 1)
+
+
+def make_patient(patient_id: str = "p1", days: int = 60, seed: int = 2) -> MedicationManager:
+    """A patient with two medications and a mix of taken, late, missed and pending doses"""
+    generator = random.Random(seed)
+    manager = MedicationManager(patient_id)
+    medications = [Medication("Aspirin", "75mg", TimeSlot.MORNING, "", patient_id=patient_id),
+                   Medication("Metformin", "500mg", TimeSlot.NIGHT, "", patient_id=patient_id)]
+    for day in range(days):
+        for medication in medications:
+            if generator.random() < 0.1:
+                continue
+            scheduled = datetime.combine(START.date() + timedelta(days=day), medication.get_time())
+            record = MedicationRecord(medication, scheduled)
+            manager.add_record(record)
+            outcome = generator.random()
+            if outcome < 0.7:
+                manager.mark_record_taken(record, scheduled + timedelta(minutes=generator.randint(0, 90)))
+            elif outcome < 0.9:
+                manager.mark_record_missed(record)
+    return manager
+
+
+def counts(records) -> dict:
+    taken = sum(record.taken for record in records)
+    missed = sum(record.missed for record in records)
+    finished = taken + missed
+    return {"scheduled": len(records), "taken": taken, "missed": missed, "pending": len(records) - finished,
+            "adherence": round(100.0 * taken / finished, 1) if finished else None}
+
+
+def streaks(records) -> dict:
+    """Runs of consecutive dose days with no missed dose (days with only pending doses skipped)"""
+    days = {}
+    for record in records:
+        if record.taken or record.missed:
+            days[record.scheduled_time.date()] = days.get(record.scheduled_time.date(), True) and record.taken
+    lengths, run = [], 0
+    for day in sorted(days):
+        run = run + 1 if days[day] else 0
+        lengths.append(run)
+    return {"current": lengths[-1] if lengths else 0, "longest": max(lengths, default=0)}
+
+
+def test_rollup_matches_plain_python_counts():
+    manager = make_patient()
+    records = list(manager.records)
+    
+    rollup = AdherenceAnalytics(manager).rollup()
+    
+    assert rollup["overall"] == counts(records)
+    for entry in rollup["medications"]:
+        mine = [record for record in records if record.medication.name == entry["medication"]]
+        assert {key: entry[key] for key in counts(mine)} == counts(mine)
+    for entry in rollup["time_slots"]:
+        mine = [record for record in records if record.medication.time_slot.value == entry["time_slot"]]
+        assert {key: entry[key] for key in counts(mine)} == counts(mine)
+    for entry in rollup["weeks"]:
+        week_start = date.fromisoformat(entry["week_start"])
+        assert week_start.weekday() == 0
+        mine = [record for record in records
+                if week_start <= record.scheduled_time.date() < week_start + timedelta(days=7)]
+        assert {key: entry[key] for key in counts(mine)} == counts(mine)
+    assert sum(entry["scheduled"] for entry in rollup["weeks"]) == len(records)
+    assert rollup["streaks"] == streaks(records)
+
+
+def test_lateness_per_medication():
+    manager = make_patient()
+    rollup = AdherenceAnalytics(manager).rollup()
+    
+    for entry in rollup["medications"]:
+        late = sorted((record.taken_time - record.scheduled_time).total_seconds() / 60
+                      for record in manager.records
+                      if record.taken and record.medication.name == entry["medication"])
+        assert entry["late_minutes"] == {
+            "mean": round(sum(late) / len(late), 1),
+            "median": round(late[min(len(late) - 1, int(0.5 * len(late)))], 1),
+            "p90": round(late[min(len(late) - 1, int(0.9 * len(late)))], 1),
+        }
+
+
+def test_observed_changes_refresh_the_cached_rollup():
+    manager = MedicationManager("p1")
+    analytics = AdherenceAnalytics(manager)
+    medication = Medication("Aspirin", "75mg", TimeSlot.MORNING, "", patient_id="p1")
+    record = MedicationRecord(medication, START)
+    manager.add_record(record)
+    analytics.observe(record)
+    
+    assert analytics.rollup()["overall"]["pending"] == 1
+    assert analytics.rollup() is analytics.rollup()
+    
+    manager.mark_record_taken(record, START + timedelta(minutes=20))
+    analytics.observe(record)
+    rollup = analytics.rollup()
+    
+    assert rollup["overall"] == {"scheduled": 1, "taken": 1, "missed": 0, "pending": 0, "adherence": 100.0}
+    assert rollup["medications"][0]["late_minutes"]["mean"] == 20.0
+    assert rollup["streaks"] == {"current": 1, "longest": 1}
+
+
+def test_columns_grow_past_their_initial_capacity():
+    manager = make_patient(days=200)
+    
+    assert AdherenceAnalytics(manager).rollup()["overall"]["scheduled"] == len(manager.records)
+
+
+def test_patients_are_compared_lowest_adherence_first():
+    rollups = {patient_id: AdherenceAnalytics(make_patient(patient_id, seed=seed)).rollup()
+               for patient_id, seed in (("a", 1), ("b", 2), ("c", 3))}
+    rollups["new"] = AdherenceAnalytics(MedicationManager("new")).rollup()
+    
+    rows = compare_patients(rollups)
+    
+    assert [row["patient_id"] for row in rows][-1] == "new"
+    adherence = [row["adherence"] for row in rows[:-1]]
+    assert adherence == sorted(adherence)
+
+
+def test_comparing_every_patient_needs_the_operator_token(monkeypatch):
+    from medmitra import app as web
+    
+    client = web.app.test_client()
+    monkeypatch.setattr(web.caregiver_access, "operator_token", "operator-secret")
+    
+    assert client.get("/api/adherence?scope=all").status_code == 403
+    assert client.get("/api/adherence?scope=all", headers={"X-Operator-Token": "wrong"}).status_code == 403
+    response = client.get("/api/adherence?scope=all", headers={"X-Operator-Token": "operator-secret"})
+    assert response.status_code == 200 and "patients" in response.get_json()
+
+
+def test_compaction_drops_rows_outside_the_retention_window():
+    manager = make_patient(days=60)
+    analytics = AdherenceAnalytics(manager)
+    analytics.rollup()
+    cutoff = (START + timedelta(days=45)).date()
+    
+    manager.records.compact(cutoff)
+    dropped = analytics.compact(cutoff)
+    rollup = analytics.rollup()
+    
+    assert dropped > 0 and analytics._size == len(manager.records) < len(analytics._status)
+    assert rollup["overall"] == counts(list(manager.records))
+    assert rollup["streaks"] == streaks(list(manager.records))
+    assert rollup == AdherenceAnalytics(manager).rollup()
+    assert analytics.compact(cutoff) == 0
+
+
+def test_records_compacted_by_the_scheduler_leave_the_tenants_analytics():
+    from medmitra import app as web
+    
+    tenant = web.tenants.get("analytics-compact")
+    for record in make_patient("analytics-compact", days=30).records:
+        tenant.medication_manager.add_record(record)
+    assert tenant.analytics.rollup()["overall"]["scheduled"] == len(tenant.medication_manager.records)
+    
+    assert tenant.medication_manager.compact_records((START + timedelta(days=20)).date()) > 0
+    
+    assert tenant.analytics.rollup()["overall"] == counts(list(tenant.medication_manager.records))
@@ -0,0 +1,134 @@
+"""
+Tests for bulk medication import/export: row parsing, validation and the streaming endpoints
+"""
+import io
+import json
+
+import pytest
+
+from medmitra import bulk
+from medmitra.medication import Medication, TimeSlot
+from medmitra.recurrence import Recurrence
+
+
+def rows(text: str, fmt: str) -> list:
+    return list(bulk.read_rows(io.BytesIO(text.encode("utf-8")), fmt))
+
+
+def validate(text: str, fmt: str = "ndjson", check_patient=lambda patient_id: None):
+    return bulk.validate_rows(rows(text, fmt), "p1", check_patient)
+
+
+def test_format_comes_from_the_parameter_or_content_type():
+    assert bulk.format_for("text/csv") == "csv"
+    assert bulk.format_for("application/x-ndjson") == "ndjson"
+    assert bulk.format_for("text/csv", "ndjson") == "ndjson"
+    with pytest.raises(ValueError):
+        bulk.format_for(None, "xml")
+
+
+def test_ndjson_rows_become_medications():
+    medications, errors = validate(
+        '{"name": "Aspirin", "dosage": "75mg", "time_slot": "morning"}\n'
+        '\n'
+        '{"name": "Metformin", "dosage": "500mg", "recurrence": "FREQ=DAILY;BYHOUR=20", "patient_id": "p2"}\n')
+    
+    assert errors == []
+    assert [(med.name, med.time_slot, med.patient_id) for med in medications] == [
+        ("Aspirin", TimeSlot.MORNING, "p1"), ("Metformin", TimeSlot.NIGHT, "p2")]
+    assert medications[1].recurrence == Recurrence.parse("FREQ=DAILY;BYHOUR=20")
+
+
+def test_csv_rows_become_medications():
+    medications, errors = validate("name,dosage,time_slot,doctor_instructions\n"
+                                   "Aspirin,75mg,Evening,after food\n", "csv")
+    
+    assert errors == []
+    assert medications[0].doctor_instructions == "after food"
+    assert medications[0].time_slot is TimeSlot.EVENING
+
+
+def test_invalid_rows_are_reported_by_line():
+    medications, errors = validate(
+        '{"name": "Aspirin", "dosage": "75mg", "time_slot": "morning"}\n'
+        '{"name": "Aspirin"\n'
+        '{"dosage": "75mg", "time_slot": "morning"}\n'
+        '{"name": "X", "dosage": "1", "time_slot": "midnight"}\n'
+        '{"name": "Y", "dosage": "1", "recurrence": "FREQ=YEARLY"}\n'
+        '["not", "an", "object"]\n')
+    
+    assert len(medications) == 1
+    assert [error["line"] for error in errors] == [2, 3, 4, 5, 6]
+    assert "missing name" in errors[1]["error"]
+    assert "unknown time_slot" in errors[2]["error"]
+
+
+def test_rows_for_other_patients_can_be_refused():
+    _, errors = validate('{"name": "A", "dosage": "1", "time_slot": "morning", "patient_id": "elsewhere"}\n',
+                         check_patient=lambda patient_id: "not here" if patient_id == "elsewhere" else None)
+    
+    assert errors == [{"line": 1, "error": "not here"}]
+
+
+def test_errors_are_capped():
+    _, errors = validate('{"name": ""}\n' * (bulk.MAX_ERRORS + 20))
+    
+    assert len(errors) == bulk.MAX_ERRORS
+
+
+@pytest.mark.parametrize("fmt", ["ndjson", "csv"])
+def test_export_round_trips_through_import(fmt):
+    medications = [
+        Medication("Aspirin", "75mg", TimeSlot.MORNING, "after food, with water", patient_id="p1"),
+        Medication("Prednisone", "40mg", TimeSlot.MORNING, "", user_name="Asha", patient_id="p2",
+                   recurrence=Recurrence.parse("FREQ=DAILY;BYHOUR=9;X-TAPER=0:40mg,7:20mg")),
+    ]
+    exported = "".join(bulk.export_rows(medications, fmt))
+    
+    imported, errors = validate(exported, fmt)
+    
+    assert errors == []
+    assert imported == medications
+
+
+def test_import_and_export_endpoints():
+    from medmitra import app as web
+    
+    client = web.app.test_client()
+    upload = ('{"name": "Aspirin", "dosage": "75mg", "time_slot": "morning"}\n'
+              '{"name": "Aspirin", "dosage": "150mg", "time_slot": "morning"}\n'
+              '{"name": "Metformin", "dosage": "500mg", "time_slot": "night"}\n')
+    
+    response = client.post("/api/medications/import?patient_id=bulk-test", data=upload,
+                           content_type="application/x-ndjson")
+    
+    assert response.get_json() == {"success": True, "imported": 2, "patients": 1}
+    exported = client.get("/api/medications/export?patient_id=bulk-test").get_data(as_text=True)
+    assert [(row["name"], row["dosage"]) for row in map(json.loads, exported.splitlines())] == [
+        ("Aspirin", "150mg"), ("Metformin", "500mg")]
+    
+    rejected = client.post("/api/medications/import?patient_id=bulk-test",
+                           data='{"name": "Zinc"}\n', content_type="application/x-ndjson")
+    assert rejected.status_code == 400
+    assert len(web.tenants.get("bulk-test").medication_manager.medications) == 2
+
+
+def test_exporting_every_patient_needs_the_operator_token(monkeypatch):
+    from medmitra import app as web
+    
+    web.tenants.get("bulk-operator").medication_manager.add_medication(
+        Medication("Zinc", "10mg", TimeSlot.MORNING, "", patient_id="bulk-operator"))
+    client = web.app.test_client()
+    
+    monkeypatch.setattr(web.caregiver_access, "operator_token", None)
+    assert client.get("/api/medications/export?scope=all").status_code == 403
+    assert client.get("/api/medications/export?scope=all",
+                      headers={"X-Operator-Token": "anything"}).status_code == 403
+    
+    monkeypatch.setattr(web.caregiver_access, "operator_token", "operator-secret")
+    assert client.get("/api/medications/export?scope=all",
+                      headers={"X-Operator-Token": "wrong"}).status_code == 403
+    response = client.get("/api/medications/export?scope=all", headers={"X-Operator-Token": "operator-secret"})
+    assert response.status_code == 200
+    exported = map(json.loads, response.get_data(as_text=True).splitlines())
+    assert "bulk-operator" in {row["patient_id"] for row in exported}
@@ -0,0 +1,77 @@
+"""
+Tests for the per-patient change log and the dashboard sync that reads it
+"""
+import threading
+
+from medmitra.changes import ChangeLog
+from medmitra.medication import Medication, TimeSlot
+
+
+def test_deltas_are_numbered_in_order():
+    log = ChangeLog()
+    
+    first = log.append("medication_added", {"name": "Aspirin"})
+    second = log.append("medication_removed", {"name": "Aspirin"})
+    
+    assert (first["seq"], second["seq"], log.seq) == (1, 2, 2)
+    assert log.since(0) == [first, second]
+    assert log.since(1) == [second]
+    assert log.since(2) == []
+
+
+def test_concurrent_appends_get_distinct_numbers():
+    log = ChangeLog(capacity=10_000)
+    
+    def append_many():
+        for _ in range(500):
+            log.append("record", {})
+    
+    threads = [threading.Thread(target=append_many) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    assert [delta["seq"] for delta in log.since(0)] == list(range(1, 2001))
+
+
+def test_only_the_most_recent_deltas_are_kept():
+    log = ChangeLog(capacity=3)
+    for n in range(5):
+        log.append("record", {"n": n})
+    
+    assert [delta["seq"] for delta in log.since(2)] == [3, 4, 5]
+    assert [delta["data"]["n"] for delta in log.since(3)] == [3, 4]
+    # Deltas 1-2 were trimmed, so a client that saw nothing (or only delta 1) must reload
+    assert log.since(0) is None
+    assert log.since(1) is None
+
+
+def test_a_client_ahead_of_the_log_must_reload():
+    log = ChangeLog()
+    log.append("record", {})
+    
+    assert log.since(5) is None
+    assert ChangeLog().since(0) == []
+
+
+def test_dashboard_sync_catches_up_or_resets(monkeypatch):
+    from medmitra import app as web
+    
+    tenant = web.tenants.get("changes-sync")
+    monkeypatch.setattr(tenant, "changes", ChangeLog(capacity=3))
+    for name in ("A", "B", "C", "D", "E"):
+        tenant.medication_manager.add_medication(
+            Medication(name, "1", TimeSlot.MORNING, "", patient_id="changes-sync"))
+    token = web.caregiver_access.token_for("changes-sync")
+    dashboard = web.socketio.test_client(
+        web.app, query_string=f"patient_id=changes-sync&role=caregiver&token={token}")
+    patient = web.socketio.test_client(web.app, query_string="patient_id=changes-sync")
+    
+    caught_up = dashboard.emit("sync", {"since": 3}, callback=True)
+    assert caught_up["seq"] == 5
+    assert [delta["data"]["name"] for delta in caught_up["deltas"]] == ["D", "E"]
+    assert dashboard.emit("sync", {"since": 1}, callback=True) == {"seq": 5, "reset": True}
+    assert dashboard.emit("sync", {"since": 9}, callback=True) == {"seq": 5, "reset": True}
+    refused = patient.emit("sync", {"since": 3}, callback=True)
+    assert refused == {"success": False, "error": "Invalid caregiver token"}
@@ -0,0 +1,125 @@
+"""
+Tests for the caregiver notification dispatcher: batching, dedupe, retries and urgent alerts
+"""
+import time
+from datetime import datetime
+
+import pytest
+
+from medmitra.caregiver_notifier import CaregiverNotifier
+from medmitra.dispatch import NotificationDispatcher, StubTransport, digest
+from medmitra.medication import Medication, MedicationManager, MedicationRecord, TimeSlot
+
+
+def wait_for(condition, timeout: float = 2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            pytest.fail("timed out waiting for the dispatcher")
+        time.sleep(0.005)
+
+
+@pytest.fixture
+def transport():
+    return StubTransport()
+
+
+@pytest.fixture
+def make_dispatcher(transport):
+    dispatchers = []
+    
+    def make(**options) -> NotificationDispatcher:
+        dispatcher = NotificationDispatcher(transport, **options)
+        dispatcher.start()
+        dispatchers.append(dispatcher)
+        return dispatcher
+    
+    yield make
+    for dispatcher in dispatchers:
+        dispatcher.stop(flush=False)
+
+
+def test_alerts_for_a_caregiver_are_sent_as_one_digest(transport, make_dispatcher):
+    dispatcher = make_dispatcher(batch_window=0.05)
+    
+    dispatcher.submit("+911", "p1:Aspirin:missed", "Aspirin missed")
+    dispatcher.submit("+911", "p1:Metformin:missed", "Metformin missed")
+    dispatcher.submit("+922", "p2:Aspirin:missed", "Other patient")
+    wait_for(lambda: len(transport.sent) == 2)
+    
+    assert sorted(transport.sent) == [("+911", digest(["Aspirin missed", "Metformin missed"])),
+                                      ("+922", "Other patient")]
+    assert dispatcher.pending() == 0
+
+
+def test_newer_alert_with_the_same_key_replaces_the_queued_one(transport, make_dispatcher):
+    dispatcher = make_dispatcher(batch_window=0.05)
+    
+    dispatcher.submit("+911", "p1:Aspirin:missed", "2 doses missed")
+    dispatcher.submit("+911", "p1:Aspirin:missed", "3 doses missed")
+    wait_for(lambda: transport.sent)
+    
+    assert transport.sent == [("+911", "3 doses missed")]
+
+
+def test_failed_sends_are_retried_until_they_succeed():
+    transport = StubTransport(fail_times=2)
+    dispatcher = NotificationDispatcher(transport, batch_window=0.01, retry_delay=0.01)
+    dispatcher.start()
+    try:
+        dispatcher.submit("+911", "p1:Aspirin:missed", "Aspirin missed")
+        wait_for(lambda: transport.sent)
+    finally:
+        dispatcher.stop(flush=False)
+    
+    assert transport.attempts == 3
+    assert transport.sent == [("+911", "Aspirin missed")]
+
+
+def test_sends_are_dropped_after_max_retries():
+    transport = StubTransport(fail_times=100)
+    dispatcher = NotificationDispatcher(transport, batch_window=0.01, max_retries=2, retry_delay=0.01)
+    dispatcher.start()
+    try:
+        dispatcher.submit("+911", "p1:Aspirin:missed", "Aspirin missed")
+        wait_for(lambda: transport.attempts == 3 and dispatcher.pending() == 0)
+        time.sleep(0.05)
+    finally:
+        dispatcher.stop(flush=False)
+    
+    assert transport.attempts == 3
+    assert transport.sent == []
+
+
+def test_urgent_alert_skips_the_batch_window(transport, make_dispatcher):
+    dispatcher = make_dispatcher(batch_window=30)
+    
+    dispatcher.submit("+911", "p1:Aspirin:missed", "Aspirin missed")
+    dispatcher.submit("+911", "p1:Aspirin:escalation", "Aspirin unanswered", urgent=True)
+    wait_for(lambda: transport.sent)
+    
+    assert transport.sent == [("+911", digest(["Aspirin missed", "Aspirin unanswered"]))]
+
+
+def test_stop_flushes_queued_alerts(transport):
+    dispatcher = NotificationDispatcher(transport, batch_window=30)
+    dispatcher.start()
+    dispatcher.submit("+911", "p1:Aspirin:missed", "Aspirin missed")
+    
+    dispatcher.stop()
+    
+    assert transport.sent == [("+911", "Aspirin missed")]
+
+
+def test_missed_and_escalation_alerts_for_a_medication_are_both_kept(transport):
+    manager = MedicationManager("p1")
+    manager.set_caregiver_contact("+911")
+    medication = Medication("Aspirin", "75mg", TimeSlot.MORNING, "", patient_id="p1")
+    notifier = CaregiverNotifier(manager)
+    notifier.dispatcher = NotificationDispatcher(transport, batch_window=30)
+    
+    notifier.send_notification(medication, 2)
+    notifier.escalate(MedicationRecord(medication, datetime(2026, 10, 19, 8)))
+    
+    assert notifier.dispatcher.pending() == 2
+    assert len(notifier.get_notification_history()) == 2
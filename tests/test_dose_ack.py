@@ -0,0 +1,105 @@
+"""
+Tests for offline dose confirmations: the bulk /api/doses/ack endpoint and scheduler acks
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from medmitra import app as web
+from medmitra.medication import Medication, MedicationManager, TimeSlot
+from medmitra.reminder_scheduler import ReminderScheduler
+from medmitra.timezones import to_local, to_utc
+
+
+@pytest.fixture
+def patient():
+    """A patient (on this worker) with one morning medication"""
+    tenant = web.tenants.get("ack-test")
+    manager = tenant.medication_manager
+    if not manager.medications:
+        manager.add_medication(Medication("Aspirin", "75mg", TimeSlot.MORNING, "", patient_id="ack-test"))
+    return manager
+
+
+def dose_id(scheduled: datetime) -> str:
+    return f"Aspirin@{scheduled.isoformat()}"
+
+
+def post_acks(*acks, patient_id: str = "ack-test"):
+    response = web.app.test_client().post("/api/doses/ack", json={"patient_id": patient_id, "acks": list(acks)})
+    return response.status_code, response.get_json()
+
+
+def statuses(body: dict) -> list[str]:
+    return [result["status"] for result in body["results"]]
+
+
+def test_ack_marks_the_dose_taken_once(patient):
+    scheduled = datetime.combine((patient.now() - timedelta(days=1)).date(), datetime.min.time()).replace(hour=8)
+    ack = {"dose_id": dose_id(scheduled), "taken_time": (scheduled + timedelta(minutes=12)).isoformat()}
+    
+    status, body = post_acks(ack, ack)
+    
+    assert status == 200
+    assert statuses(body) == ["taken", "duplicate"]
+    record = patient.find_record("Aspirin", scheduled)
+    assert record.taken and record.taken_time == scheduled + timedelta(minutes=12)
+    assert statuses(post_acks(ack)[1]) == ["duplicate"]
+
+
+def test_ack_with_a_utc_time_finds_the_same_dose(patient):
+    scheduled = datetime.combine((patient.now() - timedelta(days=2)).date(), datetime.min.time()).replace(hour=8)
+    as_utc = to_utc(scheduled, patient.timezone)
+    
+    _, first = post_acks({"dose_id": dose_id(as_utc)})
+    _, replay = post_acks({"dose_id": dose_id(scheduled)})
+    
+    assert statuses(first) == ["taken"]
+    assert statuses(replay) == ["duplicate"]
+
+
+def test_bad_acks_are_rejected_one_by_one(patient):
+    yesterday = datetime.combine((patient.now() - timedelta(days=1)).date(), datetime.min.time())
+    tomorrow = yesterday + timedelta(days=2)
+    
+    _, body = post_acks(
+        {"dose_id": dose_id(yesterday.replace(hour=8, minute=30))},
+        {"dose_id": dose_id(tomorrow.replace(hour=8))},
+        {"dose_id": f"Unknown@{yesterday.replace(hour=8).isoformat()}"},
+        {"dose_id": "no separator"},
+        "not an object",
+        {"dose_id": dose_id(yesterday.replace(hour=8)), "taken_time": "yesterday"},
+    )
+    
+    assert statuses(body) == ["rejected"] * 6
+    assert "not scheduled" in body["results"][0]["error"]
+    assert "not due yet" in body["results"][1]["error"]
+    assert patient.find_record("Aspirin", tomorrow.replace(hour=8)) is None
+
+
+def test_malformed_batches_are_refused():
+    assert post_acks()[0] == 200
+    response = web.app.test_client().post("/api/doses/ack", json={"acks": "nope"})
+    assert response.status_code == 400
+    too_many = [{"dose_id": "x"}] * (web.DOSE_ACK_MAX_BATCH + 1)
+    assert post_acks(*too_many)[0] == 400
+
+
+def test_scheduler_ack_before_the_reminder_stops_it_firing():
+    manager = MedicationManager("p1")
+    manager.set_timezone("UTC")
+    medication = Medication("Aspirin", "75mg", TimeSlot.MORNING, "", patient_id="p1")
+    manager.add_medication(medication)
+    reminders = []
+    scheduler = ReminderScheduler(None, reminders.append)
+    scheduler.attach_manager(manager)
+    fire_at = scheduler.next_fire_time()
+    scheduled = to_local(fire_at, manager.timezone)
+    
+    assert scheduler.acknowledge_dose(medication, scheduled, scheduled)
+    assert not scheduler.acknowledge_dose(medication, scheduled, scheduled)
+    scheduler._tick(fire_at)
+    
+    assert reminders == []
+    assert manager.find_record("Aspirin", scheduled).taken
+    assert len(manager.records) == 1
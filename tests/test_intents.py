@@ -0,0 +1,53 @@
+"""
+Tests for intent classification
+"""
+import random
+import re
+
+import pytest
+
+from medmitra.intents import INTENT_KEYWORDS, Intent, classify_intent
+
+
+def reference_intent(text: str) -> Intent:
+    """Check every keyword list in priority order, as whole words (the slow way)"""
+    text = text.lower()
+    for intent, keywords in INTENT_KEYWORDS.items():
+        if any(re.search(r"\b" + re.escape(keyword) + r"+\b", text) for keyword in keywords):
+            return intent
+    return Intent.UNKNOWN
+
+
+@pytest.mark.parametrize("text, intent", [
+    ("Haan, le li", Intent.YES),
+    ("haanji", Intent.YES),
+    ("hmmm", Intent.YES),
+    ("Okayyy", Intent.YES),
+    ("le liya maine", Intent.YES),
+    ("abhi nahi", Intent.NO),
+    ("nooo", Intent.NO),
+    ("not yet, baad mein", Intent.NO),
+    ("samajh nahi aa raha", Intent.NO),
+    ("yeh dava kisliye hai?", Intent.QUESTION),
+    ("main bahut pareshan hoon", Intent.CONFUSED),
+    ("nahi, tez dard ho raha hai", Intent.EMERGENCY),
+    ("CHEST PAIN", Intent.EMERGENCY),
+    ("I know", Intent.UNKNOWN),
+    ("nothing", Intent.UNKNOWN),
+    ("", Intent.UNKNOWN),
+])
+def test_classify_intent(text, intent):
+    assert classify_intent(text) is intent
+
+
+def test_matches_a_keyword_by_keyword_scan():
+    vocabulary = [keyword for keywords in INTENT_KEYWORDS.values() for keyword in keywords]
+    vocabulary += ["dava", "aaj", "known", "nokia", "okayish", "kaamwali", "ji", "main", "?", ","]
+    generator = random.Random(11)
+    for _ in range(2000):
+        words = generator.choices(vocabulary, k=generator.randint(1, 5))
+        if generator.random() < 0.2:
+            words[-1] += words[-1][-1] * 2
+        text = " ".join(words)
+        
+        assert classify_intent(text) is reference_intent(text), text
@@ -0,0 +1,196 @@
+"""
+Tests for Web Push: subscription checks, payload encryption, VAPID tokens and the send queue
+"""
+import json
+import os
+import time
+
+import pytest
+
+pytest.importorskip("cryptography")
+
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.hazmat.primitives.asymmetric.utils import encode_dss_signature
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+from medmitra import push
+from medmitra.push import (MAX_PAYLOAD, PushDispatcher, PushSubscription, StubPushTransport,
+                           SubscriptionStore, VapidSigner, b64url, b64url_decode, encrypt)
+
+ENDPOINT = "https://push.example.com/send/abc"
+
+
+class Browser:
+    """The receiving side of a subscription: holds the keys and decrypts messages (RFC 8291)"""
+    
+    def __init__(self, endpoint: str = ENDPOINT):
+        self.key = ec.generate_private_key(ec.SECP256R1())
+        self.auth = os.urandom(16)
+        self.public = self.key.public_key().public_bytes(serialization.Encoding.X962,
+                                                         serialization.PublicFormat.UncompressedPoint)
+        self.subscription = PushSubscription(endpoint, b64url(self.public), b64url(self.auth))
+    
+    def decrypt(self, body: bytes) -> bytes:
+        salt, record_size, id_length = body[:16], int.from_bytes(body[16:20], "big"), body[20]
+        server_public = body[21:21 + id_length]
+        ciphertext = body[21 + id_length:]
+        assert record_size == push.RECORD_SIZE
+        shared = self.key.exchange(ec.ECDH(), ec.EllipticCurvePublicKey.from_encoded_point(
+            ec.SECP256R1(), server_public))
+        ikm = hkdf(self.auth, shared, b"WebPush: info\x00" + self.public + server_public, 32)
+        key = hkdf(salt, ikm, b"Content-Encoding: aes128gcm\x00", 16)
+        nonce = hkdf(salt, ikm, b"Content-Encoding: nonce\x00", 12)
+        plaintext = AESGCM(key).decrypt(nonce, ciphertext, None)
+        assert plaintext.endswith(b"\x02")
+        return plaintext[:-1]
+
+
+def hkdf(salt: bytes, ikm: bytes, info: bytes, length: int) -> bytes:
+    return HKDF(hashes.SHA256(), length, salt, info).derive(ikm)
+
+
+def wait_for(condition, timeout: float = 3.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            pytest.fail("timed out waiting for the push queue")
+        time.sleep(0.005)
+
+
+@pytest.fixture
+def signer():
+    return VapidSigner(ec.generate_private_key(ec.SECP256R1()), "mailto:test@medmitra.local")
+
+
+@pytest.fixture
+def dispatcher(signer):
+    dispatcher = PushDispatcher(signer, StubPushTransport(), max_retries=2, retry_delay=0.01)
+    dispatcher.start()
+    yield dispatcher
+    dispatcher.stop()
+
+
+def test_encrypted_message_decrypts_to_the_payload():
+    browser = Browser()
+    payload = json.dumps({"message": "Dava ka waqt ho gaya hai"}).encode()
+    
+    first, second = encrypt(payload, browser.subscription), encrypt(payload, browser.subscription)
+    
+    assert browser.decrypt(first) == payload
+    assert browser.decrypt(second) == payload
+    assert first != second
+
+
+def test_largest_payload_fits_one_record_and_larger_ones_are_refused():
+    browser = Browser()
+    
+    body = encrypt(b"x" * MAX_PAYLOAD, browser.subscription)
+    
+    assert browser.decrypt(body) == b"x" * MAX_PAYLOAD
+    assert len(body) - 86 <= push.RECORD_SIZE
+    with pytest.raises(ValueError):
+        encrypt(b"x" * (MAX_PAYLOAD + 1), browser.subscription)
+
+
+@pytest.mark.parametrize("endpoint, allow_http, valid", [
+    ("https://fcm.googleapis.com/fcm/send/abc", False, True),
+    ("http://localhost:5000/push-stub", False, False),
+    ("http://localhost:5000/push-stub", True, True),
+    ("file:///etc/passwd", True, False),
+    ("https:///no-host", False, False),
+])
+def test_subscription_endpoint_must_be_https(endpoint, allow_http, valid):
+    data = {"endpoint": endpoint, "keys": {"p256dh": "key", "auth": "secret"}}
+    if valid:
+        assert PushSubscription.from_json(data, allow_http=allow_http).endpoint == endpoint
+    else:
+        with pytest.raises(ValueError):
+            PushSubscription.from_json(data, allow_http=allow_http)
+
+
+def test_subscription_needs_keys_and_keeps_its_expiry():
+    with pytest.raises(ValueError):
+        PushSubscription.from_json({"endpoint": ENDPOINT, "keys": {"p256dh": "key"}})
+    
+    subscription = PushSubscription.from_json(
+        {"endpoint": ENDPOINT, "expirationTime": 1_800_000_000_000, "keys": {"p256dh": "key", "auth": "secret"}})
+    assert subscription.expires_at == 1_800_000_000
+
+
+def test_vapid_token_is_a_verifiable_es256_jwt(signer):
+    header = signer.authorization(ENDPOINT)
+    token = header.split("t=", 1)[1].split(",", 1)[0]
+    encoded_header, encoded_claims, signature = token.split(".")
+    
+    claims = json.loads(b64url_decode(encoded_claims))
+    assert claims["aud"] == "https://push.example.com"
+    assert claims["sub"] == "mailto:test@medmitra.local"
+    raw = b64url_decode(signature)
+    signer.private_key.public_key().verify(
+        encode_dss_signature(int.from_bytes(raw[:32], "big"), int.from_bytes(raw[32:], "big")),
+        f"{encoded_header}.{encoded_claims}".encode(), ec.ECDSA(hashes.SHA256()))
+    assert header.endswith(f"k={signer.public_key}")
+    assert signer.authorization(ENDPOINT) == header
+
+
+def test_vapid_key_file_is_opt_in(tmp_path, monkeypatch):
+    monkeypatch.delenv("MEDMITRA_VAPID_KEY_FILE", raising=False)
+    assert VapidSigner.from_environment() is None
+    
+    path = tmp_path / "vapid.pem"
+    monkeypatch.setenv("MEDMITRA_VAPID_KEY_FILE", str(path))
+    first = VapidSigner.from_environment()
+    
+    assert path.exists() and (path.stat().st_mode & 0o777) == 0o600
+    assert VapidSigner.from_environment().public_key == first.public_key
+
+
+def test_messages_reach_every_device(dispatcher):
+    phone, tablet = Browser(ENDPOINT), Browser("https://push.example.com/send/def")
+    store = SubscriptionStore("p1")
+    store.add(phone.subscription)
+    store.add(tablet.subscription)
+    
+    assert dispatcher.submit(store, {"message": "hello"}) == 2
+    wait_for(lambda: len(dispatcher.transport.sent) == 2)
+    
+    delivered = {endpoint: (headers, body) for endpoint, headers, body in dispatcher.transport.sent}
+    for browser in (phone, tablet):
+        headers, body = delivered[browser.subscription.endpoint]
+        assert headers["Content-Encoding"] == "aes128gcm"
+        assert json.loads(browser.decrypt(body)) == {"message": "hello"}
+
+
+def test_gone_subscription_is_removed(dispatcher):
+    store = SubscriptionStore("p1")
+    store.add(Browser().subscription)
+    dispatcher.transport.gone.add(ENDPOINT)
+    
+    dispatcher.submit(store, {"message": "hello"})
+    wait_for(lambda: len(store) == 0)
+    
+    assert dispatcher.transport.sent == []
+
+
+def test_unsendable_message_is_not_retried(dispatcher):
+    store = SubscriptionStore("p1")
+    store.add(PushSubscription(ENDPOINT, b64url(b"not a key"), b64url(os.urandom(16))))
+    posts = []
+    dispatcher.transport.post = lambda *args: posts.append(args) or 201
+    
+    dispatcher.submit(store, {"message": "hello"})
+    wait_for(lambda: dispatcher.pending() == 0)
+    time.sleep(0.05)
+    
+    assert posts == [] and dispatcher.pending() == 0
+    assert len(store) == 1
+
+
+def test_oversized_payload_is_not_queued(dispatcher):
+    store = SubscriptionStore("p1")
+    store.add(Browser().subscription)
+    
+    assert dispatcher.submit(store, {"message": "x" * MAX_PAYLOAD}) == 0
+    assert dispatcher.pending() == 0
@@ -0,0 +1,155 @@
+"""
+Tests for the indexed record store and cursor-paginated history
+"""
+import random
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from medmitra.medication import Medication, MedicationManager, MedicationRecord, TimeSlot
+from medmitra.records import RecordStore, record_status
+
+START = datetime(2026, 10, 1)
+
+
+def make_records(count: int, seed: int = 3) -> list[MedicationRecord]:
+    """Doses of two medications over ten days, some sharing a scheduled minute"""
+    generator = random.Random(seed)
+    medications = [Medication(name, "1", TimeSlot.MORNING, "") for name in ("Aspirin", "Metformin")]
+    return [MedicationRecord(generator.choice(medications),
+                             START + timedelta(minutes=15 * generator.randint(0, 960)))
+            for _ in range(count)]
+
+
+def fill(store: RecordStore, records: list[MedicationRecord], seed: int = 5):
+    """Add records, then take or miss some of them (so they move between status indexes)"""
+    generator = random.Random(seed)
+    store.extend(records)
+    for record in records:
+        outcome = generator.random()
+        if outcome < 0.5:
+            store.mark_record_taken(record, record.scheduled_time + timedelta(minutes=5))
+        elif outcome < 0.7:
+            store.mark_record_missed(record)
+
+
+def walk(store: RecordStore, limit: int, **filters) -> list[MedicationRecord]:
+    """Read every page, following the cursors"""
+    records, cursor = store.page(limit, **filters)
+    while cursor is not None:
+        page, cursor = store.page(limit, before=cursor, **filters)
+        assert page
+        records += page
+    return records
+
+
+def expected(records: list[MedicationRecord], medication_name=None, start=None, end=None, status=None):
+    order = sorted(range(len(records)), key=lambda index: (records[index].scheduled_time, index), reverse=True)
+    return [records[index] for index in order
+            if (medication_name is None or records[index].medication.name == medication_name)
+            and (start is None or records[index].scheduled_time >= start)
+            and (end is None or records[index].scheduled_time < end)
+            and (status is None or record_status(records[index]) == status)]
+
+
+@pytest.mark.parametrize("filters", [
+    {},
+    {"medication_name": "Aspirin"},
+    {"status": "taken"},
+    {"status": "missed", "medication_name": "Metformin"},
+    {"status": "pending", "start": START + timedelta(days=2), "end": START + timedelta(days=6)},
+    {"start": START + timedelta(days=9)},
+])
+def test_pages_match_a_full_scan(filters):
+    records = make_records(400)
+    store = RecordStore()
+    fill(store, records)
+    
+    for limit in (1, 7, 50, 1000):
+        assert [id(record) for record in walk(store, limit, **filters)] == \
+            [id(record) for record in expected(records, **filters)]
+
+
+def test_last_page_has_no_cursor():
+    store = RecordStore()
+    fill(store, make_records(10))
+    
+    records, cursor = store.page(10)
+    
+    assert len(records) == 10 and cursor is None
+
+
+def test_unknown_medication_or_status_has_no_pages():
+    store = RecordStore()
+    fill(store, make_records(10))
+    
+    assert store.page(10, medication_name="Unknown") == ([], None)
+    assert store.page(10, medication_name="Unknown", status="taken") == ([], None)
+
+
+def test_status_change_moves_a_record_between_filtered_pages():
+    store = RecordStore()
+    record = make_records(1)[0]
+    store.add(record)
+    
+    store.mark_record_missed(record)
+    assert store.page(10, status="missed")[0] == [record]
+    assert store.page(10, status="pending")[0] == []
+    
+    store.mark_record_taken(record, record.scheduled_time)
+    assert store.page(10, status="taken", medication_name=record.medication.name)[0] == [record]
+    assert store.page(10, status="missed")[0] == []
+
+
+def test_since_returns_recent_doses_newest_first():
+    records = make_records(200)
+    store = RecordStore()
+    store.extend(records)
+    start = START + timedelta(days=8)
+    
+    assert [id(record) for record in store.since("Aspirin", start)] == \
+        [id(record) for record in expected(records, medication_name="Aspirin", start=start)]
+
+
+def test_compaction_keeps_daily_totals_and_trims_every_index():
+    records = make_records(300)
+    store = RecordStore()
+    fill(store, records)
+    cutoff = date(2026, 10, 5)
+    old = [record for record in records if record.scheduled_time.date() < cutoff]
+    
+    assert store.compact(cutoff) == len(old)
+    assert len(store) == len(records) - len(old)
+    assert sum(summary.scheduled for summary in store.summaries.values()) == len(old)
+    assert sum(summary.missed for summary in store.summaries.values()) == sum(record.missed for record in old)
+    assert walk(store, 25, status="taken") == expected(
+        [record for record in records if record not in old], status="taken")
+    assert store.missed_count("Aspirin", cutoff - timedelta(days=1), days=4) == sum(
+        record.missed for record in old if record.medication.name == "Aspirin")
+
+
+def test_history_endpoint_pages_with_cursors():
+    from medmitra import app as web
+    
+    manager: MedicationManager = web.tenants.get("history-test").medication_manager
+    records = make_records(60)
+    for record in records:
+        record.medication.patient_id = "history-test"
+        manager.add_record(record)
+    client = web.app.test_client()
+    
+    seen, cursor = [], None
+    while True:
+        query = {"patient_id": "history-test", "limit": 8, "medication": "Aspirin"}
+        if cursor:
+            query["cursor"] = cursor
+        body = client.get("/api/history", query_string=query).get_json()
+        seen += [(entry["medication_name"], entry["scheduled_time"]) for entry in body["history"]]
+        cursor = body["next_cursor"]
+        if cursor is None:
+            break
+    
+    assert seen == [(record.medication.name, record.scheduled_time.isoformat())
+                    for record in expected(records, medication_name="Aspirin")]
+    bad_status = client.get("/api/history", query_string={"patient_id": "history-test", "status": "late"})
+    assert bad_status.status_code == 400
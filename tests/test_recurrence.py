@@ -0,0 +1,154 @@
+"""
+Tests for recurrence rules: parsing, next occurrences and the merged due-range query
+"""
+import random
+from datetime import date, datetime, time, timedelta
+
+import pytest
+
+from medmitra.recurrence import DEFAULT_ANCHOR, Recurrence, merge_occurrences
+
+# 2026-10-19 is a Monday
+MONDAY = datetime(2026, 10, 19)
+
+
+def brute_force_hourly(rule: Recurrence, after: datetime):
+    """Walk every step of an HOURLY rule until one lands on an allowed day and hour"""
+    anchor = rule.start or DEFAULT_ANCHOR
+    step = timedelta(hours=rule.interval)
+    count = (after - anchor) // step + 1
+    hours = {t.hour for t in rule.times} or None
+    for _ in range(10_000):
+        occurrence = anchor + count * step
+        if ((rule.weekdays is None or occurrence.weekday() in rule.weekdays)
+                and (hours is None or occurrence.hour in hours)):
+            return occurrence
+        count += 1
+    return None
+
+
+@pytest.mark.parametrize("rule", [
+    "FREQ=DAILY;BYHOUR=8,20",
+    "FREQ=DAILY;INTERVAL=2;BYHOUR=9;BYMINUTE=15,45",
+    "FREQ=WEEKLY;BYDAY=MO,WE,FR;BYHOUR=9;UNTIL=2026-12-31",
+    "FREQ=HOURLY;INTERVAL=6;DTSTART=2026-10-01T06:30:00",
+    "FREQ=DAILY;X-BYTIME=07:30,13:05;X-TAPER=0:40mg,7:20mg",
+])
+def test_rule_text_round_trips(rule):
+    assert Recurrence.parse(str(Recurrence.parse(rule))) == Recurrence.parse(rule)
+
+
+def test_daily_rule_moves_to_the_next_time_then_the_next_day():
+    rule = Recurrence.parse("FREQ=DAILY;BYHOUR=8,20")
+    
+    assert rule.next_after(MONDAY.replace(hour=7)) == MONDAY.replace(hour=8)
+    assert rule.next_after(MONDAY.replace(hour=8)) == MONDAY.replace(hour=20)
+    assert rule.next_after(MONDAY.replace(hour=21)) == MONDAY.replace(hour=8) + timedelta(days=1)
+
+
+def test_weekly_rule_skips_to_allowed_days_and_stops_after_until():
+    rule = Recurrence.parse("FREQ=WEEKLY;BYDAY=MO,FR;BYHOUR=9;UNTIL=2026-10-30")
+    
+    assert rule.next_after(MONDAY.replace(hour=10)) == datetime(2026, 10, 23, 9)
+    assert rule.next_after(datetime(2026, 10, 30, 9)) is None
+
+
+def test_every_other_week_counts_weeks_from_its_start():
+    rule = Recurrence.parse("FREQ=WEEKLY;INTERVAL=2;BYDAY=MO;BYHOUR=9;DTSTART=2026-10-19T00:00:00")
+    
+    assert rule.next_after(MONDAY.replace(hour=10)) == datetime(2026, 11, 2, 9)
+
+
+def test_hourly_rule_steps_from_its_start():
+    rule = Recurrence.parse("FREQ=HOURLY;INTERVAL=6;DTSTART=2026-10-19T06:30:00")
+    
+    assert rule.next_after(datetime(2026, 10, 1)) == datetime(2026, 10, 19, 6, 30)
+    assert rule.next_after(datetime(2026, 10, 19, 7)) == datetime(2026, 10, 19, 12, 30)
+
+
+def test_sparse_hourly_rule_still_finds_its_next_dose():
+    # A 50-hour step lands on a Monday only every few weeks
+    rule = Recurrence.parse("FREQ=HOURLY;INTERVAL=50;BYDAY=MO")
+    occurrence = rule.next_after(MONDAY)
+    
+    assert occurrence is not None and occurrence.weekday() == 0
+    assert occurrence == brute_force_hourly(rule, MONDAY)
+
+
+def test_hourly_rule_with_no_matching_step_never_occurs():
+    # Steps of 24 hours from midnight never fall at 08:00
+    rule = Recurrence.parse("FREQ=HOURLY;INTERVAL=24;BYHOUR=8")
+    
+    assert rule.next_after(MONDAY) is None
+
+
+def test_hourly_rules_match_a_step_by_step_search():
+    generator = random.Random(7)
+    for _ in range(500):
+        parts = ["FREQ=HOURLY", f"INTERVAL={generator.randint(1, 100)}"]
+        if generator.random() < 0.6:
+            days = generator.sample(["MO", "TU", "WE", "TH", "FR", "SA", "SU"], generator.randint(1, 3))
+            parts.append("BYDAY=" + ",".join(days))
+        if generator.random() < 0.5:
+            parts.append("BYHOUR=" + ",".join(map(str, generator.sample(range(24), generator.randint(1, 3)))))
+        rule = Recurrence.parse(";".join(parts))
+        after = MONDAY + timedelta(minutes=generator.randint(0, 100_000))
+        
+        assert rule.next_after(after) == brute_force_hourly(rule, after), str(rule)
+
+
+def test_taper_changes_the_dosage_over_the_course():
+    rule = Recurrence.parse("FREQ=DAILY;BYHOUR=9;DTSTART=2026-10-19T00:00:00;X-TAPER=0:40mg,7:20mg")
+    
+    assert rule.dosage_on(date(2026, 10, 18), "10mg") == "10mg"
+    assert rule.dosage_on(date(2026, 10, 20), "10mg") == "40mg"
+    assert rule.dosage_on(date(2026, 10, 26), "10mg") == "20mg"
+
+
+def test_invalid_rules_are_rejected():
+    for rule in ("FREQ=MONTHLY;BYHOUR=8", "FREQ=DAILY", "FREQ=DAILY;INTERVAL=0;BYHOUR=8",
+                 "FREQ=WEEKLY;BYDAY=XX;BYHOUR=8"):
+        with pytest.raises(ValueError):
+            Recurrence.parse(rule)
+
+
+def test_merged_occurrences_are_in_time_order_within_the_window():
+    schedules = [(Recurrence.parse("FREQ=DAILY;BYHOUR=8,20"), "twice daily"),
+                 (Recurrence.parse("FREQ=HOURLY;INTERVAL=6"), "every six hours"),
+                 (Recurrence.daily_at(time(14)), "afternoon")]
+    start, end = MONDAY, MONDAY + timedelta(days=2)
+    
+    merged = list(merge_occurrences(schedules, start, end))
+    expected = sorted((occurrence, item) for rule, item in schedules
+                      for occurrence in _occurrences(rule, start, end))
+    
+    assert [occurrence for occurrence, _ in merged] == [occurrence for occurrence, _ in expected]
+    assert sorted(merged) == expected
+
+
+def _occurrences(rule: Recurrence, start: datetime, end: datetime):
+    occurrence = rule.next_after(start - timedelta(microseconds=1))
+    while occurrence is not None and occurrence < end:
+        yield occurrence
+        occurrence = rule.next_after(occurrence)
+
+
+def test_schedule_endpoint_reads_an_aware_start_in_the_patients_zone():
+    from medmitra import app as web
+    from medmitra.medication import Medication, TimeSlot
+    
+    manager = web.tenants.get("schedule-test").medication_manager
+    manager.set_timezone("Asia/Kolkata")
+    manager.add_medication(Medication("Aspirin", "75mg", TimeSlot.MORNING, "", patient_id="schedule-test",
+                                      recurrence=Recurrence.parse("FREQ=DAILY;BYHOUR=8,20")))
+    client = web.app.test_client()
+    
+    def doses(start: str) -> list:
+        response = client.get("/api/schedule", query_string={"patient_id": "schedule-test", "start": start})
+        assert response.status_code == 200
+        return [dose["scheduled_time"] for dose in response.get_json()["doses"]]
+    
+    expected = ["2026-10-18T20:00:00", "2026-10-19T08:00:00"]
+    assert doses("2026-10-18T08:30:00") == expected
+    assert doses("2026-10-18T08:30:00+05:30") == expected
+    assert doses("2026-10-18T03:00:00+00:00") == expected
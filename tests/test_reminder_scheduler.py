@@ -0,0 +1,154 @@
+"""
+Tests for the reminder scheduler: the next-due heap, follow-up timers and miss deadlines
+The scheduler thread is never started; each test drives it with _tick at chosen UTC times.
+"""
+from datetime import timedelta
+
+import pytest
+
+from medmitra.medication import Medication, MedicationManager, TimeSlot
+from medmitra.reminder_scheduler import MISSED_AFTER, SNOOZE_INTERVAL, DoseState, ReminderScheduler
+
+DAY = timedelta(days=1)
+
+
+def make_manager(patient_id: str, *slots: TimeSlot) -> MedicationManager:
+    manager = MedicationManager(patient_id)
+    manager.set_timezone("UTC")
+    for slot in slots:
+        manager.add_medication(Medication(f"Dose {slot.value}", "1 tablet", slot, "", patient_id=patient_id))
+    return manager
+
+
+def make_scheduler(*managers: MedicationManager, **options) -> tuple[ReminderScheduler, dict]:
+    events = {"reminders": [], "escalations": [], "missed": []}
+    scheduler = ReminderScheduler(None, events["reminders"].append,
+                                  escalation_callback=events["escalations"].append,
+                                  missed_callback=events["missed"].append, **options)
+    for manager in managers:
+        scheduler.attach_manager(manager)
+    return scheduler, events
+
+
+def fire_first_dose(scheduler: ReminderScheduler, manager: MedicationManager):
+    """Fire the earliest reminder and return (its UTC time, its record)"""
+    fire_at = scheduler.next_fire_time()
+    scheduler._tick(fire_at)
+    record = manager.records.recent(1)[0]
+    return fire_at, record
+
+
+def test_next_fire_time_is_the_earliest_reminder_across_patients():
+    first = make_manager("p1", TimeSlot.MORNING, TimeSlot.NIGHT)
+    second = make_manager("p2", TimeSlot.AFTERNOON)
+    scheduler, _ = make_scheduler(first, second)
+    
+    start = scheduler.next_fire_time()
+    due = scheduler.due_between(start, start + DAY)
+    
+    assert scheduler.armed_count() == 3
+    assert [fire_at for fire_at, _ in due] == sorted(fire_at for fire_at, _ in due)
+    assert due[0][0] == start
+    assert {medication.name for _, medication in due} == {"Dose Morning", "Dose Night", "Dose Afternoon"}
+
+
+def test_unscheduled_medication_is_not_due():
+    manager = make_manager("p1", TimeSlot.MORNING, TimeSlot.NIGHT)
+    scheduler, _ = make_scheduler(manager)
+    morning, night = manager.medications
+    
+    scheduler.unschedule_medication(morning)
+    start = scheduler.next_fire_time()
+    
+    assert scheduler.armed_count() == 1
+    assert [medication for _, medication in scheduler.due_between(start, start + DAY)] == [night]
+
+
+def test_reminder_fires_once_and_rearms_for_the_next_day():
+    manager = make_manager("p1", TimeSlot.MORNING)
+    scheduler, events = make_scheduler(manager)
+    
+    fire_at, record = fire_first_dose(scheduler, manager)
+    scheduler._tick(fire_at)
+    
+    assert events["reminders"] == [record.medication]
+    assert record.reminder_count == 1
+    assert scheduler.next_fire_time() == fire_at + DAY
+    assert scheduler.get_dose_state(record.medication) is DoseState.REMINDED
+
+
+def test_unanswered_dose_escalates_once_then_is_missed_without_a_second_alert():
+    manager = make_manager("p1", TimeSlot.MORNING)
+    scheduler, events = make_scheduler(manager)
+    fire_at, record = fire_first_dose(scheduler, manager)
+    
+    for repeat in (1, 2, 3):
+        scheduler._tick(fire_at + repeat * SNOOZE_INTERVAL)
+    
+    assert len(events["reminders"]) == 3
+    assert events["escalations"] == [record]
+    assert scheduler.get_dose_state(record.medication) is DoseState.ESCALATED
+    assert not record.missed
+    
+    scheduler._tick(fire_at + MISSED_AFTER)
+    
+    assert record.missed
+    assert events["missed"] == []
+    assert events["escalations"] == [record]
+    assert scheduler.get_dose_state(record.medication) is None
+
+
+def test_dose_missed_before_escalation_alerts_once():
+    manager = make_manager("p1", TimeSlot.MORNING)
+    scheduler, events = make_scheduler(manager, snooze_interval=timedelta(hours=2))
+    fire_at, record = fire_first_dose(scheduler, manager)
+    
+    scheduler._tick(fire_at + MISSED_AFTER)
+    scheduler._tick(fire_at + timedelta(hours=2))
+    
+    assert record.missed
+    assert events["missed"] == [record]
+    assert events["escalations"] == []
+    assert len(events["reminders"]) == 1
+
+
+def test_taken_dose_is_never_marked_missed():
+    manager = make_manager("p1", TimeSlot.MORNING)
+    scheduler, events = make_scheduler(manager)
+    fire_at, record = fire_first_dose(scheduler, manager)
+    
+    scheduler.mark_medication_taken(record.medication)
+    scheduler._tick(fire_at + SNOOZE_INTERVAL)
+    scheduler._tick(fire_at + MISSED_AFTER)
+    
+    assert record.taken and not record.missed
+    assert len(events["reminders"]) == 1
+    assert events["missed"] == [] and events["escalations"] == []
+
+
+def test_dose_taken_after_escalation_still_counts():
+    manager = make_manager("p1", TimeSlot.MORNING)
+    scheduler, events = make_scheduler(manager, max_reminders=1)
+    fire_at, record = fire_first_dose(scheduler, manager)
+    scheduler._tick(fire_at + SNOOZE_INTERVAL)
+    
+    scheduler.mark_medication_taken(record.medication)
+    scheduler._tick(fire_at + MISSED_AFTER)
+    
+    assert events["escalations"] == [record]
+    assert record.taken and not record.missed
+    assert events["missed"] == []
+
+
+def test_snoozed_dose_waits_for_its_repeat():
+    manager = make_manager("p1", TimeSlot.MORNING)
+    scheduler, _ = make_scheduler(manager)
+    _, record = fire_first_dose(scheduler, manager)
+    
+    assert scheduler.snooze(record.medication)
+    assert scheduler.get_dose_state(record.medication) is DoseState.SNOOZED
+
+
+def test_check_interval_is_deprecated():
+    with pytest.warns(DeprecationWarning):
+        ReminderScheduler(None, print, 60)
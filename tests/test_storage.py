@@ -0,0 +1,212 @@
+"""
+Tests for the SQLite store: round trips, migrations, record IDs and failed-write recovery
+"""
+import sqlite3
+import subprocess
+import sys
+import threading
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+
+from medmitra import storage
+from medmitra.medication import Medication, MedicationRecord, TimeSlot
+from medmitra.push import PushSubscription
+from medmitra.recurrence import Recurrence
+from medmitra.storage import SQLiteStore
+from medmitra.tenants import TenantRegistry
+
+
+@pytest.fixture
+def path(tmp_path) -> str:
+    return str(tmp_path / "medmitra.db")
+
+
+def open_patient(store: SQLiteStore, patient_id: str = "p1"):
+    registry = TenantRegistry()
+    tenant = registry.get(patient_id)
+    tenant.medication_manager.storage = store
+    tenant.push_subscriptions.storage = store
+    return tenant
+
+
+def reload(path: str, **options) -> TenantRegistry:
+    store = SQLiteStore(path)
+    registry = TenantRegistry(**options)
+    store.load(registry)
+    store.close()
+    return registry
+
+
+def test_patient_state_survives_a_restart(path):
+    store = SQLiteStore(path)
+    tenant = open_patient(store)
+    manager = tenant.medication_manager
+    manager.set_timezone("Asia/Kolkata")
+    manager.user_name = "Mr. Sharma"
+    manager.set_caregiver_contact("+91-9876543210")
+    aspirin = Medication("Aspirin", "75mg", TimeSlot.MORNING, "after food", "Mr. Sharma", "p1",
+                         Recurrence.parse("FREQ=DAILY;BYHOUR=8,20"))
+    manager.add_medication(aspirin)
+    scheduled = datetime.combine(datetime.now().date() - timedelta(days=1), aspirin.get_time())
+    record = manager.create_record(aspirin, scheduled)
+    manager.mark_record_taken(record, scheduled + timedelta(minutes=10))
+    tenant.push_subscriptions.add(PushSubscription("https://push.example.com/send/abc", "key", "secret"))
+    store.close()
+    
+    restored = reload(path).get("p1")
+    
+    restored_manager = restored.medication_manager
+    assert (restored_manager.user_name, restored_manager.caregiver_contact, restored_manager.timezone) == \
+        ("Mr. Sharma", "+91-9876543210", "Asia/Kolkata")
+    assert restored_manager.medications == (aspirin,)
+    restored_record = restored_manager.find_record("Aspirin", scheduled)
+    assert restored_record.taken and restored_record.taken_time == scheduled + timedelta(minutes=10)
+    assert restored_record.record_id == record.record_id
+    assert len(restored.push_subscriptions) == 1
+
+
+def test_records_past_retention_load_as_daily_summaries(path):
+    store = SQLiteStore(path)
+    manager = open_patient(store).medication_manager
+    aspirin = Medication("Aspirin", "75mg", TimeSlot.MORNING, "", patient_id="p1")
+    old = datetime.combine(datetime.now().date() - timedelta(days=200), aspirin.get_time())
+    manager.mark_record_missed(manager.create_record(aspirin, old))
+    manager.create_record(aspirin, old + timedelta(days=199))
+    store.close()
+    
+    records = reload(path).get("p1").medication_manager.records
+    
+    assert len(records) == 1
+    assert [(summary.scheduled, summary.missed) for summary in records.summaries.values()] == [(1, 1)]
+
+
+def test_patients_on_other_shards_are_not_loaded(path):
+    store = SQLiteStore(path)
+    for patient_id in ("p1", "p2", "p3", "p4"):
+        open_patient(store, patient_id).medication_manager.set_caregiver_contact("+911")
+    store.close()
+    
+    registry = reload(path, shard_index=0, shard_count=2)
+    
+    assert {tenant.patient_id for tenant in registry} == {
+        patient_id for patient_id in ("p1", "p2", "p3", "p4") if registry.owns(patient_id)}
+
+
+def test_old_databases_gain_the_new_columns(path):
+    connection = sqlite3.connect(path)
+    connection.executescript("""
+        CREATE TABLE patients (patient_id TEXT PRIMARY KEY, user_name TEXT NOT NULL, caregiver_contact TEXT);
+        CREATE TABLE medications (patient_id TEXT NOT NULL, name TEXT NOT NULL, dosage TEXT NOT NULL,
+            time_slot TEXT NOT NULL, doctor_instructions TEXT NOT NULL, user_name TEXT NOT NULL,
+            PRIMARY KEY (patient_id, name));
+        INSERT INTO patients VALUES ('p1', 'Mr. Sharma', '+911');
+        INSERT INTO medications VALUES ('p1', 'Aspirin', '75mg', 'Morning', '', 'Mr. Sharma');
+    """)
+    connection.close()
+    
+    registry = reload(path)
+    
+    columns = {table: {row[1] for row in sqlite3.connect(path).execute(f"PRAGMA table_info({table})")}
+               for table in ("patients", "medications")}
+    assert "timezone" in columns["patients"] and "recurrence" in columns["medications"]
+    manager = registry.get("p1").medication_manager
+    assert manager.user_name == "Mr. Sharma"
+    assert [(med.name, med.recurrence) for med in manager.medications] == [("Aspirin", None)]
+
+
+def test_shards_sharing_a_database_allocate_their_own_record_ids(path):
+    aspirin = Medication("Aspirin", "75mg", TimeSlot.MORNING, "", patient_id="p1")
+    start = datetime.now().replace(microsecond=0)
+    first = SQLiteStore(path)
+    first.save_record(MedicationRecord(aspirin, start))
+    first.close()
+    
+    stores = [SQLiteStore(path, shard_index=index, shard_count=3) for index in range(3)]
+    ids = {index: [] for index in range(3)}
+    for step in range(4):
+        for index, store in enumerate(stores):
+            record = MedicationRecord(aspirin, start + timedelta(minutes=step * 3 + index + 1))
+            store.save_record(record)
+            ids[index].append(record.record_id)
+    for store in stores:
+        store.close()
+    
+    for index, allocated in ids.items():
+        assert all(record_id % 3 == index and record_id > 1 for record_id in allocated)
+        assert allocated == list(range(allocated[0], allocated[0] + 12, 3))
+    count, distinct = sqlite3.connect(path).execute(
+        "SELECT COUNT(*), COUNT(DISTINCT record_id) FROM records").fetchone()
+    assert count == distinct == 13
+
+
+def test_a_locked_database_is_retried(path, monkeypatch):
+    monkeypatch.setattr(storage, "WRITE_RETRY_DELAY", 0)
+    store = SQLiteStore(path)
+    failures = [sqlite3.OperationalError("database is locked")] * 2
+    execute = store._execute
+    
+    def flaky(writes):
+        if failures:
+            raise failures.pop()
+        execute(writes)
+    
+    monkeypatch.setattr(store, "_execute", flaky)
+    open_patient(store).medication_manager.set_caregiver_contact("+911")
+    store.close()
+    
+    assert failures == []
+    assert reload(path).get("p1").medication_manager.caregiver_contact == "+911"
+
+
+def test_a_bad_write_is_dropped_without_losing_its_batch(path, monkeypatch):
+    store = SQLiteStore(path)
+    attempts = []
+    execute = store._execute
+    monkeypatch.setattr(store, "_execute", lambda writes: attempts.append(len(writes)) or execute(writes))
+    manager = open_patient(store).medication_manager
+    
+    with store.transaction():
+        manager.set_caregiver_contact("+911")
+        manager.add_medication(Medication("Aspirin", "75mg", TimeSlot.MORNING, "", patient_id="p1"))
+    store._enqueue("INSERT INTO no_such_table VALUES (?)", (1,))
+    manager.add_medication(Medication("Metformin", "500mg", TimeSlot.NIGHT, "", patient_id="p1"))
+    store.close()
+    
+    # The whole batch fails once, then each of its four writes (the transaction is one) goes alone
+    assert attempts == [4, 1, 1, 1, 1]
+    restored = reload(path).get("p1").medication_manager
+    assert restored.caregiver_contact == "+911"
+    assert [med.name for med in restored.medications] == ["Aspirin", "Metformin"]
+
+
+def test_commits_run_in_place_without_monkey_patching():
+    assert storage._offload(threading.get_ident) == threading.get_ident()
+
+
+def test_commits_leave_the_eventlet_hub(path):
+    pytest.importorskip("eventlet")
+    script = f"""
+import eventlet
+eventlet.monkey_patch()
+from eventlet import patcher
+from medmitra.medication import MedicationManager
+from medmitra.storage import SQLiteStore
+
+real_threading = patcher.original("threading")
+hub_thread = real_threading.get_ident()
+store = SQLiteStore({path!r})
+commit_threads = []
+execute = store._execute
+store._execute = lambda writes: commit_threads.append(real_threading.get_ident()) or execute(writes)
+manager = MedicationManager("p1")
+manager.storage = store
+manager.set_caregiver_contact("+911")
+store.close()
+print(len(commit_threads) == 1 and hub_thread not in commit_threads)
+"""
+    result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, timeout=60,
+                            cwd=Path(__file__).resolve().parent.parent)
+    
+    assert result.stdout.strip().endswith("True"), result.stderr
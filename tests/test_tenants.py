@@ -0,0 +1,113 @@
+"""
+Tests for patient tenants: shard routing, wrong-shard replies and per-patient isolation
+"""
+from datetime import datetime
+
+import pytest
+
+from medmitra.medication import Medication, MedicationRecord, TimeSlot
+from medmitra.tenants import TenantRegistry, WrongShardError, shard_for
+
+SHARD_URLS = ["http://{host}:5000", "http://{host}:5001"]
+
+
+def patient_on_shard(shard: int, shard_count: int = 2) -> str:
+    return next(f"patient-{n}" for n in range(1000) if shard_for(f"patient-{n}", shard_count) == shard)
+
+
+def test_shards_are_stable_and_cover_every_worker():
+    ids = [f"patient-{n}" for n in range(400)]
+    shards = [shard_for(patient_id, 4) for patient_id in ids]
+    
+    assert shards == [shard_for(patient_id, 4) for patient_id in ids]
+    assert set(shards) == {0, 1, 2, 3}
+    registries = [TenantRegistry(shard_index=index, shard_count=4) for index in range(4)]
+    assert all(sum(registry.owns(patient_id) for registry in registries) == 1 for patient_id in ids)
+
+
+def test_registry_refuses_patients_of_other_shards():
+    registry = TenantRegistry(shard_index=0, shard_count=2, shard_urls=SHARD_URLS)
+    other = patient_on_shard(1)
+    
+    with pytest.raises(WrongShardError) as error:
+        registry.get(other)
+    
+    assert error.value.shard == 1 and error.value.patient_id == other
+    assert registry.find(other) is None and len(registry) == 0
+    assert registry.shard_url(1, "clinic.local") == "http://clinic.local:5001"
+    assert registry.shard_url(2, "clinic.local") is None
+    with pytest.raises(ValueError):
+        TenantRegistry(shard_index=2, shard_count=2)
+
+
+def test_tenants_are_created_once_and_kept_apart():
+    created = []
+    registry = TenantRegistry(on_create=created.append)
+    first, second = registry.get("p1"), registry.get("p2")
+    aspirin = Medication("Aspirin", "75mg", TimeSlot.MORNING, "", patient_id="p1")
+    
+    first.medication_manager.add_medication(aspirin)
+    first.medication_manager.add_record(MedicationRecord(aspirin, datetime(2026, 10, 18, 8)))
+    first.changes.append("medication_added", {"name": "Aspirin"})
+    
+    assert registry.get("p1") is first and created == [first, second]
+    assert second.medication_manager.medications == () and len(second.medication_manager.records) == 0
+    assert second.changes.seq == 0
+    assert second.voice_handler.medication_manager is second.medication_manager
+
+
+@pytest.fixture
+def sharded(monkeypatch):
+    """The web app as worker 0 of 2"""
+    from medmitra import app as web
+    
+    registry = TenantRegistry(shard_index=0, shard_count=2, on_create=web.on_tenant_created,
+                              shard_urls=SHARD_URLS)
+    monkeypatch.setattr(web, "tenants", registry)
+    return web
+
+
+def test_wrong_shard_requests_get_a_421_with_the_owning_worker(sharded):
+    client = sharded.app.test_client()
+    other = patient_on_shard(1)
+    
+    response = client.get("/api/medications", query_string={"patient_id": other})
+    
+    assert response.status_code == 421
+    assert response.get_json() == {"success": False, "error": f"Patient {other} belongs to shard 1",
+                                    "patient_id": other, "shard": 1, "worker_url": "http://localhost:5001"}
+    assert client.get("/api/medications", query_string={"patient_id": patient_on_shard(0)}).status_code == 200
+    page = client.get("/dashboard", query_string={"patient_id": other})
+    assert page.status_code == 307 and page.location.startswith("http://localhost:5001/dashboard?")
+
+
+def test_wrong_shard_socket_is_refused(sharded):
+    client = sharded.socketio.test_client(sharded.app, query_string=f"patient_id={patient_on_shard(1)}")
+    
+    assert not client.is_connected()
+
+
+def test_reminders_and_caregiver_events_reach_only_their_patient():
+    from medmitra import app as web
+    
+    token = web.caregiver_access.token_for
+    patients = {patient_id: web.socketio.test_client(web.app, query_string=f"patient_id={patient_id}")
+                for patient_id in ("isolation-1", "isolation-2")}
+    dashboards = {patient_id: web.socketio.test_client(
+        web.app, query_string=f"patient_id={patient_id}&role=caregiver&token={token(patient_id)}")
+        for patient_id in ("isolation-1", "isolation-2")}
+    for client in (*patients.values(), *dashboards.values()):
+        client.get_received()
+    medication = Medication("Aspirin", "75mg", TimeSlot.MORNING, "", patient_id="isolation-1")
+    
+    web.on_reminder_due(medication)
+    web.tenants.get("isolation-1").medication_manager.add_medication(medication)
+    
+    def events(client) -> list:
+        return [message["name"] for message in client.get_received()]
+    
+    assert events(patients["isolation-1"]) == ["medication_reminder"]
+    assert events(patients["isolation-2"]) == []
+    assert events(dashboards["isolation-1"]) == ["state_delta"]
+    assert events(dashboards["isolation-2"]) == []
+    assert web.tenants.get("isolation-2").medication_manager.medications == ()
@@ -0,0 +1,32 @@
+"""
+Tests for patient timezones and the setup endpoint that sets them
+"""
+from datetime import datetime
+
+from medmitra.timezones import to_local, to_utc
+
+
+def test_local_and_utc_round_trip():
+    local = datetime(2026, 10, 18, 8, 0)
+    
+    assert to_utc(local, "Asia/Kolkata").utcoffset().total_seconds() == 0
+    assert to_utc(local, "Asia/Kolkata").replace(tzinfo=None) == datetime(2026, 10, 18, 2, 30)
+    assert to_local(to_utc(local, "Asia/Kolkata"), "Asia/Kolkata") == local
+
+
+def test_timezone_only_setup_keeps_the_name_and_caregiver():
+    from medmitra import app as web
+    
+    client = web.app.test_client()
+    query = {"patient_id": "setup-test"}
+    assert client.post("/api/setup", query_string=query,
+                       json={"user_name": "Mr. Sharma", "caregiver_contact": "+91-9876543210"}).status_code == 200
+    
+    assert client.post("/api/setup", query_string=query, json={"timezone": "Asia/Kolkata"}).status_code == 200
+    
+    manager = web.tenants.get("setup-test").medication_manager
+    assert manager.timezone == "Asia/Kolkata"
+    assert manager.user_name == "Mr. Sharma"
+    assert manager.caregiver_contact == "+91-9876543210"
+    assert client.post("/api/setup", query_string=query, json={"timezone": "Mars/Olympus"}).status_code == 400
+    assert manager.timezone == "Asia/Kolkata"